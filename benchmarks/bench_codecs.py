@@ -0,0 +1,104 @@
+"""Сравнение форматов кадров: JSON против MessagePack.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_codecs
+    python -m benchmarks.bench_codecs --messages 100 500 --users 2000
+
+Полезная нагрузка - ответы get_messages (история чата с русским текстом
+разной длины и временем в datetime) и get_users. Для каждого формата
+печатается размер тела кадра и время кодирования/разбора одного ответа,
+а также размер после сжатия (zlib/zstd) и время сжатия/распаковки.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from shared.protocols import CODECS, COMPRESSIONS, Compression
+
+WORDS = (
+    'привет коллеги отчёт готов посмотрите пожалуйста встреча переносится на завтра '
+    'созвон в десять сборка упала исправил тесты проходят задача закрыта клиент '
+    'ждёт ответа согласовано с руководителем документ в общей папке спасибо ok'
+).split()
+
+
+def make_history(count, seed=1):
+    rnd = random.Random(seed)
+    users = [(user_id, f'user{user_id}') for user_id in range(1, 21)]
+    started = datetime(2025, 3, 1, 9, 0)
+    messages = []
+    for message_id in range(1, count + 1):
+        user_id, username = rnd.choice(users)
+        started += timedelta(seconds=rnd.expovariate(1 / 90))
+        # Длины сообщений: в основном короткие реплики, изредка длинные
+        length = min(200, int(rnd.lognormvariate(1.8, 0.9)) + 1)
+        messages.append({
+            'id': message_id,
+            'user_id': user_id,
+            'username': username,
+            'text': ' '.join(rnd.choice(WORDS) for _ in range(length)).capitalize(),
+            'timestamp': started,
+            'is_system': rnd.random() < 0.02,
+        })
+    return {'status': 'success', 'messages': messages, 'has_more': True}
+
+
+def make_users(count, seed=1):
+    rnd = random.Random(seed)
+    return {
+        'status': 'success',
+        'users': [{
+            'id': user_id,
+            'username': f'user{user_id}',
+            'name': f'Сотрудник {user_id}',
+            'online': rnd.random() < 0.3,
+        } for user_id in range(1, count + 1)],
+        'timestamp': datetime(2025, 3, 1, 9, 0),
+    }
+
+
+def measure(function, argument, min_time=0.2):
+    # Повторяем, пока не наберётся min_time, и берём среднее на вызов
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        function(argument)
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, nargs='+', default=[100, 500, 5000])
+    parser.add_argument('--users', type=int, nargs='+', default=[200, 2000])
+    args = parser.parse_args()
+
+    payloads = [(f'get_messages x{count}', make_history(count)) for count in args.messages]
+    payloads += [(f'get_users x{count}', make_users(count)) for count in args.users]
+    if 'msgpack' not in CODECS:
+        print("msgpack не установлен - сравнивать не с чем (pip install msgpack)")
+
+    print(f"{'payload':>20} {'codec':>13} {'bytes':>10} {'encode, ms':>11} {'decode, ms':>11}")
+    for title, payload in payloads:
+        for codec in CODECS.values():
+            data = codec.encode(payload)
+            view = memoryview(data)
+            encode_time = measure(codec.encode, payload)
+            decode_time = measure(codec.decode, view)
+            print(f"{title:>20} {codec.name:>13} {len(data):>10} "
+                  f"{encode_time * 1000:>11.3f} {decode_time * 1000:>11.3f}")
+            for name in COMPRESSIONS:
+                compression = Compression(name, threshold=0)
+                compressed = compression.compress(data)
+                compress_time = measure(compression.compress, data)
+                decompress_time = measure(compression.decompress, compressed)
+                label = f"{codec.name}+{name}"
+                print(f"{title:>20} {label:>13} {len(compressed):>10} "
+                      f"{compress_time * 1000:>11.3f} {decompress_time * 1000:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Сравнение чтения кадров: прежние циклы recv против FrameReader.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_framing
+    python -m benchmarks.bench_framing --sizes 1024 10485760 --frames 20
+
+Для каждого размера кадра замеряется пропускная способность чтения
+(МБ/с) и отдельным проходом - пиковый объём памяти, выделенной при
+чтении (tracemalloc). С --decode в замер входит и разбор JSON.
+"""
+import argparse
+import socket
+import threading
+import time
+import tracemalloc
+
+from shared.protocols import FrameReader, decode_payload, encode_frame
+
+DEFAULT_SIZES = [1024, 64 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+
+
+def read_server_loop(conn):
+    # Прежний цикл Server.handle_client: received_data += chunk
+    header = conn.recv(4)
+    data_size = int.from_bytes(header, byteorder='big')
+    received_data = b''
+    while len(received_data) < data_size:
+        chunk = conn.recv(min(data_size - len(received_data), 4096))
+        if not chunk:
+            raise ConnectionError("Connection broken")
+        received_data += chunk
+    return received_data
+
+
+def read_client_loop(conn):
+    # Прежний цикл ClientCommunication.send_message: список кусков + join
+    header = conn.recv(4)
+    response_size = int.from_bytes(header, byteorder='big')
+    received = 0
+    chunks = []
+    while received < response_size:
+        chunk = conn.recv(min(response_size - received, 4096))
+        if not chunk:
+            raise ConnectionError("Incomplete response")
+        chunks.append(chunk)
+        received += len(chunk)
+    return b''.join(chunks)
+
+
+def make_frame(size):
+    # Ответ get_messages с сообщениями на кириллице, примерно заданного размера
+    message = {
+        'id': 1, 'user_id': 7, 'username': 'ivanov',
+        'text': 'Привет, коллеги! Отчёт готов, посмотрите, пожалуйста.',
+        'timestamp': '2025-08-06T11:07:27.759000', 'is_system': False
+    }
+    message_size = len(encode_frame(message))
+    payload = {'status': 'success', 'messages': [message] * max(1, size // message_size), 'has_more': False}
+    return encode_frame(payload)
+
+
+def run_case(make_reader, frame, frames, decode, trace=False):
+    left, right = socket.socketpair()
+    read_one = make_reader(left, len(frame))
+
+    def sender():
+        for _ in range(frames):
+            right.sendall(frame)
+
+    thread = threading.Thread(target=sender, daemon=True)
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    thread.start()
+    for _ in range(frames):
+        data = read_one()
+        if decode:
+            decode_payload(data)
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    thread.join()
+    left.close()
+    right.close()
+    megabytes = len(frame) * frames / (1024 * 1024)
+    return megabytes / elapsed, peak
+
+
+CASES = [
+    ('server +=', lambda conn, size: lambda: read_server_loop(conn)),
+    ('client join', lambda conn, size: lambda: read_client_loop(conn)),
+    ('FrameReader', lambda conn, size: FrameReader(conn, max_frame_size=size).read_frame),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--frames', type=int, default=0,
+                        help='кадров на замер (по умолчанию ~256 МБ на размер, не меньше 5)')
+    parser.add_argument('--decode', action='store_true', help='включить разбор JSON в замер')
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'reader':>14} {'MB/s':>10} {'peak alloc':>12}")
+    for size in args.sizes:
+        frame = make_frame(size)
+        frames = args.frames or max(5, min(50000, 256 * 1024 * 1024 // len(frame)))
+        for name, make_reader in CASES:
+            throughput, _ = run_case(make_reader, frame, frames, args.decode)
+            _, peak = run_case(make_reader, frame, min(frames, 5), args.decode, trace=True)
+            print(f"{size:>10} {name:>14} {throughput:>10.1f} {peak / 1024:>10.0f}KB")
+
+
+if __name__ == '__main__':
+    main()
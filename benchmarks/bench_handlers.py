@@ -0,0 +1,261 @@
+"""Микробенчмарки обработчиков сервера на сгенерированных БД разного размера.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_handlers                  # сравнить с базовой линией
+    python -m benchmarks.bench_handlers --save           # записать новую базовую линию
+    python -m benchmarks.bench_handlers --sizes small --threshold 2
+
+Для каждого размера из benchmarks.dataset.PRESETS БД генерируется один раз
+(кэш в --data-dir) и копируется перед прогоном: запись сообщений и чатов
+её меняет. Обработчики вызываются без сети, через Server.process_message,
+в отдельном процессе на каждую БД - движок БД создаётся при импорте
+server.database по MESSENGER_DATABASE_URL.
+
+По каждому обработчику замеряются задержка (p50/p95), число SQL-запросов
+на вызов и пиковый объём памяти, выделенной за вызов (tracemalloc).
+Результат сравнивается с benchmarks/baselines/handlers.json; код возврата 1,
+если задержка (лучший из трёх раундов) или память выросли больше чем в
+--threshold раз или запросов стало больше.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'handlers.json')
+DEFAULT_SIZES = ['small', 'medium']
+SEED = 1
+ROUNDS = 3
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def make_cases(engine, rnd):
+    """Аргументы вызовов из содержимого БД: {имя обработчика: фабрика сообщения}."""
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        user_ids = [row[0] for row in conn.execute(text("SELECT id FROM users"))]
+        busy_chats = [row[0] for row in conn.execute(text(
+            "SELECT chat_id FROM messages GROUP BY chat_id HAVING count(*) >= 20"))]
+        groups = [row[0] for row in conn.execute(text("SELECT id FROM chats WHERE is_group"))]
+        members = {}
+        for chat_id, user_id in conn.execute(text("SELECT chat_id, user_id FROM chat_participants")):
+            members.setdefault(chat_id, []).append(user_id)
+    chat_ids = busy_chats or list(members)
+
+    def user():
+        user_id = rnd.choice(user_ids)
+        return user_id, f'user{user_id}'
+
+    def login():
+        _, username = user()
+        return {'type': 'login', 'username': username, 'password': 'password'}
+
+    def get_chats():
+        user_id, username = user()
+        return {'type': 'get_chats', 'user_id': user_id, 'username': username}
+
+    def get_messages():
+        return {'type': 'get_messages', 'chat_id': rnd.choice(chat_ids), 'limit': 100}
+
+    def send_message():
+        chat_id = rnd.choice(chat_ids)
+        return {'type': 'send_message', 'chat_id': chat_id, 'user_id': rnd.choice(members[chat_id]),
+                'text': 'Сообщение из замера обработчиков'}
+
+    def create_chat():
+        first, second = rnd.sample(user_ids, 2)
+        return {'type': 'create_chat', 'user_id': first, 'participant_ids': [first, second]}
+
+    def get_participants():
+        return {'type': 'get_chat_participants', 'chat_id': rnd.choice(groups or chat_ids)}
+
+    return {
+        'login_user': login,
+        'get_user_chats': get_chats,
+        'get_chat_messages': get_messages,
+        'get_all_users': lambda: {'type': 'get_users'},
+        'get_chat_participants': get_participants,
+        'save_message': send_message,
+        'create_chat': create_chat,
+    }
+
+
+def run_worker(calls, seed):
+    """Выполняется в дочернем процессе: MESSENGER_DATABASE_URL уже указывает на копию БД."""
+    from sqlalchemy import event
+    from server.database import engine
+    from server.server import Server
+
+    server = Server('127.0.0.1', 0)
+    rnd = random.Random(seed)
+    queries = [0]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        queries[0] += 1
+
+    results = {}
+    for name, make_message in make_cases(engine, rnd).items():
+        for _ in range(10):  # прогрев: кэши, пул соединений
+            server.process_message(make_message())
+
+        # Несколько раундов, у каждого свои аргументы; берётся лучший раунд -
+        # так меньше влияют помехи от других процессов машины
+        rounds = []
+        before = queries[0]
+        for _ in range(ROUNDS):
+            messages = [make_message() for _ in range(calls)]
+            latencies = []
+            for message in messages:
+                started = time.perf_counter()
+                response = server.process_message(message)
+                latencies.append(time.perf_counter() - started)
+                if response.get('status') != 'success':
+                    raise RuntimeError(f"{name}: {response}")
+            rounds.append(latencies)
+        query_count = (queries[0] - before) / (calls * ROUNDS)
+
+        peaks = []
+        tracemalloc.start()
+        for message in messages[:min(calls, 50)]:
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            server.process_message(message)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+
+        results[name] = {
+            'p50_ms': min(percentile(latencies, 0.5) for latencies in rounds) * 1000,
+            'p95_ms': min(percentile(latencies, 0.95) for latencies in rounds) * 1000,
+            'queries': query_count,
+            'peak_kb': sum(peaks) / len(peaks) / 1024,
+        }
+    return results
+
+
+def dataset_path(data_dir, size):
+    from benchmarks.dataset import PRESETS, generate
+
+    path = os.path.join(data_dir, f'{size}-seed{SEED}.db')
+    if not os.path.exists(path):
+        print(f"Генерация БД {size} в {path}...", flush=True)
+        partial = path + '.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        generate(partial, seed=SEED, **PRESETS[size])
+        os.replace(partial, path)
+    return path
+
+
+def measure(size, data_dir, calls):
+    workdir = tempfile.mkdtemp(prefix='messenger-handlers-')
+    try:
+        database = os.path.join(workdir, 'messenger.db')
+        shutil.copy(dataset_path(data_dir, size), database)
+        env = dict(os.environ)
+        env.update({
+            'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')])),
+            'MESSENGER_DATABASE_URL': f'sqlite:///{database}',
+            'MESSENGER_METRICS_PORT': '0',
+            # Фоновые потоки не должны добавлять запросы в замер
+            'MESSENGER_DB_MAINTENANCE_INTERVAL': '0',
+            'MESSENGER_PRESENCE_FLUSH_INTERVAL': '3600',
+        })
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_handlers', '--worker', '--calls', str(calls)],
+            cwd=workdir, env=env, check=True, stdout=subprocess.PIPE).stdout
+        return json.loads(output.decode().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(size, results, baseline, threshold, min_delta_ms):
+    """Печатает таблицу и возвращает список регрессий."""
+    regressions = []
+    print(f"\n{size}")
+    print(f"{'handler':>22} {'p50, ms':>9} {'p95, ms':>9} {'queries':>8} {'peak, KB':>9}   vs baseline")
+    for name, row in results.items():
+        base = baseline.get(name)
+        notes = []
+        if base:
+            if row['p50_ms'] > base['p50_ms'] * threshold and row['p50_ms'] - base['p50_ms'] > min_delta_ms:
+                notes.append(f"p50 x{row['p50_ms'] / base['p50_ms']:.1f}")
+            if row['queries'] > base['queries'] + 0.5:
+                notes.append(f"queries {base['queries']:g} -> {row['queries']:g}")
+            if row['peak_kb'] > base['peak_kb'] * threshold:
+                notes.append(f"memory x{row['peak_kb'] / base['peak_kb']:.1f}")
+            regressions.extend(f'{size}/{name}: {note}' for note in notes)
+            status = 'РЕГРЕССИЯ ' + ', '.join(notes) if notes else f"p50 x{row['p50_ms'] / base['p50_ms']:.2f}"
+        else:
+            status = 'нет в базовой линии'
+        print(f"{name:>22} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['queries']:>8.2f} "
+              f"{row['peak_kb']:>9.1f}   {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--calls', type=int, default=200, help='вызовов каждого обработчика')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='во сколько раз может вырасти задержка или память')
+    parser.add_argument('--min-delta-ms', type=float, default=0.25,
+                        help='меньший прирост задержки не считается регрессией (шум таймера)')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='записать результаты как базовую линию')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'messenger-bench'))
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # Последняя строка вывода - результат для родительского процесса
+        print(json.dumps(run_worker(args.calls, SEED)))
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {size: measure(size, args.data_dir, args.calls) for size in args.sizes}
+    regressions = []
+    for size, rows in results.items():
+        regressions += compare(size, rows, baseline.get('sizes', {}).get(size, {}),
+                               args.threshold, args.min_delta_ms)
+
+    if args.save:
+        import sqlalchemy
+        sizes = dict(baseline.get('sizes', {}), **results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'sqlalchemy': sqlalchemy.__version__,
+                'machine': platform.machine(),
+                'calls': args.calls,
+                'sizes': sizes,
+            }, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"\nБазовая линия записана: {args.baseline}")
+    elif regressions:
+        print(f"\nРегрессии ({len(regressions)}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
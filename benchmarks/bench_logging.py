@@ -0,0 +1,148 @@
+"""Задержка запросов к серверу при разных настройках журнала.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_logging
+    python -m benchmarks.bench_logging --requests 5000 --clients 8
+
+Поднимает сервер (движок threads) на временной БД в этом же процессе и
+гоняет get_messages/get_chats из нескольких клиентских потоков. Режимы:
+    off            - журнал выключен;
+    sync-debug     - прежняя схема: FileHandler в потоке запроса, DEBUG;
+    queue-info     - очередь + фоновая запись, уровень INFO (по умолчанию);
+    queue-debug    - очередь, DEBUG без выборки;
+    queue-sampled  - очередь, DEBUG с выборкой 10%.
+"""
+import argparse
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class BenchClient:
+    """Простой синхронный клиент протокола (JSON, без рукопожатия)."""
+
+    def __init__(self, port):
+        from shared.protocols import FrameReader, encode_frame
+        self.encode_frame = encode_frame
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.reader = FrameReader(self.sock)
+
+    def request(self, message):
+        self.sock.sendall(self.encode_frame(message))
+        return self.reader.read_message()
+
+    def close(self):
+        self.sock.close()
+
+
+def seed(port, messages):
+    client = BenchClient(port)
+    for username in ('bench1', 'bench2'):
+        client.request({'type': 'register', 'username': username, 'password': 'bench'})
+    user_id = client.request({'type': 'login', 'username': 'bench1', 'password': 'bench'})['user_id']
+    chat = client.request({'type': 'create_chat', 'user_id': user_id, 'participant_ids': [user_id, user_id + 1]})
+    for number in range(messages):
+        client.request({'type': 'send_message', 'user_id': user_id, 'chat_id': chat['chat_id'],
+                        'text': f'Сообщение для замера журнала номер {number}'})
+    client.close()
+    return user_id, chat['chat_id']
+
+
+def run_clients(port, user_id, chat_id, requests, clients):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        client = BenchClient(port)
+        local = []
+        for number in range(count):
+            if number % 2:
+                message = {'type': 'get_chats', 'user_id': user_id, 'username': 'bench1'}
+            else:
+                message = {'type': 'get_messages', 'chat_id': chat_id, 'limit': 50}
+            started = time.perf_counter()
+            client.request(message)
+            local.append(time.perf_counter() - started)
+        client.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(requests // clients,)) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def configure(mode, log_file):
+    """Настраивает журнал для режима; возвращает функцию остановки."""
+    from shared.logconfig import setup_logging, stop_logging
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    if mode == 'off':
+        root.setLevel(logging.CRITICAL)
+        return lambda: None
+    if mode == 'sync-debug':
+        handler = logging.FileHandler(log_file, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+        return lambda: None
+
+    level = 'INFO' if mode == 'queue-info' else 'DEBUG'
+    sample = 0.1 if mode == 'queue-sampled' else 1.0
+    listener = setup_logging(log_file, level=level, levels={}, fmt='json', debug_sample=sample)
+    return lambda: stop_logging(listener)
+
+
+MODES = ['off', 'sync-debug', 'queue-info', 'queue-debug', 'queue-sampled']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=200, help='сообщений в тестовом чате')
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='messenger-bench-')
+    # БД и настройки читаются при импорте server.config - задаём их до импорта
+    os.environ['MESSENGER_DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['MESSENGER_METRICS_PORT'] = '0'
+    from server.server import Server
+
+    server = Server('127.0.0.1', 0)
+    port = server.server.getsockname()[1]
+    threading.Thread(target=server.start, daemon=True).start()
+    user_id, chat_id = seed(port, args.messages)
+
+    print(f"{'mode':>14} {'req/s':>8} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9} {'log, KB':>9}")
+    for mode in args.modes:
+        log_file = os.path.join(workdir, f'{mode}.log')
+        stop = configure(mode, log_file)
+        run_clients(port, user_id, chat_id, 200, args.clients)  # прогрев
+        latencies, elapsed = run_clients(port, user_id, chat_id, args.requests, args.clients)
+        stop()
+        size = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+        print(f"{mode:>14} {len(latencies) / elapsed:>8.0f} {percentile(latencies, 0.5) * 1000:>9.3f} "
+              f"{percentile(latencies, 0.95) * 1000:>9.3f} {percentile(latencies, 0.99) * 1000:>9.3f} "
+              f"{size / 1024:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Проверка планов SQL-запросов обработчиков: горячие пути без полного просмотра.
+
+Запуск из корня проекта:
+    python -m benchmarks.check_query_plans
+    python -m benchmarks.check_query_plans --database big.db --verbose
+
+Обработчики вызываются через Server.process_message на копии
+сгенерированной БД (по умолчанию - размер small из benchmarks.dataset, с
+ANALYZE). Все SQL-запросы, которые они выполняют, перехватываются событием
+before_cursor_execute, для каждого выполняется EXPLAIN QUERY PLAN с теми же
+параметрами. Если в плане есть SCAN таблицы или индекса (полный просмотр
+вместо SEARCH по индексу), проверка завершается с кодом 1.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+# Строки плана, которые не означают полного просмотра данных
+ALLOWED_SCANS = ('SCAN CONSTANT ROW',)
+
+
+def make_cases(engine, rnd):
+    """Горячие пути: (название, сообщение) с аргументами из содержимого БД."""
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        user_ids = [row[0] for row in conn.execute(text("SELECT id FROM users"))]
+        chat_id, first_id, last_id = conn.execute(text(
+            "SELECT chat_id, min(id), max(id) FROM messages GROUP BY chat_id ORDER BY count(*) DESC LIMIT 1"
+        )).one()
+        group_id = conn.execute(text("SELECT id FROM chats WHERE is_group LIMIT 1")).scalar()
+        chat_members = [row[0] for row in conn.execute(
+            text("SELECT user_id FROM chat_participants WHERE chat_id = :chat_id"), {'chat_id': chat_id})]
+        group_member = conn.execute(text(
+            "SELECT user_id FROM chat_participants WHERE chat_id = :chat_id LIMIT 1"), {'chat_id': group_id}).scalar()
+    user_id = rnd.choice(user_ids)
+    first, second = rnd.sample(user_ids, 2)
+    middle_id = (first_id + last_id) // 2
+
+    return [
+        ('поиск пользователя по логину', {'type': 'login', 'username': f'user{user_id}', 'password': 'password'}),
+        ('регистрация', {'type': 'register', 'username': f'plan_check_{rnd.random()}', 'password': 'password'}),
+        ('список чатов', {'type': 'get_chats', 'user_id': user_id, 'username': f'user{user_id}'}),
+        ('последняя страница истории', {'type': 'get_messages', 'chat_id': chat_id, 'limit': 100}),
+        ('страница старых сообщений', {'type': 'get_messages', 'chat_id': chat_id, 'before_id': middle_id}),
+        ('догрузка новых сообщений', {'type': 'get_messages', 'chat_id': chat_id, 'after_id': middle_id}),
+        ('отправка сообщения', {'type': 'send_message', 'chat_id': chat_id, 'user_id': chat_members[0],
+                                'text': 'Проверка плана запроса'}),
+        ('поиск личного чата', {'type': 'create_chat', 'user_id': first, 'participant_ids': [first, second]}),
+        ('участники группы', {'type': 'get_chat_participants', 'chat_id': group_id}),
+        ('проверка членства', {'type': 'update_chat_name', 'chat_id': group_id, 'user_id': group_member,
+                               'new_name': 'Проверка плана'}),
+    ]
+
+
+def explain(raw_connection, statement, parameters):
+    cursor = raw_connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def is_full_scan(detail):
+    return detail.startswith('SCAN') and not detail.startswith(ALLOWED_SCANS)
+
+
+def check(verbose=False, seed=1):
+    """Выполняется после того, как MESSENGER_DATABASE_URL указан на копию БД."""
+    from sqlalchemy import event
+    from server.database import engine
+    from server.server import Server
+
+    server = Server('127.0.0.1', 0)
+    captured = []
+    current = [None]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if current[0] is not None and not statement.lstrip().upper().startswith(('PRAGMA', 'EXPLAIN')):
+            if executemany:
+                parameters = parameters[0] if parameters else ()
+            captured.append((current[0], statement, parameters))
+
+    for name, message in make_cases(engine, random.Random(seed)):
+        current[0] = name
+        response = server.process_message(message)
+        if response.get('status') != 'success':
+            raise RuntimeError(f"{name}: {response}")
+    current[0] = None
+    server.message_writer.close()
+
+    violations = []
+    seen = set()
+    raw_connection = engine.raw_connection()
+    try:
+        for name, statement, parameters in captured:
+            if (name, statement) in seen:
+                continue
+            seen.add((name, statement))
+            plan = explain(raw_connection, statement, parameters)
+            scans = [detail for detail in plan if is_full_scan(detail)]
+            if scans:
+                violations.append((name, statement, scans))
+            if verbose or scans:
+                print(f"[{'SCAN' if scans else 'ok'}] {name}: {' '.join(statement.split())}")
+                for detail in plan:
+                    print(f"        {detail}")
+    finally:
+        raw_connection.close()
+
+    print(f"Проверено запросов: {len(seen)} в {len({name for name, _ in seen})} сценариях, "
+          f"полных просмотров: {len(violations)}")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='готовая БД (по умолчанию - сгенерированная small)')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'messenger-bench'))
+    parser.add_argument('--verbose', action='store_true', help='печатать планы всех запросов')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='messenger-plans-')
+    try:
+        # Проверка пишет в БД - работаем с копией. URL читается при импорте
+        # server.config, поэтому задаётся до импорта модулей сервера
+        copy = os.path.join(workdir, 'messenger.db')
+        os.environ['MESSENGER_DATABASE_URL'] = f'sqlite:///{copy}'
+        os.environ['MESSENGER_METRICS_PORT'] = '0'
+        os.environ['MESSENGER_DB_MAINTENANCE_INTERVAL'] = '0'
+        database = args.database
+        if not database:
+            from benchmarks.bench_handlers import dataset_path
+            os.makedirs(args.data_dir, exist_ok=True)
+            database = dataset_path(args.data_dir, 'small')
+        shutil.copy(database, copy)
+        violations = check(args.verbose)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Генератор синтетической БД мессенджера заданного размера.
+
+Запуск из корня проекта:
+    python -m benchmarks.dataset big.db --size medium
+    python -m benchmarks.dataset big.db --users 20000 --messages 20000000 --seed 7
+
+Заполняет схему server/models.py пачками через Core insert (executemany):
+пользователи, личные чаты, группы с перекошенным размером (много
+маленьких, единицы на сотни человек), сообщения за заданное число дней.
+Активность чатов и пользователей распределена по Парето, сообщения идут
+в рабочие часы будних дней сериями в одном чате, длина текста -
+логнормальная. При одном и том же seed получается одна и та же БД.
+"""
+import argparse
+import bisect
+import hashlib
+import itertools
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import column, table, text
+
+from benchmarks.bench_codecs import WORDS
+from server.database import create_db_engine
+from server.models import Base, Chat, ChatParticipant, DirectChat, Message, User
+
+# Готовые размеры; параметры командной строки переопределяют любой из них
+PRESETS = {
+    'small': {'users': 200, 'direct_chats': 500, 'groups': 40, 'messages': 20_000},
+    'medium': {'users': 2_000, 'direct_chats': 10_000, 'groups': 300, 'messages': 1_000_000},
+    'large': {'users': 20_000, 'direct_chats': 100_000, 'groups': 3_000, 'messages': 20_000_000},
+}
+
+START = datetime(2024, 1, 8)  # понедельник; время данных не зависит от даты запуска
+PASSWORD = 'password'  # у всех сгенерированных пользователей
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Сергей', 'Ольга', 'Дмитрий', 'Елена', 'Алексей',
+               'Наталья', 'Андрей', 'Татьяна', 'Павел', 'Юлия', 'Михаил', 'Ирина', 'Никита')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов',
+              'Михайлов', 'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев')
+# Доля сообщений по часам суток: рабочий день с провалом на обед
+HOUR_WEIGHTS = (0, 0, 0, 0, 0, 0, 0.2, 1, 4, 9, 10, 10, 6, 7, 10, 10, 9, 6, 3, 2, 1.5, 1, 0.5, 0.2)
+TEXT_POOL_SIZE = 8192
+CONTINUE_CONVERSATION = 0.7  # вероятность, что следующее сообщение - в том же чате
+
+
+def _weighted_sample(rnd, population, cum_weights, size):
+    """size разных элементов с вероятностью по весам."""
+    chosen = set()
+    while len(chosen) < size:
+        chosen.update(rnd.choices(population, cum_weights=cum_weights, k=size - len(chosen)))
+    return list(chosen)
+
+
+def _insert(conn, target, rows):
+    if rows:
+        conn.execute(target.insert(), rows)
+
+
+def _make_texts(rnd, count):
+    texts = []
+    for _ in range(count):
+        # В основном короткие реплики, изредка длинные
+        length = min(200, int(rnd.lognormvariate(1.8, 0.9)) + 1)
+        texts.append(' '.join(rnd.choice(WORDS) for _ in range(length)).capitalize())
+    return texts
+
+
+def _day_counts(days, messages):
+    """Сколько сообщений приходится на каждый день: в выходные почти
+    ничего, со временем переписки становится больше (компания растёт)."""
+    weights = []
+    for day in range(days):
+        weekend = (START + timedelta(days=day)).weekday() >= 5
+        weights.append((0.08 if weekend else 1.0) * (1 + day / max(1, days)))
+    total = sum(weights)
+    counts, assigned, acc = [], 0, 0.0
+    for weight in weights:
+        acc += weight * messages / total
+        counts.append(round(acc) - assigned)
+        assigned += counts[-1]
+    return counts
+
+
+def generate(path, users, direct_chats, groups, messages, days=365, seed=1, batch_size=50_000,
+             progress=None):
+    """Создаёт БД в path (файл не должен существовать) и возвращает сводку."""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    # На время загрузки журнал и fsync не нужны: при сбое файл всё равно пересоздаётся
+    engine = create_db_engine(f'sqlite:///{path}', journal_mode='OFF', synchronous='OFF', pool_size=1)
+    Base.metadata.create_all(bind=engine)
+    end = START + timedelta(days=days)
+    password_hash = hashlib.sha256(PASSWORD.encode()).hexdigest()
+
+    # Пользователи; вес - насколько человек активен в переписке
+    user_ids = list(range(1, users + 1))
+    user_cum = list(itertools.accumulate(rnd.paretovariate(1.5) for _ in user_ids))
+    with engine.begin() as conn:
+        _insert(conn, User.__table__, [{
+            'id': user_id,
+            'username': f'user{user_id}',
+            'password_hash': password_hash,
+            'name': f'{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}',
+            'online': False,
+            'last_seen': end - timedelta(seconds=rnd.randrange(86400 * 7)),
+        } for user_id in user_ids])
+
+    # Личные чаты: пары активных пользователей встречаются чаще
+    pairs = set()
+    limit = min(direct_chats, users * (users - 1) // 2)
+    while len(pairs) < limit:
+        low, high = sorted(rnd.choices(user_ids, cum_weights=user_cum, k=2))
+        if low != high:
+            pairs.add((low, high))
+    pairs = sorted(pairs)
+
+    # Группы: размер по Парето - много маленьких, единицы почти на всех
+    group_sizes = [min(users, max(3, int(3 * rnd.paretovariate(0.9)))) for _ in range(groups)]
+
+    chat_members = []
+    chats, participants, directs = [], [], []
+    for chat_id, (low, high) in enumerate(pairs, start=1):
+        chats.append({'id': chat_id, 'name': f'user{low} & user{high}', 'is_group': False,
+                      'created_at': START - timedelta(days=rnd.uniform(0, 365))})
+        directs.append({'user_low_id': low, 'user_high_id': high, 'chat_id': chat_id})
+        chat_members.append((low, high))
+    for number, size in enumerate(group_sizes, start=1):
+        chat_id = len(chats) + 1
+        chats.append({'id': chat_id, 'name': f'Группа {number}', 'is_group': True,
+                      'created_at': START - timedelta(days=rnd.uniform(0, 365))})
+        chat_members.append(tuple(sorted(_weighted_sample(rnd, user_ids, user_cum, size))))
+    for chat_id, members in enumerate(chat_members, start=1):
+        participants.extend({'user_id': user_id, 'chat_id': chat_id} for user_id in members)
+
+    with engine.begin() as conn:
+        for target, rows in ((Chat.__table__, chats), (DirectChat.__table__, directs),
+                             (ChatParticipant.__table__, participants)):
+            for offset in range(0, len(rows), batch_size):
+                _insert(conn, target, rows[offset:offset + batch_size])
+    if progress:
+        progress(f"{users} пользователей, {len(pairs)} личных чатов, {groups} групп, "
+                 f"{len(participants)} участников")
+
+    # Сообщения. Индекс истории строится после загрузки - так в разы быстрее
+    chat_ids = list(range(1, len(chats) + 1))
+    chat_cum = list(itertools.accumulate(
+        rnd.paretovariate(1.2) * (1 + math.log(len(members))) for members in chat_members))
+    hour_cum = list(itertools.accumulate(HOUR_WEIGHTS))
+    texts = _make_texts(rnd, TEXT_POOL_SIZE)
+    history_index = next(index for index in Message.__table__.indexes if index.name == 'ix_messages_chat_id_id')
+    with engine.begin() as conn:
+        history_index.drop(conn)
+
+    # Та же таблица без типов столбцов: время уже строкой в формате, в котором
+    # его хранит SQLAlchemy, и на каждую строку не вызываются преобразования
+    messages_table = table('messages', *(column(name) for name in Message.__table__.columns.keys()))
+    random_value = rnd.random
+    message_id = 0
+    chat_id = None
+    rows = []
+    with engine.begin() as conn:
+        for day, count in enumerate(_day_counts(days, messages)):
+            day_prefix = (START + timedelta(days=day)).strftime('%Y-%m-%d ')
+            hours = rnd.choices(range(24), cum_weights=hour_cum, k=count)
+            seconds = sorted(int((hour + random_value()) * 3_600_000_000) for hour in hours)
+            for offset in seconds:
+                if chat_id is None or random_value() >= CONTINUE_CONVERSATION:
+                    chat_id = chat_ids[bisect.bisect(chat_cum, random_value() * chat_cum[-1])]
+                members = chat_members[chat_id - 1]
+                message_id += 1
+                offset, microseconds = divmod(offset, 1_000_000)
+                minutes, second = divmod(offset, 60)
+                rows.append({
+                    'id': message_id,
+                    'user_id': members[int(random_value() * len(members))],
+                    'chat_id': chat_id,
+                    'text': texts[int(random_value() * TEXT_POOL_SIZE)],
+                    'timestamp': f'{day_prefix}{minutes // 60:02d}:{minutes % 60:02d}:{second:02d}.{microseconds:06d}',
+                    'is_system': 0,
+                })
+                if len(rows) >= batch_size:
+                    _insert(conn, messages_table, rows)
+                    rows = []
+                    if progress and message_id % (batch_size * 20) == 0:
+                        rate = message_id / (time.perf_counter() - started)
+                        progress(f"{message_id} сообщений ({rate:.0f} в секунду)")
+        _insert(conn, messages_table, rows)
+
+    with engine.begin() as conn:
+        history_index.create(conn)
+        # Статистика для планировщика; analysis_limit - выборочно, без полного прохода
+        conn.execute(text("PRAGMA analysis_limit = 1000"))
+        conn.execute(text("ANALYZE"))
+    engine.dispose()
+
+    return {
+        'path': path,
+        'seed': seed,
+        'users': users,
+        'direct_chats': len(pairs),
+        'groups': groups,
+        'largest_group': max(group_sizes, default=0),
+        'participants': len(participants),
+        'messages': message_id,
+        'seconds': time.perf_counter() - started,
+        'size_mb': os.path.getsize(path) / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', help='файл новой БД')
+    parser.add_argument('--size', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--direct-chats', type=int)
+    parser.add_argument('--groups', type=int)
+    parser.add_argument('--messages', type=int)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    parser.add_argument('--force', action='store_true', help='перезаписать существующий файл')
+    args = parser.parse_args()
+
+    params = dict(PRESETS[args.size])
+    for key in params:
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    if args.force:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(args.output + suffix):
+                os.remove(args.output + suffix)
+
+    summary = generate(args.output, days=args.days, seed=args.seed, batch_size=args.batch_size,
+                       progress=print, **params)
+    print(f"Готово за {summary['seconds']:.0f} с: {summary['messages']} сообщений, "
+          f"самая большая группа - {summary['largest_group']} человек, {summary['size_mb']:.0f} МБ")
+    print(f"Пароль всех пользователей (user1, user2, ...): {PASSWORD}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,634 @@
+"""Нагрузочный генератор: виртуальные пользователи по протоколу мессенджера.
+
+Запуск из корня проекта:
+    python -m benchmarks.loadgen benchmarks/scenarios/smoke.json
+    python -m benchmarks.loadgen benchmarks/scenarios/office.json --engine asyncio
+    python -m benchmarks.loadgen benchmarks/scenarios/office.json --users 500 --report out.json
+    python -m benchmarks.loadgen benchmarks/scenarios/smoke.json --connect localhost:5555
+
+Каждый пользователь - корутина asyncio со своим соединением (без Qt):
+регистрация и вход, личные и групповые чаты, затем в течение duration
+секунд - отправка сообщений с заданной частотой и догрузка новых
+сообщений так же, как это делает ChatWindow: по push-событиям
+(mode=subscribe) или опросом (mode=poll), плюс heartbeat.
+
+По умолчанию сервер запускается отдельным процессом на временной БД
+(--database - на копии готовой БД) и во время прогона снимается его
+потребление CPU и памяти (/proc, только Linux). В конце печатаются
+пропускная способность и p50/p95/p99 задержки по типам запросов отдельно
+для подготовки и основной фазы; --report сохраняет всё в JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_codecs import WORDS
+from shared.protocols import (CODECS, COMPRESSIONS, JSON, Compression, choose_codec,
+                              encode_frame, read_frame_async)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Параметры сценария по умолчанию; файл сценария переопределяет любые из них
+DEFAULT_SCENARIO = {
+    'users': 20,               # виртуальных пользователей
+    'ramp_up': 2.0,            # за сколько секунд подключаются все пользователи
+    'duration': 20.0,          # длительность основной фазы, секунды
+    'direct_chats': 2,         # личных чатов создаёт каждый пользователь
+    'groups': 4,               # групповых чатов всего
+    'group_size': [3, 20],     # размер группы: от и до
+    'message_rate': 0.2,       # сообщений в секунду на пользователя
+    'text_length': [1, 60],    # слов в сообщении: от и до (чаще короткие)
+    'mode': 'subscribe',       # subscribe - push-события, poll - опрос
+    'poll_interval': 3.0,      # период опроса в режиме poll
+    'poll_chats': True,        # опрашивать и список чатов
+    'heartbeat_interval': 10.0,
+    'switch_chat': 0.1,        # вероятность перейти в другой чат перед отправкой
+    'send_with_batch': True,   # отправка + догрузка одним batch, как в ChatWindow
+    'page_size': 50,
+    'codecs': ['msgpack', 'json'],
+    'compression': ['zstd', 'zlib'],
+    'request_timeout': 30.0,
+    'seed': 1,
+    'server_env': {},          # переменные окружения запускаемого сервера
+}
+
+SETUP, STEADY = 'setup', 'steady'
+
+
+def load_scenario(path, overrides):
+    scenario = dict(DEFAULT_SCENARIO)
+    if path:
+        with open(path, encoding='utf-8') as f:
+            loaded = json.load(f)
+        unknown = set(loaded) - set(scenario) - {'description'}
+        if unknown:
+            raise SystemExit(f"Неизвестные параметры сценария: {', '.join(sorted(unknown))}")
+        scenario.update(loaded)
+    scenario.update({key: value for key, value in overrides.items() if value is not None})
+    if scenario['mode'] not in ('subscribe', 'poll'):
+        raise SystemExit("mode должен быть subscribe или poll")
+    return scenario
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class LoadStats:
+    """Задержки (секунды) и ошибки по фазам и типам запросов."""
+
+    def __init__(self):
+        self.phase = SETUP
+        self.latency = {SETUP: {}, STEADY: {}}
+        self.errors = {SETUP: {}, STEADY: {}}
+        self.timeouts = 0
+        self.failures = []
+        self.events = {}
+        self.phase_seconds = {SETUP: 0.0, STEADY: 0.0}
+
+    def record(self, msg_type, seconds, error=False):
+        self.latency[self.phase].setdefault(msg_type, []).append(seconds)
+        if error:
+            errors = self.errors[self.phase]
+            errors[msg_type] = errors.get(msg_type, 0) + 1
+
+    def event(self, kind):
+        self.events[kind] = self.events.get(kind, 0) + 1
+
+    def summary(self, phase):
+        elapsed = self.phase_seconds[phase] or 1e-9
+        result = {}
+        for msg_type, values in sorted(self.latency[phase].items()):
+            values = sorted(values)
+            result[msg_type] = {
+                'count': len(values),
+                'errors': self.errors[phase].get(msg_type, 0),
+                'rate': len(values) / elapsed,
+                'p50': percentile(values, 0.5),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+                'max': values[-1],
+            }
+        return result
+
+
+class LoadConnection:
+    """Соединение виртуального пользователя: запросы с req_id (конвейер),
+    ответы сопоставляются в фоновой задаче чтения, события уходят в on_event."""
+
+    def __init__(self, reader, writer, stats, timeout):
+        self.reader = reader
+        self.writer = writer
+        self.stats = stats
+        self.timeout = timeout
+        self.codec = JSON
+        self.compression = None
+        self.pending = {}
+        self.req_ids = 0
+        self.on_event = None
+        self.read_task = None
+
+    @classmethod
+    async def open(cls, host, port, stats, scenario, compressions):
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = cls(reader, writer, stats, scenario['request_timeout'])
+        await connection.handshake(scenario['codecs'], scenario['compression'], compressions,
+                                   events=scenario['mode'] == 'subscribe')
+        connection.read_task = asyncio.create_task(connection.read_loop())
+        return connection
+
+    async def handshake(self, codecs, compression, compressions, events):
+        started = time.perf_counter()
+        self.writer.write(encode_frame({'type': 'hello', 'codecs': codecs, 'compression': compression,
+                                        'events': events}))
+        data = await read_frame_async(self.reader)
+        response = JSON.decode(data) if data is not None else None
+        ok = isinstance(response, dict) and response.get('status') == 'success'
+        self.stats.record('hello', time.perf_counter() - started, error=not ok)
+        if not ok:
+            return
+        self.codec = choose_codec([response.get('codec')])
+        name = response.get('compression')
+        if name in COMPRESSIONS:
+            # Один объект на алгоритм - счётчики сжатия общие для всех пользователей
+            self.compression = compressions.setdefault(name, Compression(name))
+
+    async def read_loop(self):
+        try:
+            while True:
+                data = await read_frame_async(self.reader, compression=self.compression)
+                if data is None:
+                    break
+                frame = self.codec.decode(data)
+                if isinstance(frame, dict) and frame.get('type') == 'event':
+                    self.stats.event(frame.get('event'))
+                    if self.on_event is not None:
+                        self.on_event(frame)
+                    continue
+                future = self.pending.pop(frame.get('req_id'), None) if isinstance(frame, dict) else None
+                if future is not None and not future.done():
+                    future.set_result(frame)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Server closed connection"))
+            self.pending.clear()
+
+    async def request(self, message):
+        """Отправляет запрос и ждёт ответ; задержка пишется в статистику."""
+        self.req_ids += 1
+        req_id = self.req_ids
+        future = asyncio.get_running_loop().create_future()
+        self.pending[req_id] = future
+        msg_type = message.get('type')
+        started = time.perf_counter()
+        self.writer.write(encode_frame(dict(message, req_id=req_id), self.codec, self.compression))
+        try:
+            response = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop(req_id, None)
+            self.stats.timeouts += 1
+            self.stats.record(msg_type, time.perf_counter() - started, error=True)
+            return {'status': 'error', 'message': 'Timeout'}
+        except ConnectionError as e:
+            self.stats.record(msg_type, time.perf_counter() - started, error=True)
+            return {'status': 'error', 'message': str(e)}
+        self.stats.record(msg_type, time.perf_counter() - started, error=response.get('status') != 'success')
+        return response
+
+    async def close(self):
+        if self.read_task is not None:
+            self.read_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class VirtualUser:
+    """Один пользователь: повторяет запросы ChatWindow без интерфейса."""
+
+    def __init__(self, test, index):
+        self.test = test
+        self.index = index
+        self.scenario = test.scenario
+        self.rnd = random.Random(self.scenario['seed'] * 100003 + index)
+        self.username = f'{test.prefix}{index}'
+        self.connection = None
+        self.user_id = None
+        self.chats = []
+        self.current_chat = None
+        self.last_message_id = None
+        self.refreshing = set()
+        self.tasks = set()
+
+    async def login(self):
+        connection = self.connection
+        credentials = {'username': self.username, 'password': 'load-test'}
+        response = await connection.request(dict(credentials, type='register'))
+        if response.get('status') != 'success' and response.get('message') != 'Username already exists':
+            raise RuntimeError(f"register {self.username}: {response.get('message')}")
+        response = await connection.request(dict(credentials, type='login'))
+        if response.get('status') != 'success':
+            raise RuntimeError(f"login {self.username}: {response.get('message')}")
+        self.user_id = response['user_id']
+
+    async def create_chats(self, user_ids):
+        others = [user_id for user_id in user_ids if user_id != self.user_id]
+        if not others:
+            return
+        for other in self.rnd.sample(others, min(self.scenario['direct_chats'], len(others))):
+            await self.connection.request({
+                'type': 'create_chat', 'user_id': self.user_id, 'participant_ids': [self.user_id, other]
+            })
+        if self.index < self.scenario['groups']:
+            low, high = self.scenario['group_size']
+            size = min(len(others) + 1, self.rnd.randint(low, high))
+            members = [self.user_id] + self.rnd.sample(others, size - 1)
+            await self.connection.request({
+                'type': 'create_chat', 'user_id': self.user_id, 'participant_ids': members,
+                'is_group': True, 'name': f'Нагрузка {self.index}'
+            })
+
+    async def load_chats(self):
+        response = await self.connection.request({
+            'type': 'get_chats', 'user_id': self.user_id, 'username': self.username
+        })
+        if response.get('status') == 'success':
+            self.chats = [chat['id'] for chat in response['chats']]
+
+    def messages_request(self):
+        request = {'type': 'get_messages', 'chat_id': self.current_chat, 'limit': self.scenario['page_size']}
+        if self.last_message_id is not None:
+            request['after_id'] = self.last_message_id
+        return request
+
+    def apply_messages(self, response):
+        if response.get('status') == 'success' and response['messages']:
+            self.last_message_id = response['messages'][-1]['id']
+
+    async def open_chat(self, chat_id):
+        self.current_chat = chat_id
+        self.last_message_id = None
+        self.apply_messages(await self.connection.request(self.messages_request()))
+
+    async def load_messages(self):
+        if self.current_chat is not None:
+            self.apply_messages(await self.connection.request(self.messages_request()))
+
+    def text(self):
+        low, high = self.scenario['text_length']
+        # В основном короткие реплики, изредка длинные
+        length = max(low, min(high, int(self.rnd.lognormvariate(1.8, 0.9)) + 1))
+        return ' '.join(self.rnd.choice(WORDS) for _ in range(length)).capitalize()
+
+    async def send_message(self):
+        if not self.chats:
+            return
+        if self.current_chat is None or self.rnd.random() < self.scenario['switch_chat']:
+            await self.open_chat(self.rnd.choice(self.chats))
+        message = {'type': 'send_message', 'user_id': self.user_id,
+                   'chat_id': self.current_chat, 'text': self.text()}
+        if not self.scenario['send_with_batch']:
+            await self.connection.request(message)
+            return
+        response = await self.connection.request({'type': 'batch', 'requests': [message, self.messages_request()]})
+        if response.get('status') == 'success':
+            self.apply_messages(response['results'][1])
+
+    def on_event(self, event):
+        """Как ChatWindow.handle_server_event; повторный запрос, пока идёт
+        предыдущий такой же, не отправляется."""
+        if not self.test.running or self.scenario['mode'] != 'subscribe':
+            return
+        kind = event.get('event')
+        if kind == 'new_message' and event.get('chat_id') == self.current_chat:
+            self.refresh('messages', self.load_messages)
+        elif kind in ('chat_created', 'chat_renamed', 'participants_changed'):
+            self.refresh('chats', self.load_chats)
+
+    def refresh(self, name, method):
+        if name in self.refreshing:
+            return
+        self.refreshing.add(name)
+
+        async def run():
+            try:
+                await method()
+            finally:
+                self.refreshing.discard(name)
+
+        task = asyncio.create_task(run())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def sender(self, deadline):
+        rate = self.scenario['message_rate']
+        while rate > 0:
+            await asyncio.sleep(self.rnd.expovariate(rate))
+            if time.perf_counter() >= deadline:
+                break
+            await self.send_message()
+
+    async def poller(self, deadline):
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.scenario['poll_interval'])
+            if self.scenario['poll_chats']:
+                await self.load_chats()
+            await self.load_messages()
+
+    async def heartbeat(self, deadline):
+        # Первый heartbeat в случайный момент, чтобы пользователи не шли строем
+        await asyncio.sleep(self.rnd.uniform(0, self.scenario['heartbeat_interval']))
+        while time.perf_counter() < deadline:
+            await self.connection.request({'type': 'heartbeat', 'user_id': self.user_id})
+            await asyncio.sleep(self.scenario['heartbeat_interval'])
+
+    async def steady(self, deadline):
+        await self.load_chats()
+        if self.chats:
+            await self.open_chat(self.rnd.choice(self.chats))
+        loops = [self.sender(deadline), self.heartbeat(deadline)]
+        if self.scenario['mode'] == 'poll':
+            loops.append(self.poller(deadline))
+        tasks = [asyncio.create_task(loop) for loop in loops]
+        await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+        for task in tasks + list(self.tasks):
+            task.cancel()
+        for result in await asyncio.gather(*tasks, *self.tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.test.stats.failures.append(f'{self.username}: {result!r}')
+
+
+class LoadTest:
+    def __init__(self, scenario, host, port):
+        self.scenario = scenario
+        self.host = host
+        self.port = port
+        self.stats = LoadStats()
+        self.compressions = {}
+        self.running = False
+        # Свой префикс на прогон: повторный запуск на той же БД не мешает прошлому
+        self.prefix = f'load{secrets.token_hex(3)}_'
+
+    async def run(self):
+        scenario = self.scenario
+        users = [VirtualUser(self, index) for index in range(scenario['users'])]
+        started = time.perf_counter()
+        delay = scenario['ramp_up'] / max(1, len(users))
+
+        async def connect(user):
+            await asyncio.sleep(user.index * delay)
+            user.connection = await LoadConnection.open(
+                self.host, self.port, self.stats, scenario, self.compressions)
+            user.connection.on_event = user.on_event
+            await user.login()
+
+        await asyncio.gather(*(connect(user) for user in users))
+        user_ids = [user.user_id for user in users]
+        await asyncio.gather(*(user.create_chats(user_ids) for user in users))
+        self.stats.phase_seconds[SETUP] = time.perf_counter() - started
+
+        self.stats.phase = STEADY
+        self.running = True
+        started = time.perf_counter()
+        await asyncio.gather(*(user.steady(started + scenario['duration']) for user in users))
+        self.running = False
+        self.stats.phase_seconds[STEADY] = time.perf_counter() - started
+        return users
+
+    async def admin_stats(self, token):
+        connection = await LoadConnection.open(self.host, self.port, LoadStats(), self.scenario, {})
+        try:
+            response = await connection.request({'type': 'admin_stats', 'token': token})
+        finally:
+            await connection.close()
+        return response if response.get('status') == 'success' else None
+
+
+class ProcessSampler:
+    """Снимает CPU и память процесса сервера из /proc во время прогона."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self.samples = []
+
+    def available(self):
+        return self.pid is not None and os.path.exists(f'/proc/{self.pid}/stat')
+
+    def sample(self):
+        with open(f'/proc/{self.pid}/stat') as f:
+            # Имя процесса в скобках может содержать пробелы - режем после ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / self.ticks  # utime + stime
+        status = {}
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                status[key] = value.split()
+        rss = int(status['VmRSS'][0]) * 1024 if 'VmRSS' in status else 0
+        threads = int(status['Threads'][0]) if 'Threads' in status else 0
+        return time.perf_counter(), cpu, rss, threads
+
+    async def run(self):
+        while True:
+            try:
+                self.samples.append(self.sample())
+            except (OSError, ValueError, IndexError):
+                return
+            await asyncio.sleep(self.interval)
+
+    def summary(self):
+        if len(self.samples) < 2:
+            return None
+        (first_time, first_cpu, _, _), (last_time, last_cpu, _, _) = self.samples[0], self.samples[-1]
+        return {
+            'cpu_seconds': last_cpu - first_cpu,
+            'cpu_percent': 100 * (last_cpu - first_cpu) / (last_time - first_time),
+            'rss_peak_mb': max(sample[2] for sample in self.samples) / (1024 * 1024),
+            'rss_end_mb': self.samples[-1][2] / (1024 * 1024),
+            'threads_peak': max(sample[3] for sample in self.samples),
+        }
+
+
+class SpawnedServer:
+    """Сервер в отдельном процессе на временной БД (или копии --database)."""
+
+    def __init__(self, engine, scenario, database=None):
+        self.workdir = tempfile.mkdtemp(prefix='messenger-load-')
+        self.token = secrets.token_hex(16)
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        db_path = os.path.join(self.workdir, 'messenger.db')
+        if database:
+            shutil.copy(database, db_path)
+        env = dict(os.environ)
+        env.update({
+            'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')])),
+            'MESSENGER_DATABASE_URL': f'sqlite:///{db_path}',
+            'MESSENGER_ADMIN_TOKEN': self.token,
+            'MESSENGER_METRICS_PORT': '0',
+            'MESSENGER_LOG_LEVEL': 'WARNING',
+        })
+        env.update({key: str(value) for key, value in scenario['server_env'].items()})
+        self.log = open(os.path.join(self.workdir, 'server.out'), 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'server.server', '--host', '127.0.0.1',
+             '--port', str(self.port), '--engine', engine],
+            cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise SystemExit("Сервер не запустился, см. вывод выше")
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+        if self.process.returncode not in (0, -signal.SIGINT, 130):
+            with open(self.log.name, encoding='utf-8', errors='replace') as f:
+                sys.stderr.write(f.read()[-4000:])
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def print_phase(title, summary, server_handlers=None):
+    print(f"\n{title}")
+    header = f"{'type':>22} {'count':>8} {'errors':>7} {'req/s':>8} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9} {'max, ms':>9}"
+    if server_handlers is not None:
+        header += f" {'srv p95':>8}"
+    print(header)
+    for msg_type, row in summary.items():
+        line = (f"{msg_type:>22} {row['count']:>8} {row['errors']:>7} {row['rate']:>8.1f} "
+                f"{row['p50'] * 1000:>9.2f} {row['p95'] * 1000:>9.2f} {row['p99'] * 1000:>9.2f} "
+                f"{row['max'] * 1000:>9.2f}")
+        if server_handlers is not None:
+            # Оценка по гистограмме сервера: верхняя граница корзины, за всё время работы
+            p95 = server_handlers.get(msg_type, {}).get('latency', {}).get('p95')
+            line += f" {'-' if p95 is None else p95 if isinstance(p95, str) else f'<={p95 * 1000:g}':>8}"
+        print(line)
+
+
+async def main_async(args, scenario):
+    server = None
+    host, port = '127.0.0.1', None
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        port = int(port)
+        pid = args.server_pid
+    else:
+        server = SpawnedServer(args.engine, scenario, args.database)
+        server.wait_ready()
+        port, pid = server.port, server.process.pid
+
+    sampler = ProcessSampler(pid)
+    sampler_task = asyncio.create_task(sampler.run()) if sampler.available() else None
+    test = LoadTest(scenario, host, port)
+    client_cpu = time.process_time()
+    try:
+        users = await test.run()
+        client_cpu = time.process_time() - client_cpu
+        if sampler_task is not None:
+            sampler_task.cancel()
+        token = server.token if server else os.environ.get('MESSENGER_ADMIN_TOKEN')
+        admin = await test.admin_stats(token) if token else None
+        for user in users:
+            await user.connection.close()
+    finally:
+        if server is not None:
+            server.stop()
+
+    stats = test.stats
+    report = {
+        'scenario': scenario,
+        'engine': None if args.connect else args.engine,
+        'setup': stats.summary(SETUP),
+        'steady': stats.summary(STEADY),
+        'phase_seconds': stats.phase_seconds,
+        'timeouts': stats.timeouts,
+        'failures': stats.failures,
+        'events': stats.events,
+        'client_cpu_seconds': client_cpu,
+        'server': sampler.summary(),
+        'server_stats': admin,
+        'compression': {name: c.stats() for name, c in test.compressions.items()},
+    }
+    handlers = admin['handlers'] if admin else None
+    print(f"users={scenario['users']} mode={scenario['mode']} message_rate={scenario['message_rate']}/s "
+          f"engine={report['engine'] or args.connect}")
+    print_phase(f"Подготовка ({stats.phase_seconds[SETUP]:.1f} с)", report['setup'])
+    print_phase(f"Основная фаза ({stats.phase_seconds[STEADY]:.1f} с)", report['steady'], handlers)
+    print(f"\nСобытий получено: {sum(stats.events.values())} {stats.events}; таймаутов: {stats.timeouts}")
+    if stats.failures:
+        print(f"Сбоев виртуальных пользователей: {len(stats.failures)}, первый: {stats.failures[0]}")
+    print(f"CPU генератора: {client_cpu:.1f} с (если близко к времени прогона - генератор сам стал узким местом)")
+    if report['server']:
+        resources = report['server']
+        print(f"Сервер: CPU {resources['cpu_percent']:.0f}% ({resources['cpu_seconds']:.1f} с), "
+              f"RSS пик {resources['rss_peak_mb']:.0f} МБ, потоков до {resources['threads_peak']}")
+    else:
+        print("Сервер: потребление ресурсов не снималось (нужен Linux и --server-pid для --connect)")
+    if admin:
+        writer = admin['message_writer']
+        print(f"Запись сообщений: {writer['rows']} строк за {writer['batches']} транзакций")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Отчёт: {args.report}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenario', nargs='?', help='JSON-файл сценария (benchmarks/scenarios/*.json)')
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--database', help='запустить сервер на копии этой БД')
+    parser.add_argument('--connect', metavar='HOST:PORT', help='не запускать сервер, подключиться к работающему')
+    parser.add_argument('--server-pid', type=int, help='pid сервера для --connect (снимать CPU и память)')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--duration', type=float)
+    parser.add_argument('--mode', choices=['subscribe', 'poll'])
+    parser.add_argument('--message-rate', type=float)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--report', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario, {
+        'users': args.users, 'duration': args.duration, 'mode': args.mode,
+        'message_rate': args.message_rate, 'seed': args.seed,
+    })
+    if 'msgpack' in scenario['codecs'] and 'msgpack' not in CODECS:
+        print("msgpack не установлен - кадры пойдут в JSON")
+    asyncio.run(main_async(args, scenario))
+
+
+if __name__ == '__main__':
+    main()
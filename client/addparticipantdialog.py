@@ -22,20 +22,17 @@ class AddParticipantDialog(QDialog):
         self.setLayout(layout)
     
     def load_users(self):
-        response = self.chat_window.comm.send_message({
-            'type': 'get_users',
-            'force_update': True
-        })
-        
+        # Пользователи и текущие участники чата - одним пакетом
+        self.chat_window.comm.call_batch([
+            {'type': 'get_users', 'force_update': True},
+            {'type': 'get_chat_participants', 'chat_id': self.chat_window.current_chat}
+        ], self.users_loaded)
+
+    def users_loaded(self, responses):
+        response, participants_response = responses
         if response.get('status') == 'success':
             self.users_list.clear()
             
-            # Получаем текущих участников чата
-            participants_response = self.chat_window.comm.send_message({
-                'type': 'get_chat_participants',
-                'chat_id': self.chat_window.current_chat
-            })
-            
             current_participants = []
             if participants_response.get('status') == 'success':
                 current_participants = [p['id'] for p in participants_response['participants']]
@@ -56,17 +53,17 @@ class AddParticipantDialog(QDialog):
         
         participant_id = selected.data(Qt.ItemDataRole.UserRole)
         
-        try:
-            response = self.chat_window.comm.send_message({
-                'type': 'add_participant',
-                'chat_id': self.chat_window.current_chat,
-                'user_id': self.chat_window.user_id,
-                'participant_id': participant_id
-            })
-            
-            if response.get('status') == 'success':
-                self.accept()
-            else:
-                QMessageBox.warning(self, "Ошибка", response.get('message', 'Ошибка добавления'))
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка соединения: {str(e)}")
+        self.add_button.setEnabled(False)
+        self.chat_window.comm.call({
+            'type': 'add_participant',
+            'chat_id': self.chat_window.current_chat,
+            'user_id': self.chat_window.user_id,
+            'participant_id': participant_id
+        }, self.participant_added)
+
+    def participant_added(self, response):
+        self.add_button.setEnabled(True)
+        if response.get('status') == 'success':
+            self.accept()
+        else:
+            QMessageBox.warning(self, "Ошибка", response.get('message', 'Ошибка добавления'))
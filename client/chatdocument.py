@@ -0,0 +1,300 @@
+from PyQt6.QtCore import pyqtSignal
+from PyQt6.QtGui import QTextCursor, QTextDocument
+from PyQt6.QtWidgets import QTextEdit
+from shared.protocols import to_datetime
+
+# Стили сообщений; документ получает их один раз (setDefaultStyleSheet),
+# и HTML каждого сообщения разбирается уже с ними
+MESSAGES_STYLESHEET = """
+    .message-block {
+        margin: 8px 0;
+        display: flex;
+        flex-direction: column;
+    }
+    .my-message-block {
+        justify-content: flex-end;
+    }
+    .other-message-block {
+        justify-content: flex-start;
+    }
+    .message-container {
+        display: inline-block;
+        max-width: 30%;
+        margin: 2px 0;
+    }
+    .my-message, .other-message {
+        border-radius: 15px;
+        padding: 8px 12px;
+        word-wrap: break-word;
+        box-shadow: 0 1px 2px rgba(0,0,0,0.1);
+    }
+    .my-message {
+        background-color: rgba(173, 216, 230, 0.5);
+        border: 1px solid rgba(100, 180, 200, 0.3);
+        margin-left: 20%;
+        text-align: right;
+        color: black;
+    }
+    .other-message {
+        background-color: rgba(245, 245, 245, 0.5);
+        border: 1px solid rgba(200, 200, 200, 0.3);
+        margin-right: 20%;
+        text-align: left;
+        color: black;
+    }
+    .system-message {
+        color: gray;
+        font-style: italic;
+        text-align: center;
+        margin: 15px 0;
+        font-size: 11px;
+        padding: 5px;
+    }
+    .timestamp {
+        font-size: 10px;
+        color: #777;
+        margin: 2px 8px 0 8px;
+        padding: 0;
+        background-color: transparent;
+    }
+    .timestamp-right {
+        text-align: right;
+    }
+    .timestamp-left {
+        text-align: left;
+    }
+    .username {
+        font-size: 11px;
+        font-weight: bold;
+        margin: 0 8px 2px 8px;
+        color: #9e9e9e;
+        background-color: transparent;
+    }
+"""
+
+
+def message_kind(message, user_id):
+    if message.get('is_system', False):
+        return 'system'
+    return 'mine' if message.get('user_id') == user_id else 'other'
+
+
+def message_html(message, kind):
+    timestamp = to_datetime(message['timestamp']).strftime('%d.%m.%Y %H:%M')
+    text = message['text'].replace('<', '&lt;').replace('>', '&gt;')  # защита от HTML
+    username = message.get('username', '???')
+
+    if kind == 'system':
+        return f'<div class="system-message">[{timestamp}] {text}</div>'
+    if kind == 'mine':
+        return f"""
+            <div class="message-block my-message-block">
+                <div class="message-container">
+                    <div class="my-message">{text}</div>
+                    <div class="timestamp timestamp-right">{timestamp}</div>
+                </div>
+            </div>
+        """
+    return f"""
+        <div class="message-block other-message-block">
+            <div class="message-container">
+                <span class="username">{username}</span>
+                <div class="other-message">{text}</div>
+                <div class="timestamp timestamp-left">{timestamp}</div>
+            </div>
+        </div>
+    """
+
+
+_first_block_formats = {}
+
+
+def first_block_formats(kind):
+    """Формат первого абзаца сообщения данного вида.
+
+    insertHtml сливает первый абзац фрагмента с текущим и оставляет формат
+    текущего, поэтому новый абзац сразу создаётся с нужным форматом. Он
+    зависит только от стилей, так что разбирается один раз на вид.
+    """
+    formats = _first_block_formats.get(kind)
+    if formats is None:
+        sample = QTextDocument()
+        sample.setDefaultStyleSheet(MESSAGES_STYLESHEET)
+        sample.setHtml(message_html({'text': 'x', 'username': 'x', 'timestamp': '2000-01-01T00:00:00'}, kind))
+        block = sample.begin()
+        formats = _first_block_formats[kind] = (block.blockFormat(), block.charFormat())
+    return formats
+
+
+class ChatDocument(QTextDocument):
+    """Отрисованная история одного чата.
+
+    Новые сообщения дописываются в конец, более ранние страницы - в начало,
+    изменённое сообщение перерисовывается на своём месте; остальной документ
+    не разбирается и не раскладывается заново. Для каждого сообщения
+    хранится диапазон позиций [начало, конец) в документе.
+    """
+
+    def __init__(self, user_id, parent=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.setDefaultStyleSheet(MESSAGES_STYLESHEET)
+        # История правок документа не нужна и только занимала бы память
+        self.setUndoRedoEnabled(False)
+        self.spans = []  # [id, начало, конец, содержимое, вид] в порядке сообщений
+        self.by_id = {}
+        # Положение прокрутки при уходе из чата; None - внизу
+        self.scroll_value = None
+
+    def __contains__(self, message_id):
+        return message_id in self.by_id
+
+    @staticmethod
+    def content(message):
+        return (message['text'], message.get('username'), message.get('is_system', False), message['timestamp'])
+
+    def _insert(self, cursor, message, new_block):
+        kind = message_kind(message, self.user_id)
+        if new_block:
+            cursor.insertBlock(*first_block_formats(kind))
+        else:
+            cursor.setBlockFormat(first_block_formats(kind)[0])
+        start = cursor.position()
+        cursor.insertHtml(message_html(message, kind))
+        span = [message['id'], start, cursor.position(), self.content(message), kind]
+        self.by_id[message['id']] = span
+        return span
+
+    def _shift(self, spans, delta):
+        for span in spans:
+            span[1] += delta
+            span[2] += delta
+
+    def append(self, messages):
+        if not messages:
+            return
+        cursor = QTextCursor(self)
+        cursor.beginEditBlock()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        for message in messages:
+            self.spans.append(self._insert(cursor, message, new_block=bool(self.spans)))
+        cursor.endEditBlock()
+
+    def prepend(self, messages):
+        if not self.spans:
+            self.append(messages)
+            return
+        if not messages:
+            return
+        cursor = QTextCursor(self)
+        cursor.beginEditBlock()
+        # Отделяем пустой абзац перед первым сообщением и пишем в него
+        cursor.insertBlock(*first_block_formats(self.spans[0][4]))
+        cursor.movePosition(QTextCursor.MoveOperation.Start)
+        added = [self._insert(cursor, message, new_block=index > 0) for index, message in enumerate(messages)]
+        cursor.endEditBlock()
+        self._shift(self.spans, cursor.position() + 1)
+        self.spans[:0] = added
+
+    def update(self, message):
+        """Перерисовывает сообщение, если его содержимое изменилось."""
+        span = self.by_id.get(message['id'])
+        if span is None or span[3] == self.content(message):
+            return
+        cursor = QTextCursor(self)
+        cursor.beginEditBlock()
+        cursor.setPosition(span[1])
+        cursor.setPosition(span[2], QTextCursor.MoveMode.KeepAnchor)
+        # После удаления у оставшегося абзаца формат последнего абзаца
+        # сообщения - возвращаем формат первого
+        cursor.removeSelectedText()
+        block_format, char_format = first_block_formats(span[4])
+        cursor.setBlockFormat(block_format)
+        cursor.setBlockCharFormat(char_format)
+        cursor.insertHtml(message_html(message, span[4]))
+        cursor.endEditBlock()
+        delta = cursor.position() - span[2]
+        span[2] = cursor.position()
+        span[3] = self.content(message)
+        self._shift(self.spans[self.spans.index(span) + 1:], delta)
+
+    def reset(self, messages):
+        self.clear()
+        self.spans = []
+        self.by_id = {}
+        self.append(messages)
+
+
+class ChatTextView(QTextEdit):
+    """История чатов в QTextEdit: у каждого чата свой ChatDocument.
+
+    Тот же набор методов, что у MessageListView, - окно чата работает с
+    любым из них.
+    """
+
+    older_requested = pyqtSignal()
+
+    def __init__(self, user_id, parent=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.documents = {}  # chat_id -> ChatDocument
+        self.setReadOnly(True)
+        self.verticalScrollBar().valueChanged.connect(self.scrolled)
+
+    def document_for(self, chat_id):
+        document = self.documents.get(chat_id)
+        if document is None:
+            document = self.documents[chat_id] = ChatDocument(self.user_id, self)
+        return document
+
+    def scrolled(self, value):
+        scrollbar = self.verticalScrollBar()
+        if value == scrollbar.minimum() and scrollbar.maximum() > 0:
+            self.older_requested.emit()
+
+    def at_bottom(self):
+        scrollbar = self.verticalScrollBar()
+        return scrollbar.value() >= scrollbar.maximum() - 4
+
+    def scroll_to_bottom(self):
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+
+    def contains(self, chat_id, message_id):
+        return message_id in self.document_for(chat_id)
+
+    def show_chat(self, chat_id):
+        previous = self.document()
+        if isinstance(previous, ChatDocument):
+            previous.scroll_value = None if self.at_bottom() else self.verticalScrollBar().value()
+        document = self.document_for(chat_id)
+        self.setDocument(document)
+        if document.scroll_value is None:
+            self.scroll_to_bottom()
+        else:
+            self.verticalScrollBar().setValue(document.scroll_value)
+
+    def reset_chat(self, chat_id, messages):
+        self.document_for(chat_id).reset(messages)
+        if self.document() is self.documents[chat_id]:
+            self.scroll_to_bottom()
+
+    def append_messages(self, chat_id, messages, scroll_to_bottom=False):
+        document = self.document_for(chat_id)
+        stick = document is self.document() and (scroll_to_bottom or self.at_bottom())
+        document.append(messages)
+        if stick:
+            self.scroll_to_bottom()
+
+    def prepend_messages(self, chat_id, messages):
+        document = self.document_for(chat_id)
+        if document is not self.document():
+            document.prepend(messages)
+            return
+        # Видимая часть истории остаётся на месте: сдвигаемся на высоту добавленного
+        scrollbar = self.verticalScrollBar()
+        value, maximum = scrollbar.value(), scrollbar.maximum()
+        document.prepend(messages)
+        scrollbar.setValue(value + scrollbar.maximum() - maximum)
+
+    def update_message(self, chat_id, message):
+        self.document_for(chat_id).update(message)
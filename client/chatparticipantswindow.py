@@ -42,15 +42,19 @@ class ChatParticipantsWindow(QDialog):
         dialog = AddParticipantDialog(self.chat_window)
         if dialog.exec():
             # Обновляем список участников после добавления
-            response = self.chat_window.comm.send_message({
-                'type': 'get_chat_participants',
-                'chat_id': self.chat_window.current_chat
-            })
-            if response.get('status') == 'success':
-                self.update_participants_list(response['participants'])
-                self.chat_window.load_messages(self.chat_window.current_chat)
-                self.chat_window.load_chats()
+            self.load_participants()
 
+    def load_participants(self):
+        self.chat_window.comm.call({
+            'type': 'get_chat_participants',
+            'chat_id': self.chat_window.current_chat
+        }, self.participants_loaded)
+
+    def participants_loaded(self, response):
+        if response.get('status') == 'success':
+            self.update_participants_list(response['participants'])
+            self.chat_window.load_messages(self.chat_window.current_chat)
+            self.chat_window.load_chats()
     
     def remove_participant(self):
         selected = self.participants_list.currentItem()
@@ -60,25 +64,18 @@ class ChatParticipantsWindow(QDialog):
         
         participant_id = selected.data(Qt.ItemDataRole.UserRole)
         
-        try:
-            response = self.chat_window.comm.send_message({
-                'type': 'remove_participant',
-                'chat_id': self.chat_window.current_chat,
-                'user_id': self.chat_window.user_id,
-                'participant_id': participant_id
-            })
-            
-            if response.get('status') == 'success':
-                # Обновляем список участников
-                response = self.chat_window.comm.send_message({
-                    'type': 'get_chat_participants',
-                    'chat_id': self.chat_window.current_chat
-                })
-                if response.get('status') == 'success':
-                    self.update_participants_list(response['participants'])
-                    self.chat_window.load_messages(self.chat_window.current_chat)
-                    self.chat_window.load_chats()
-            else:
-                QMessageBox.warning(self, "Ошибка", response.get('message', 'Ошибка удаления'))
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка соединения: {str(e)}")
+        self.remove_button.setEnabled(False)
+        self.chat_window.comm.call({
+            'type': 'remove_participant',
+            'chat_id': self.chat_window.current_chat,
+            'user_id': self.chat_window.user_id,
+            'participant_id': participant_id
+        }, self.participant_removed)
+
+    def participant_removed(self, response):
+        self.remove_button.setEnabled(True)
+        if response.get('status') == 'success':
+            # Обновляем список участников
+            self.load_participants()
+        else:
+            QMessageBox.warning(self, "Ошибка", response.get('message', 'Ошибка удаления'))
@@ -1,13 +1,23 @@
+import os
+from functools import partial
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                             QTextEdit, QPushButton, QListWidget, QStackedWidget,QListWidgetItem,
                             QMessageBox, QDialog, QLineEdit, QDialogButtonBox)
 from PyQt6.QtCore import Qt, QTimer, pyqtSignal
-from datetime import datetime
+from .chatdocument import ChatTextView
+from .messageview import MessageListView
 from .profilewidget import ProfileWidget
 from .userswindow import UsersWindow
 from .newchatdialog import NewChatDialog
 from .chatparticipantswindow import ChatParticipantsWindow
 
+# Вид истории сообщений: 'list' - QListView, рисующий только видимые
+# сообщения; 'text' - HTML-документ в QTextEdit
+MESSAGE_VIEW = os.environ.get('MESSENGER_MESSAGE_VIEW', 'list')
+
+# Признак группового чата в элементе списка чатов
+IS_GROUP_ROLE = Qt.ItemDataRole.UserRole + 1
+
 class ChatWindow(QWidget):
     logout_requested = pyqtSignal()
   
@@ -18,24 +28,40 @@ class ChatWindow(QWidget):
         self.username = username
         self.name = name
         self.current_chat = None
+        # Загруженная история по чатам: chat_id -> список сообщений по возрастанию id
+        self.chat_messages = {}
+        self.has_older = {}
+        self.page_size = 100
+        # Запросы истории текущего чата в пути; при смене чата отменяются
+        self.history_request = None
+        self.history_stale = False  # пришло событие, пока запрос был в пути
+        self.older_request = None
         self.init_ui()
         self.load_chats()
 
         self.profile_widget.logout_requested.connect(self.logout)
-        self.status_timer = QTimer()
-        self.status_timer.timeout.connect(self.update_statuses)
-        self.status_timer.start(10000)  # Обновление каждые 10 секунд
+        # Вместо периодического опроса сервер сам присылает события
+        self.comm.message_received.connect(self.handle_server_event)
+        self.comm.reconnected.connect(self.reload_after_reconnect)
+
+        # Heartbeat поддерживает статус "в сети" (сервер ждёт его не реже раза в 30 секунд)
+        self.heartbeat_timer = QTimer()
+        self.heartbeat_timer.timeout.connect(self.send_heartbeat)
+        self.heartbeat_timer.start(10000)
 
     def show_chat_participants(self):
         if not self.current_chat:
             QMessageBox.warning(self, "Ошибка", "Выберите чат сначала")
             return
             
-        response = self.comm.send_message({
+        self.participants_button.setEnabled(False)
+        self.comm.call({
             'type': 'get_chat_participants',
             'chat_id': self.current_chat
-        })
-        
+        }, self.chat_participants_loaded)
+
+    def chat_participants_loaded(self, response):
+        self.participants_button.setEnabled(True)
         if response.get('status') == 'success':
             participants_window = ChatParticipantsWindow(response['participants'], self)
             participants_window.exec()
@@ -43,6 +69,7 @@ class ChatWindow(QWidget):
             QMessageBox.warning(self, "Ошибка", response.get('message', 'Не удалось получить участников'))
 
     def closeEvent(self, event):
+        self.cancel_history_requests()
         self.comm.close_connection()
         event.accept()
 
@@ -95,8 +122,16 @@ class ChatWindow(QWidget):
         self.chat_header = QLabel('Выберите чат')
         self.chat_header.setAlignment(Qt.AlignmentFlag.AlignCenter)
         
-        self.messages_area = QTextEdit()
-        self.messages_area.setReadOnly(True)
+        self.older_button = QPushButton('Показать более ранние сообщения')
+        self.older_button.clicked.connect(self.load_older_messages)
+        self.older_button.setVisible(False)
+
+        if MESSAGE_VIEW == 'text':
+            self.messages_area = ChatTextView(self.user_id)
+        else:
+            self.messages_area = MessageListView(self.user_id)
+        # Прокрутка к началу истории догружает более ранние сообщения
+        self.messages_area.older_requested.connect(self.load_older_messages)
         
         self.message_input = QTextEdit()
         self.message_input.setMaximumHeight(100)
@@ -106,6 +141,7 @@ class ChatWindow(QWidget):
         self.send_button.clicked.connect(self.send_message)
         
         chat_layout.addWidget(self.chat_header)
+        chat_layout.addWidget(self.older_button)
         chat_layout.addWidget(self.messages_area)
         chat_layout.addWidget(self.message_input)
         chat_layout.addWidget(self.send_button)
@@ -127,30 +163,49 @@ class ChatWindow(QWidget):
         
         self.setLayout(main_layout)
 
-        self.update_timer = QTimer()
-        self.update_timer.timeout.connect(self.update_current_chat)
-        self.update_timer.start(3000)  # Обновление каждые 3 секунды
-    
-    def update_current_chat(self):
+    def handle_server_event(self, event):
+        """Обрабатывает push-события сервера."""
+        kind = event.get('event')
+        chat_id = event.get('chat_id')
+
+        if kind == 'new_message':
+            if chat_id == self.current_chat:
+                self.load_messages(chat_id)
+        elif kind in ('chat_created', 'chat_renamed', 'participants_changed'):
+            self.load_chats()
+            if chat_id == self.current_chat:
+                if kind == 'chat_renamed':
+                    self.chat_header.setText(f"Чат: {event.get('name')}")
+                self.load_messages(chat_id)
+
+    def reload_after_reconnect(self):
+        """События, пришедшие без соединения, потеряны - загружаем заново
+        список чатов и новые сообщения текущего чата."""
+        self.load_chats()
         if self.current_chat:
             self.load_messages(self.current_chat)
 
+    def send_heartbeat(self):
+        self.comm.call({'type': 'heartbeat', 'user_id': self.user_id})
+
     def show_chat(self):
         """Возвращает пользователя в окно чата"""
         self.content_stack.setCurrentIndex(0)  # 0 - индекс виджета чата
 
     def load_chats(self):
-        response = self.comm.send_message({
+        self.comm.call({
             'type': 'get_chats',
             'user_id': self.user_id,
             'username': self.username
-        })
-        
+        }, self.chats_loaded)
+
+    def chats_loaded(self, response):
         if response.get('status') == 'success':
             self.chats_list.clear()
             for chat in response['chats']:
                 item = QListWidgetItem(chat['name'])
                 item.setData(Qt.ItemDataRole.UserRole, chat['id'])
+                item.setData(IS_GROUP_ROLE, chat.get('is_group', False))
                 self.chats_list.addItem(item)
                 
     def select_chat(self, item):
@@ -158,139 +213,106 @@ class ChatWindow(QWidget):
         self.current_chat = chat_id
         self.chat_header.setText(f"Чат: {item.text()}")
         self.content_stack.setCurrentIndex(0)  # Переключаемся на экран чата
+        # Ответы для прежнего чата больше не нужны
+        self.cancel_history_requests()
+        # Показываем уже отрисованную историю, затем догружаем новое
+        self.messages_area.show_chat(chat_id)
+        self.older_button.setVisible(self.has_older.get(chat_id, False))
         self.load_messages(chat_id)
         
-        # 👇 проверяем групповой ли чат
-        chats = self.comm.send_message({
-            'type': 'get_chats',
-            'user_id': self.user_id,
-            'username': self.username
-        })
-
-        if chats.get('status') == 'success':
-            current = next((c for c in chats['chats'] if c['id'] == chat_id), None)
-            if current and current.get('is_group', False):
-                self.rename_button.setVisible(True)
-                self.participants_button.setVisible(True)
-            else:
-                self.rename_button.setVisible(False)
-                self.participants_button.setVisible(False)
+        # Признак группового чата пришёл вместе со списком чатов
+        is_group = bool(item.data(IS_GROUP_ROLE))
+        self.rename_button.setVisible(is_group)
+        self.participants_button.setVisible(is_group)
+
+    def messages_request(self, chat_id):
+        request = {'type': 'get_messages', 'chat_id': chat_id, 'limit': self.page_size}
+        cached = self.chat_messages.get(chat_id)
+        if cached:
+            # Догружаем только сообщения новее последнего известного
+            request['after_id'] = cached[-1]['id']
+        return request
         
     def load_messages(self, chat_id):
-        response = self.comm.send_message({
-            'type': 'get_messages',
-            'chat_id': chat_id
-        })
-        
-        if response.get('status') == 'success':
-            self.messages_area.clear()
-            
-            html_output = """<html><head><style>
-                .message-block { 
-                    margin: 8px 0;
-                    display: flex;
-                    flex-direction: column;
-                }
-                .my-message-block {
-                    justify-content: flex-end;
-                }
-                .other-message-block {
-                    justify-content: flex-start;
-                }
-                .message-container {
-                    display: inline-block;
-                    max-width: 30%;
-                    margin: 2px 0;
-                }
-                .my-message, .other-message {
-                    border-radius: 15px;
-                    padding: 8px 12px;
-                    word-wrap: break-word;
-                    box-shadow: 0 1px 2px rgba(0,0,0,0.1);
-                }
-                .my-message {
-                    background-color: rgba(173, 216, 230, 0.5);
-                    border: 1px solid rgba(100, 180, 200, 0.3);
-                    margin-left: 20%;
-                    text-align: right;
-                    color: black;
-                }
-                .other-message {
-                    background-color: rgba(245, 245, 245, 0.5);
-                    border: 1px solid rgba(200, 200, 200, 0.3);
-                    margin-right: 20%;
-                    text-align: left;
-                    color: black;
-                }
-                .system-message {
-                    color: gray;
-                    font-style: italic;
-                    text-align: center;
-                    margin: 15px 0;
-                    font-size: 11px;
-                    padding: 5px;
-                }
-                .timestamp {
-                    font-size: 10px;
-                    color: #777;
-                    margin: 2px 8px 0 8px;
-                    padding: 0;
-                    background-color: transparent;
-                }
-                .timestamp-right {
-                    text-align: right;
-                }
-                .timestamp-left {
-                    text-align: left;
-                }
-                .username {
-                    font-size: 11px;
-                    font-weight: bold;
-                    margin: 0 8px 2px 8px;
-                    color: #9e9e9e;
-                    background-color: transparent;
-                }
-            </style></head><body>
-            """
+        if self.history_request is not None:
+            # Загрузка уже идёт - повторим её, когда придёт ответ
+            self.history_stale = True
+            return
+        request = self.messages_request(chat_id)
+        self.history_request = self.comm.call(request, partial(self.messages_loaded, chat_id, request.get('after_id')))
+
+    def messages_loaded(self, chat_id, after_id, response):
+        self.history_request = None
+        self.apply_messages(chat_id, after_id, response)
+        if self.history_stale:
+            self.history_stale = False
+            self.load_messages(chat_id)
+
+    def cancel_history_requests(self):
+        for request in (self.history_request, self.older_request):
+            if request is not None:
+                request.cancel()
+        self.history_request = self.older_request = None
+        self.history_stale = False
+
+    def apply_messages(self, chat_id, after_id, response, scroll_to_bottom=False):
+        """Применяет ответ get_messages, запрошенный от сообщения after_id
+        (None - последняя страница целиком)."""
+        if response.get('status') != 'success':
+            return
 
+        cached = self.chat_messages.get(chat_id)
+        if after_id != (cached[-1]['id'] if cached else None):
+            # Пока шёл запрос, история изменилась или была сброшена: ответ
+            # не стыкуется с ней - запрашиваем заново от текущего состояния
+            self.load_messages(chat_id)
+            return
+        if cached:
+            if response.get('has_more'):
+                # Пропущено больше страницы - начинаем заново с последней
+                del self.chat_messages[chat_id]
+                self.load_messages(chat_id)
+                return
+            new_messages = []
             for msg in response['messages']:
-                timestamp = datetime.fromisoformat(msg['timestamp']).strftime('%d.%m.%Y %H:%M')
-                text = msg['text'].replace('<', '&lt;').replace('>', '&gt;')  # защита от HTML
-                username = msg.get('username', '???')
-                is_system = msg.get('is_system', False)
-                is_mine = msg.get('user_id') == self.user_id
-
-                if is_system:
-                    html_output += f"""
-                        <div class="system-message">[{timestamp}] {text}</div>
-                    """
-                elif is_mine:
-                    html_output += f"""
-                        <div class="message-block my-message-block">
-                            <div class="message-container">
-                                <div class="my-message">{text}</div>
-                                <div class="timestamp timestamp-right">{timestamp}</div>
-                            </div>
-                        </div>
-                    """
+                if self.messages_area.contains(chat_id, msg['id']):
+                    self.messages_area.update_message(chat_id, msg)
                 else:
-                    html_output += f"""
-                        <div class="message-block other-message-block">
-                            <div class="message-container">
-                                <span class="username">{username}</span>
-                                <div class="other-message">{text}</div>
-                                <div class="timestamp timestamp-left">{timestamp}</div>
-                            </div>
-                        </div>
-                    """
-
-            html_output += "</body></html>"
-
-            self.messages_area.setHtml(html_output)
-
-            # Автопрокрутка вниз
-            self.messages_area.verticalScrollBar().setValue(
-                self.messages_area.verticalScrollBar().maximum())
+                    new_messages.append(msg)
+            if not new_messages:
+                return
+            cached.extend(new_messages)
+            self.messages_area.append_messages(chat_id, new_messages, scroll_to_bottom)
+        else:
+            self.chat_messages[chat_id] = response['messages']
+            self.has_older[chat_id] = response.get('has_more', False)
+            self.messages_area.reset_chat(chat_id, response['messages'])
+
+        if chat_id == self.current_chat:
+            self.older_button.setVisible(self.has_older.get(chat_id, False))
+
+    def load_older_messages(self):
+        chat_id = self.current_chat
+        cached = self.chat_messages.get(chat_id)
+        if not cached or not self.has_older.get(chat_id) or self.older_request is not None:
+            return
+
+        self.older_request = self.comm.call({
+            'type': 'get_messages',
+            'chat_id': chat_id,
+            'before_id': cached[0]['id'],
+            'limit': self.page_size
+        }, partial(self.older_messages_loaded, chat_id, cached[0]['id']))
+
+    def older_messages_loaded(self, chat_id, before_id, response):
+        self.older_request = None
+        cached = self.chat_messages.get(chat_id)
+        # Пока шёл запрос, история могла загрузиться заново
+        if response.get('status') == 'success' and cached and cached[0]['id'] == before_id:
+            self.chat_messages[chat_id] = response['messages'] + cached
+            self.has_older[chat_id] = response.get('has_more', False)
+            self.older_button.setVisible(self.has_older[chat_id])
+            self.messages_area.prepend_messages(chat_id, response['messages'])
    
     def send_message(self):
         if not self.current_chat:
@@ -301,16 +323,23 @@ class ChatWindow(QWidget):
         if not text:
             return
             
-        response = self.comm.send_message({
-            'type': 'send_message',
-            'user_id': self.user_id,
-            'chat_id': self.current_chat,
-            'text': text
-        })
-        
+        # Отправка и догрузка новых сообщений чата - одним пакетом
+        chat_id = self.current_chat
+        request = self.messages_request(chat_id)
+        self.send_button.setEnabled(False)
+        self.comm.call_batch([
+            {'type': 'send_message', 'user_id': self.user_id, 'chat_id': chat_id, 'text': text},
+            request
+        ], partial(self.message_sent, chat_id, text, request.get('after_id')))
+
+    def message_sent(self, chat_id, text, after_id, responses):
+        self.send_button.setEnabled(True)
+        response, messages = responses
         if response.get('status') == 'success':
-            self.message_input.clear()
-            self.load_messages(self.current_chat)
+            # Пока шла отправка, пользователь мог начать следующее сообщение
+            if self.message_input.toPlainText().strip() == text:
+                self.message_input.clear()
+            self.apply_messages(chat_id, after_id, messages, scroll_to_bottom=True)
             
     def show_users(self):
         users_window = UsersWindow(self.comm, self.user_id)
@@ -357,41 +386,34 @@ class ChatWindow(QWidget):
             QMessageBox.warning(self, "Ошибка", "Введите название")
             return
             
-        try:
-            response = self.comm.send_message({
-                'type': 'update_chat_name',
-                'chat_id': self.current_chat,
-                'new_name': new_name,
-                'user_id': self.user_id
-            })
-            
-            if not response:  # Если ответ пустой (разрыв соединения)
-                raise ConnectionError("No response from server")
-                
-            if response.get('status') == 'success':
-                dialog.accept()
-                self.load_chats()  # Обновляем список чатов
-                self.chat_header.setText(f"Чат: {new_name}")
-                self.load_messages(self.current_chat)  # Обновляем сообщения
-            else:
-                QMessageBox.warning(self, "Ошибка", response.get('message', 'Ошибка'))
-                
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка соединения", 
-                f"Не удалось изменить название чата: {str(e)}\n\nПопробуйте переподключиться.")
-            self.comm.close_connection()
+        chat_id = self.current_chat
+        dialog.setEnabled(False)  # до ответа сервера
+        self.comm.call({
+            'type': 'update_chat_name',
+            'chat_id': chat_id,
+            'new_name': new_name,
+            'user_id': self.user_id
+        }, partial(self.chat_renamed, chat_id, new_name, dialog))
 
-    def update_statuses(self):  
-        if self.current_chat:
-            self.load_messages(self.current_chat)
+    def chat_renamed(self, chat_id, new_name, dialog, response):
+        dialog.setEnabled(True)
+        if response.get('status') == 'success':
+            dialog.accept()
+            self.load_chats()  # Обновляем список чатов
+            if chat_id == self.current_chat:
+                self.chat_header.setText(f"Чат: {new_name}")
+                self.load_messages(chat_id)  # Обновляем сообщения
+        else:
+            QMessageBox.warning(self, "Ошибка", response.get('message', 'Ошибка'))
 
     def profile_updated(self):
         # Обновляем данные после изменения профиля
-        response = self.comm.send_message({
+        self.comm.call({
             'type': 'get_user_info',  # Убедитесь, что сервер поддерживает этот тип запроса
             'user_id': self.user_id
-        })
-        
+        }, self.user_info_loaded)
+
+    def user_info_loaded(self, response):
         if response.get('status') == 'success':
             self.username = response.get('username', self.username)
             self.name = response.get('name', self.name)
@@ -1,102 +1,413 @@
 import threading
 import socket
-import json
+import itertools
+import heapq
+import queue
+import time
+from collections import OrderedDict
+from functools import partial
+from concurrent.futures import CancelledError, Future, InvalidStateError, TimeoutError as FutureTimeoutError
 from PyQt6.QtCore import QObject, pyqtSignal
+from shared.protocols import (CODECS, COMPRESSIONS, DEFAULT_COMPRESSION_THRESHOLD, DEFAULT_MAX_FRAME_SIZE,
+                              JSON, Compression, FrameReader, encode_frame)
+
+# Сигнал потоку отправки завершиться
+_STOP = object()
+
+
+def _set_result(future, result):
+    """Завершает future, если его ещё не отменили (отмена идёт из другого потока)."""
+    try:
+        future.set_result(result)
+    except InvalidStateError:
+        pass
+
 
 class ClientCommunication(QObject):
+    # Незапрошенные кадры сервера (push-события: новые сообщения, изменения чатов)
     message_received = pyqtSignal(dict)
     connection_error = pyqtSignal(str)
-    
+    # Соединение восстановлено и вход повторён: всё, что пришло без
+    # соединения, нужно загрузить заново
+    reconnected = pyqtSignal()
+    # Готовый ответ асинхронного запроса: (Future, callback); доставляется
+    # в поток интерфейса очередью сигналов
+    response_ready = pyqtSignal(object, object)
+
     def __init__(self, host, port):
         super().__init__()
         self.host = host
         self.port = port
         self.socket = None
         self.connected = False
-        self.lock = threading.Lock()
+        self.lock = threading.RLock()
+        # Запросы, ожидающие ответа: req_id -> Future (в порядке отправки)
+        self.pending = OrderedDict()
+        self.pending_lock = threading.Lock()
+        self.req_ids = itertools.count(1)
+        self.reader_thread = None
+        # Подключение, отправка кадров и таймауты - в отдельном потоке,
+        # чтобы поток интерфейса никогда не ждал сеть
+        self.outbox = queue.Queue()
+        self.sender_thread = None
+        self.sender_lock = threading.Lock()
+        self.response_ready.connect(self._deliver)
         self.connection_timeout = 10  # секунд
         self.operation_timeout = 30   # секунд
-        
+        self.max_frame_size = DEFAULT_MAX_FRAME_SIZE
+        # Форматы кадров в порядке предпочтения; согласуются при подключении
+        self.codecs = [name for name in ('msgpack', 'json') if name in CODECS]
+        self.codec = JSON
+        # Алгоритмы сжатия в порядке предпочтения; счётчики - в self.compression
+        self.compression_methods = list(COMPRESSIONS)
+        self.compression_threshold = DEFAULT_COMPRESSION_THRESHOLD
+        self.compression = None
+        # Логин и пароль последнего успешного входа - для повторного входа
+        # после переподключения
+        self.credentials = None
+
     def connect_to_server(self):
         try:
             with self.lock:
-                if self.socket:
-                    self.socket.close()
-                
+                self._close_socket()
+                self._fail_pending({'status': 'error', 'message': 'Connection lost'})
+
                 self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.socket.settimeout(self.connection_timeout)
                 self.socket.connect((self.host, self.port))
+                reader = FrameReader(self.socket, max_frame_size=self.max_frame_size)
+                self._handshake(reader)
+                relogin = self.credentials is not None
+                if relogin:
+                    self._relogin(reader)
+                # Чтение ведёт отдельный поток, он ждёт кадры без таймаута
+                self.socket.settimeout(None)
+                self.reader_thread = threading.Thread(
+                    target=self._read_loop, args=(self.socket, reader), daemon=True)
+                self.reader_thread.start()
                 self.connected = True
-                return True
-                
+            if relogin:
+                self.reconnected.emit()
+            return True
+
         except Exception as e:
             self.connection_error.emit(f"Ошибка подключения: {str(e)}")
             self.connected = False
             return False
-            
-    def send_message(self, message):
+
+    def _handshake(self, reader):
+        """Согласует формат кадров и сжатие и подписывается на push-события
+        до запуска потока чтения.
+
+        Старый сервер ответит ошибкой 'Unknown message type' - тогда JSON без сжатия.
+        """
+        previous = self.compression
+        self.codec = reader.codec = JSON
+        self.compression = reader.compression = None
+        self.socket.sendall(encode_frame({
+            'type': 'hello', 'codecs': self.codecs, 'compression': self.compression_methods, 'events': True
+        }))
+        response = reader.read_message()
+        if not isinstance(response, dict) or response.get('status') != 'success':
+            return
+        self.codec = reader.codec = CODECS.get(response.get('codec'), JSON)
+        name = response.get('compression')
+        if name in COMPRESSIONS:
+            # Счётчики копятся между переподключениями, пока алгоритм тот же
+            if previous is None or previous.name != name:
+                previous = Compression(name, self.compression_threshold)
+            self.compression = reader.compression = previous
+
+    def _relogin(self, reader):
+        """Повторяет вход в новом соединении до запуска потока чтения:
+        события и heartbeat сервер принимает только от соединения, в
+        котором выполнен вход."""
+        req_id = next(self.req_ids)
+        self.socket.sendall(encode_frame(dict(self.credentials, type='login', req_id=req_id),
+                                         self.codec, self.compression))
+        while True:
+            response = reader.read_message()
+            if response is None:
+                raise ConnectionError("Connection closed during login")
+            # События до ответа не нужны: после входа данные загружаются заново
+            if isinstance(response, dict) and response.get('req_id') == req_id:
+                break
+        if response.get('status') != 'success':
+            # Пароль или логин сменили в другом месте - повторять бессмысленно
+            self.credentials = None
+            raise ConnectionError(f"Повторный вход не выполнен: {response.get('message')}")
+
+    def _track_credentials(self, message, future):
+        """Запоминает логин и пароль успешного входа и их смену в профиле."""
+        if future.cancelled() or future.result().get('status') != 'success':
+            return
+        if message['type'] == 'login':
+            self.credentials = {'username': message.get('username'), 'password': message.get('password')}
+        elif self.credentials is not None:
+            if 'new_username' in message:
+                self.credentials['username'] = message['new_username']
+            if 'new_password' in message:
+                self.credentials['password'] = message['new_password']
+
+    def _read_loop(self, sock, reader):
+        """Читает все кадры сервера: ответы сопоставляет с запросами по req_id,
+        события отдаёт через сигнал message_received."""
+        error = {'status': 'error', 'message': 'Server closed connection'}
+        try:
+            while True:
+                frame = reader.read_message()
+                if frame is None:
+                    break
+                if isinstance(frame, dict) and frame.get('type') == 'event':
+                    self.message_received.emit(frame)
+                else:
+                    self._resolve(frame)
+        except ValueError:
+            # JSONDecodeError и ошибки разбора MessagePack
+            error = {'status': 'error', 'message': 'Invalid server response'}
+        except Exception:
+            pass
+        # Соединение закрылось: будим все ожидающие запросы
+        if sock is self.socket:
+            self.connected = False
+            self._fail_pending(error)
+
+    def _resolve(self, response):
+        req_id = response.get('req_id') if isinstance(response, dict) else None
+        with self.pending_lock:
+            if req_id is not None:
+                future = self.pending.pop(req_id, None)
+            elif self.pending:
+                # Ответ без req_id (старый сервер, ошибка разбора кадра) -
+                # сервер отвечает по порядку, отдаём самому раннему запросу
+                _, future = self.pending.popitem(last=False)
+            else:
+                future = None
+        if future is None or future.done():
+            # Ответ на запрос, который уже отменён или истёк по таймауту
+            return
+        if isinstance(response, dict):
+            response.pop('req_id', None)
+        _set_result(future, response)
+
+    def _fail_pending(self, response):
+        with self.pending_lock:
+            futures = list(self.pending.values())
+            self.pending.clear()
+        for future in futures:
+            _set_result(future, dict(response))
+
+    def _register(self, future):
+        with self.pending_lock:
+            self.pending[future.req_id] = future
+
+    def _forget(self, req_id):
+        with self.pending_lock:
+            self.pending.pop(req_id, None)
+
+    def _fail(self, future, response):
+        self._forget(future.req_id)
+        _set_result(future, response)
+
+    def _ensure_sender(self):
+        with self.sender_lock:
+            if self.sender_thread is None:
+                self.sender_thread = threading.Thread(target=self._send_loop, args=(self.outbox,), daemon=True)
+                self.sender_thread.start()
+
+    def _send_loop(self, outbox):
+        """Поток отправки: берёт запросы из очереди, подключается при
+        необходимости, отправляет кадры и завершает запросы без ответа
+        ошибкой 'Timeout' через operation_timeout секунд."""
+        deadlines = []  # куча (срок, req_id)
+        while True:
+            timeout = max(0.0, deadlines[0][0] - time.monotonic()) if deadlines else None
+            try:
+                item = outbox.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            now = time.monotonic()
+            while deadlines and deadlines[0][0] <= now:
+                self._expire(heapq.heappop(deadlines)[1])
+            if item is None:
+                continue
+            if item is _STOP:
+                break
+            message, future = item
+            if future.done():
+                # Отменён, пока ждал в очереди
+                continue
+            heapq.heappush(deadlines, (now + self.operation_timeout, future.req_id))
+            self._send(message, future)
+
+        # Соединение закрыто: неотправленные запросы завершаются ошибкой
+        while True:
+            try:
+                item = outbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                _set_result(item[1], {'status': 'error', 'message': 'Connection closed'})
+
+    def _expire(self, req_id):
+        with self.pending_lock:
+            future = self.pending.pop(req_id, None)
+        if future is not None:
+            # Поздний ответ будет просто отброшен, остальные запросы не страдают
+            _set_result(future, {'status': 'error', 'message': 'Timeout'})
+
+    def _send(self, message, future):
         if not self.connected and not self.connect_to_server():
-            return {'status': 'error', 'message': 'Connection failed'}
-        
+            self._fail(future, {'status': 'error', 'message': 'Connection failed'})
+            return
         try:
+            # Ответ ждать не нужно: его сопоставит с запросом поток чтения
             with self.lock:
-                # Добавляем таймаут для операций
-                self.socket.settimeout(self.operation_timeout)
-                
-                data = json.dumps(message).encode('utf-8')
-                header = len(data).to_bytes(4, byteorder='big')
-                
-                # Отправка с проверкой
+                self._register(future)
                 try:
-                    self.socket.sendall(header + data)
+                    self.socket.sendall(encode_frame(message, self.codec, self.compression))
                 except (ConnectionResetError, BrokenPipeError):
                     self.connected = False
+                    # Переподключение завершает ошибкой все запросы старого соединения
                     if not self.connect_to_server():
-                        return {'status': 'error', 'message': 'Reconnection failed'}
-                    self.socket.sendall(header + data)
-                
-                # Получение ответа
-                try:
-                    header = self.socket.recv(4)
-                    if not header:
-                        raise ConnectionError("Server closed connection")
-                        
-                    response_size = int.from_bytes(header, byteorder='big')
-                    received = 0
-                    chunks = []
-                    
-                    while received < response_size:
-                        chunk = self.socket.recv(min(response_size - received, 4096))
-                        if not chunk:
-                            raise ConnectionError("Incomplete response")
-                        chunks.append(chunk)
-                        received += len(chunk)
-
-                    response = json.loads(b''.join(chunks).decode('utf-8'))
-                    return response
-                
-                except (socket.timeout, ConnectionResetError, BrokenPipeError):
-                    self.connected = False
-                    return {'status': 'error', 'message': 'Server closed connection'}
-                
-        except socket.timeout:
-            self.connected = False
-            return {'status': 'error', 'message': 'Timeout'}
-        except ConnectionResetError:
-            self.connected = False
-            return {'status': 'error', 'message': 'Connection reset by server'}
-        except json.JSONDecodeError:
-            self.connected = False
-            return {'status': 'error', 'message': 'Invalid server response'}
+                        self._fail(future, {'status': 'error', 'message': 'Reconnection failed'})
+                        return
+                    self._register(future)
+                    self.socket.sendall(encode_frame(message, self.codec, self.compression))
         except Exception as e:
             self.connected = False
-            return {'status': 'error', 'message': f'Communication error: {str(e)}'}
-            
+            self._fail(future, {'status': 'error', 'message': f'Communication error: {str(e)}'})
+
+    def send_request(self, message):
+        """Ставит запрос в очередь отправки и сразу возвращает Future с ответом.
+
+        Запросы конвейеризуются: по одному сокету может идти сколько угодно
+        запросов, ответы сопоставляются по req_id и могут приходить не по порядку.
+        future.cancel() отменяет запрос: ещё не отправленный не уйдёт на
+        сервер, ответ на отправленный будет отброшен.
+        """
+        future = Future()
+        future.req_id = next(self.req_ids)
+        if message.get('type') in ('login', 'update_profile'):
+            future.add_done_callback(partial(self._track_credentials, message))
+        self._ensure_sender()
+        self.outbox.put((dict(message, req_id=future.req_id), future))
+        return future
+
+    def send_batch_request(self, requests):
+        """Как send_batch, но сразу возвращает Future со списком ответов."""
+        result = Future()
+        batch = self.send_request({'type': 'batch', 'requests': requests})
+        # Отмена пакета отменяет и запросы, из которых он состоит
+        inner = [batch]
+
+        def cancel_inner(done):
+            if done.cancelled():
+                for future in inner:
+                    future.cancel()
+        result.add_done_callback(cancel_inner)
+
+        def batch_done(done):
+            if result.done():
+                return
+            response = self._outcome(done)
+            results = response.get('results')
+            if response.get('status') == 'success' and isinstance(results, list) and len(results) == len(requests):
+                _set_result(result, results)
+            elif response.get('message') == 'Unknown message type':
+                # Старому серверу без 'batch' запросы уходят конвейером по одному
+                futures = [self.send_request(request) for request in requests]
+                inner.extend(futures)
+                remaining = [len(futures)]
+                remaining_lock = threading.Lock()
+
+                def one_done(_):
+                    with remaining_lock:
+                        remaining[0] -= 1
+                        last = remaining[0] == 0
+                    if last and not result.done():
+                        _set_result(result, [self._outcome(future) for future in futures])
+                for future in futures:
+                    future.add_done_callback(one_done)
+            else:
+                _set_result(result, [dict(response) for _ in requests])
+
+        batch.add_done_callback(batch_done)
+        return result
+
+    def call(self, message, callback=None):
+        """Асинхронный запрос для интерфейса: callback(ответ) вызывается в
+        потоке интерфейса, если запрос не отменён. Возвращает Future."""
+        return self._notify(self.send_request(message), callback)
+
+    def call_batch(self, requests, callback=None):
+        """Асинхронный пакет: callback(список ответов) в потоке интерфейса."""
+        return self._notify(self.send_batch_request(requests), callback)
+
+    def _notify(self, future, callback):
+        if callback is not None:
+            future.add_done_callback(lambda done: self.response_ready.emit(done, callback))
+        return future
+
+    def _deliver(self, future, callback):
+        # Ответ мог прийти уже после отмены - тогда он никому не нужен
+        if not future.cancelled():
+            callback(future.result())
+
+    @staticmethod
+    def _outcome(future):
+        if future.cancelled():
+            return {'status': 'error', 'message': 'Cancelled'}
+        return future.result()
+
+    def wait_response(self, future):
+        try:
+            # Срок запроса отслеживает поток отправки; здесь - запас на случай,
+            # если запрос так и не дошёл до него
+            future.result(timeout=self.operation_timeout + 1)
+        except FutureTimeoutError:
+            self._forget(future.req_id)
+            return {'status': 'error', 'message': 'Timeout'}
+        except CancelledError:
+            pass
+        return self._outcome(future)
+
+    def send_message(self, message):
+        return self.wait_response(self.send_request(message))
+
+    def send_batch(self, requests):
+        """Выполняет несколько запросов за один обмен с сервером (в одной
+        сессии БД) и возвращает список ответов в том же порядке.
+
+        Старому серверу без 'batch' запросы уходят конвейером по одному.
+        """
+        future = self.send_batch_request(requests)
+        try:
+            return future.result(timeout=2 * self.operation_timeout + 1)
+        except (FutureTimeoutError, CancelledError):
+            future.cancel()
+            return [{'status': 'error', 'message': 'Timeout'} for _ in requests]
+
+    def _close_socket(self):
+        if self.socket:
+            try:
+                # shutdown будит поток чтения, заблокированный в recv
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                self.socket.close()
+            except:
+                pass
+
     def close_connection(self):
+        # Поток отправки завершается; следующий запрос запустит новый
+        with self.sender_lock:
+            if self.sender_thread is not None:
+                self.outbox.put(_STOP)
+                self.outbox = queue.Queue()
+                self.sender_thread = None
         with self.lock:
-            if self.socket:
-                try:
-                    self.socket.close()
-                except:
-                    pass
+            self._close_socket()
             self.connected = False
+        self._fail_pending({'status': 'error', 'message': 'Connection closed'})
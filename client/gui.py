@@ -5,14 +5,10 @@ from pathlib import Path
 from PyQt6.QtWidgets import QApplication
 from client.mainwindow import MainWindow
 from client.communication import ClientCommunication
+from shared.logconfig import setup_logging
 import logging
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='messenger.log'
-)
-logger = logging.getLogger(__name__)
+logger = logging.getLogger('client.gui')
 
 # Установка пути к Qt плагинам втлытлвытловы
 qt_plugin_path = Path(__file__).resolve().parent.parent / 'venv' / 'Lib' / 'site-packages' / 'PyQt6' / 'Qt6' / 'plugins'
@@ -39,6 +35,9 @@ class MessengerApp:
 
 
 if __name__ == "__main__":
+    # Запись в файл идёт в фоновом потоке и не тормозит интерфейс
+    setup_logging(default_file='client.log')
+
     # Проверка пути к плагинам
     if not qt_plugin_path.exists():
         print(f"ОШИБКА: Qt плагины не найдены по пути {qt_plugin_path}")
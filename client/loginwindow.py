@@ -1,6 +1,7 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QLineEdit, 
                             QPushButton)
 from PyQt6.QtCore import pyqtSignal, Qt
+from functools import partial
 import re
 
 class LoginWindow(QWidget):
@@ -58,12 +59,15 @@ class LoginWindow(QWidget):
             self.status_label.setText('Введите логин и пароль')
             return
             
-        response = self.comm.send_message({
+        self.login_button.setEnabled(False)
+        self.comm.call({
             'type': 'login',
             'username': username,
             'password': password
-        })
-        
+        }, partial(self.login_done, username))
+
+    def login_done(self, username, response):
+        self.login_button.setEnabled(True)
         if response.get('status') == 'success':
             self.login_success.emit(response['user_id'], username, response.get('name', ''))
         else:
@@ -100,12 +104,15 @@ class LoginWindow(QWidget):
             return
 
         # Отправляем запрос на сервер
-        response = self.comm.send_message({
+        self.register_button.setEnabled(False)
+        self.comm.call({
             'type': 'register',
             'username': username,
             'password': password
-        })
+        }, self.register_done)
 
+    def register_done(self, response):
+        self.register_button.setEnabled(True)
         if response.get('status') == 'success':
             self.status_label.setStyleSheet("color: green;")
             self.status_label.setText("Регистрация успешна. Теперь войдите.")
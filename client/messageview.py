@@ -0,0 +1,436 @@
+from collections import OrderedDict
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, QPointF, QRectF, QSize, Qt, pyqtSignal
+from PyQt6.QtGui import QColor, QFont, QPen, QTextLayout, QTextOption
+from PyQt6.QtWidgets import QAbstractItemView, QListView, QStyledItemDelegate
+from shared.protocols import to_datetime
+from .chatdocument import message_kind
+
+# Сообщение целиком (dict) в данных модели
+MESSAGE_ROLE = Qt.ItemDataRole.UserRole + 1
+
+# Геометрия и цвета пузырей - те же, что в стилях ChatDocument
+ROW_SPACING = 6
+SIDE_MARGIN = 8
+BUBBLE_PADDING_X = 12
+BUBBLE_PADDING_Y = 8
+BUBBLE_RADIUS = 15
+BUBBLE_WIDTH = 0.6  # доля ширины области сообщений
+MY_BUBBLE = (QColor(173, 216, 230, 128), QColor(100, 180, 200, 77))
+OTHER_BUBBLE = (QColor(245, 245, 245, 128), QColor(200, 200, 200, 77))
+TIMESTAMP_COLOR = QColor('#777777')
+USERNAME_COLOR = QColor('#9e9e9e')
+SYSTEM_COLOR = QColor('gray')
+
+# Размер окна истории в строках модели и шаг его сдвига
+WINDOW_ROWS = 300
+SLIDE_ROWS = 100
+
+
+class MessageListModel(QAbstractListModel):
+    """Загруженная история одного чата по возрастанию id.
+
+    Строками модели становится только окно истории [first, last) не больше
+    WINDOW_ROWS сообщений: QListView при любой вставке заново раскладывает
+    все строки, так что цена вставки не растёт с длиной истории. Окно
+    сдвигается, когда пользователь докручивает до его края.
+    """
+
+    def __init__(self, user_id, parent=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.messages = []
+        self.by_id = {}
+        self.first = self.last = 0
+        # Положение прокрутки при уходе из чата; None - внизу
+        self.scroll_value = None
+
+    def __contains__(self, message_id):
+        return message_id in self.by_id
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.last - self.first
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        message = self.messages[self.first + index.row()]
+        if role == MESSAGE_ROLE:
+            return message
+        if role == Qt.ItemDataRole.DisplayRole:
+            return message['text']
+        return None
+
+    def row_of(self, message_id):
+        for row in range(self.last - self.first):
+            if self.messages[self.first + row]['id'] == message_id:
+                return row
+        return None
+
+    def at_start(self):
+        return self.first == 0
+
+    def at_end(self):
+        return self.last == len(self.messages)
+
+    def _grow(self, first, last):
+        """Расширяет окно до [first, last)."""
+        if first < self.first:
+            self.beginInsertRows(QModelIndex(), 0, self.first - first - 1)
+            self.first = first
+            self.endInsertRows()
+        if last > self.last:
+            rows = self.last - self.first
+            self.beginInsertRows(QModelIndex(), rows, rows + last - self.last - 1)
+            self.last = last
+            self.endInsertRows()
+
+    def _trim(self, from_top):
+        """Убирает из окна лишние строки со стороны начала или конца."""
+        extra = self.last - self.first - WINDOW_ROWS
+        if extra <= 0:
+            return
+        if from_top:
+            self.beginRemoveRows(QModelIndex(), 0, extra - 1)
+            self.first += extra
+        else:
+            rows = self.last - self.first
+            self.beginRemoveRows(QModelIndex(), rows - extra, rows - 1)
+            self.last -= extra
+        self.endRemoveRows()
+
+    def append(self, messages):
+        if not messages:
+            return
+        at_end = self.at_end()
+        self.messages.extend(messages)
+        self.by_id.update((message['id'], message) for message in messages)
+        if at_end:
+            self._grow(self.first, len(self.messages))
+            self._trim(from_top=True)
+
+    def prepend(self, messages):
+        if not messages:
+            return
+        at_start = self.at_start()
+        self.messages[:0] = messages
+        self.by_id.update((message['id'], message) for message in messages)
+        self.first += len(messages)
+        self.last += len(messages)
+        if at_start:
+            self._grow(0, self.last)
+            self._trim(from_top=False)
+
+    def slide_up(self):
+        self._grow(max(0, self.first - SLIDE_ROWS), self.last)
+        self._trim(from_top=False)
+
+    def slide_down(self):
+        self._grow(self.first, min(len(self.messages), self.last + SLIDE_ROWS))
+        self._trim(from_top=True)
+
+    def jump_to_end(self):
+        if not self.at_end():
+            self.beginResetModel()
+            self.last = len(self.messages)
+            self.first = max(0, self.last - WINDOW_ROWS)
+            self.endResetModel()
+
+    def update(self, message):
+        """Заменяет сообщение, если его текст изменился."""
+        old = self.by_id.get(message['id'])
+        if old is None or old['text'] == message['text']:
+            return
+        position = self.messages.index(old)
+        self.messages[position] = self.by_id[message['id']] = message
+        if self.first <= position < self.last:
+            index = self.index(position - self.first)
+            self.dataChanged.emit(index, index)
+
+    def reset(self, messages):
+        self.beginResetModel()
+        self.messages = list(messages)
+        self.by_id = {message['id']: message for message in messages}
+        self.last = len(self.messages)
+        self.first = max(0, self.last - WINDOW_ROWS)
+        self.endResetModel()
+
+
+class RowLayout:
+    """Разложенный текст строки и положение её частей относительно строки."""
+
+    def __init__(self, kind, size, text, text_pos, bubble=None, header=None, header_pos=None,
+                 footer=None, footer_pos=None):
+        self.kind = kind
+        self.size = size
+        self.text = text
+        self.text_pos = text_pos
+        self.bubble = bubble
+        self.header = header
+        self.header_pos = header_pos
+        self.footer = footer
+        self.footer_pos = footer_pos
+
+
+def _text_layout(text, font, width):
+    """QTextLayout с переносом строк; возвращает (раскладка, ширина, высота)."""
+    # Переводы строк QTextLayout понимает только как разделитель строк
+    layout = QTextLayout(text.replace('\n', '\u2028'), font)
+    option = QTextOption()
+    option.setWrapMode(QTextOption.WrapMode.WrapAtWordBoundaryOrAnywhere)
+    layout.setTextOption(option)
+    layout.setCacheEnabled(True)
+    height = natural_width = 0.0
+    layout.beginLayout()
+    while True:
+        line = layout.createLine()
+        if not line.isValid():
+            break
+        line.setLineWidth(width)
+        line.setPosition(QPointF(0, height))
+        height += line.height()
+        natural_width = max(natural_width, line.naturalTextWidth())
+    layout.endLayout()
+    return layout, natural_width, height
+
+
+class MessageDelegate(QStyledItemDelegate):
+    """Рисует сообщения пузырями.
+
+    Раскладка текста строки строится при первом показе и хранится в
+    ограниченном кэше (последние cache_size строк), высоты строк - для всех
+    строк при текущей ширине: QListView запрашивает их при раскладке списка.
+    """
+
+    def __init__(self, user_id, parent=None, cache_size=500):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.cache_size = cache_size
+        self.layouts = OrderedDict()  # (id, текст, ширина) -> RowLayout
+        self.sizes = {}  # id -> (текст, ширина, QSize)
+
+    def fonts(self, font):
+        small = QFont(font)
+        if font.pointSizeF() > 0:
+            small.setPointSizeF(font.pointSizeF() * 0.85)
+        else:
+            small.setPixelSize(max(1, int(font.pixelSize() * 0.85)))
+        bold = QFont(small)
+        bold.setBold(True)
+        italic = QFont(small)
+        italic.setItalic(True)
+        return small, bold, italic
+
+    def row_layout(self, message, width, font):
+        key = (message['id'], message['text'], width)
+        layout = self.layouts.get(key)
+        if layout is not None:
+            self.layouts.move_to_end(key)
+            return layout
+
+        layout = self.build_layout(message, width, font)
+        self.layouts[key] = layout
+        if len(self.layouts) > self.cache_size:
+            self.layouts.popitem(last=False)
+        self.sizes[message['id']] = (message['text'], width, layout.size)
+        return layout
+
+    def build_layout(self, message, width, font):
+        small, bold, italic = self.fonts(font)
+        kind = message_kind(message, self.user_id)
+        timestamp = to_datetime(message['timestamp']).strftime('%d.%m.%Y %H:%M')
+
+        if kind == 'system':
+            text, text_width, text_height = _text_layout(
+                f"[{timestamp}] {message['text']}", italic, max(50, width - 2 * SIDE_MARGIN))
+            size = QSize(width, int(text_height) + 4 * ROW_SPACING)
+            return RowLayout(kind, size, text, QPointF((width - text_width) / 2, 2 * ROW_SPACING))
+
+        max_text_width = max(50, int(width * BUBBLE_WIDTH) - 2 * BUBBLE_PADDING_X)
+        text, text_width, text_height = _text_layout(message['text'], font, max_text_width)
+        footer, footer_width, footer_height = _text_layout(timestamp, small, max_text_width)
+        bubble_width = text_width + 2 * BUBBLE_PADDING_X
+        bubble_height = text_height + 2 * BUBBLE_PADDING_Y
+
+        top = ROW_SPACING
+        header = header_pos = None
+        if kind == 'other':
+            header, _, header_height = _text_layout(message.get('username', '???'), bold, max_text_width)
+            header_pos = QPointF(SIDE_MARGIN + SIDE_MARGIN, top)
+            top += header_height + 2
+            left = SIDE_MARGIN
+            footer_left = SIDE_MARGIN + SIDE_MARGIN
+        else:
+            left = width - SIDE_MARGIN - bubble_width
+            footer_left = width - SIDE_MARGIN - SIDE_MARGIN - footer_width
+
+        bubble = QRectF(left, top, bubble_width, bubble_height)
+        footer_top = top + bubble_height + 2
+        size = QSize(width, int(footer_top + footer_height) + ROW_SPACING)
+        return RowLayout(kind, size, text, QPointF(left + BUBBLE_PADDING_X, top + BUBBLE_PADDING_Y), bubble,
+                         header, header_pos, footer, QPointF(footer_left, footer_top))
+
+    def sizeHint(self, option, index):
+        message = index.data(MESSAGE_ROLE)
+        width = option.rect.width()
+        cached = self.sizes.get(message['id'])
+        if cached is not None and cached[0] == message['text'] and cached[1] == width:
+            return cached[2]
+        return self.row_layout(message, width, option.font).size
+
+    def paint(self, painter, option, index):
+        layout = self.row_layout(index.data(MESSAGE_ROLE), option.rect.width(), option.font)
+        origin = QPointF(option.rect.topLeft())
+        painter.save()
+        painter.setRenderHint(painter.RenderHint.Antialiasing)
+
+        if layout.kind == 'system':
+            painter.setPen(SYSTEM_COLOR)
+            layout.text.draw(painter, origin + layout.text_pos)
+            painter.restore()
+            return
+
+        if layout.header is not None:
+            painter.setPen(USERNAME_COLOR)
+            layout.header.draw(painter, origin + layout.header_pos)
+        background, border = MY_BUBBLE if layout.kind == 'mine' else OTHER_BUBBLE
+        painter.setPen(QPen(border, 1))
+        painter.setBrush(background)
+        painter.drawRoundedRect(layout.bubble.translated(origin), BUBBLE_RADIUS, BUBBLE_RADIUS)
+        painter.setPen(Qt.GlobalColor.black)
+        layout.text.draw(painter, origin + layout.text_pos)
+        painter.setPen(TIMESTAMP_COLOR)
+        layout.footer.draw(painter, origin + layout.footer_pos)
+        painter.restore()
+
+
+class MessageListView(QListView):
+    """История чатов в QListView: рисуются только видимые строки.
+
+    Для каждого чата своя модель; при переключении чата модель меняется,
+    положение прокрутки каждого чата сохраняется. Докрутка до края окна
+    модели сдвигает окно, до начала загруженной истории - испускает
+    older_requested, и окно догружает более ранние сообщения.
+    """
+
+    older_requested = pyqtSignal()
+
+    def __init__(self, user_id, parent=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.models = {}  # chat_id -> MessageListModel
+        self.follow = True  # держаться низа при изменении высоты содержимого
+        self.sliding = False
+        self.delegate = MessageDelegate(user_id, self)
+        self.setItemDelegate(self.delegate)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setUniformItemSizes(False)
+        self.verticalScrollBar().valueChanged.connect(self.scrolled)
+        self.verticalScrollBar().rangeChanged.connect(self.range_changed)
+
+    def model_for(self, chat_id):
+        model = self.models.get(chat_id)
+        if model is None:
+            model = self.models[chat_id] = MessageListModel(self.user_id, self)
+        return model
+
+    def scrolled(self, value):
+        model = self.model()
+        scrollbar = self.verticalScrollBar()
+        if self.sliding or not isinstance(model, MessageListModel):
+            return
+        self.follow = model.at_end() and value >= scrollbar.maximum() - 4
+        if value == scrollbar.minimum() and scrollbar.maximum() > 0:
+            if model.at_start():
+                self.older_requested.emit()
+            else:
+                self.anchored(model, model.slide_up)
+        elif value == scrollbar.maximum() and not model.at_end():
+            self.anchored(model, model.slide_down)
+
+    def range_changed(self, minimum, maximum):
+        # Высота строк известна только после раскладки (например, когда
+        # появилась полоса прокрутки и строки стали уже)
+        if self.follow and not self.sliding:
+            self.verticalScrollBar().setValue(maximum)
+
+    def anchored(self, model, change):
+        """Выполняет change(), не сдвигая видимые на экране сообщения."""
+        anchor = self.indexAt(self.viewport().rect().topLeft())
+        self.sliding = True
+        try:
+            if not anchor.isValid():
+                change()
+                return
+            message_id = anchor.data(MESSAGE_ROLE)['id']
+            offset = self.visualRect(anchor).top()
+            change()
+            self.executeDelayedItemsLayout()
+            row = model.row_of(message_id)
+            if row is not None:
+                scrollbar = self.verticalScrollBar()
+                scrollbar.setValue(scrollbar.value() + self.visualRect(model.index(row, 0)).top() - offset)
+        finally:
+            self.sliding = False
+            scrollbar = self.verticalScrollBar()
+            self.follow = model.at_end() and scrollbar.value() >= scrollbar.maximum() - 4
+
+    def scroll_to_bottom(self):
+        self.follow = True
+        self.executeDelayedItemsLayout()
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+
+    def contains(self, chat_id, message_id):
+        return message_id in self.model_for(chat_id)
+
+    def show_chat(self, chat_id):
+        previous = self.model()
+        if isinstance(previous, MessageListModel):
+            previous.scroll_value = None if self.follow else self.verticalScrollBar().value()
+        model = self.model_for(chat_id)
+        if model is previous:
+            return
+        # Модель выбора создаётся заново при каждой смене модели
+        selection = self.selectionModel()
+        self.sliding = True
+        self.setModel(model)
+        self.sliding = False
+        if selection is not None:
+            selection.deleteLater()
+        if model.scroll_value is None:
+            self.scroll_to_bottom()
+        else:
+            self.follow = False
+            self.executeDelayedItemsLayout()
+            self.verticalScrollBar().setValue(model.scroll_value)
+
+    def reset_chat(self, chat_id, messages):
+        model = self.model_for(chat_id)
+        model.reset(messages)
+        if model is self.model():
+            self.scroll_to_bottom()
+
+    def append_messages(self, chat_id, messages, scroll_to_bottom=False):
+        model = self.model_for(chat_id)
+        if model is not self.model():
+            model.append(messages)
+        elif scroll_to_bottom or self.follow:
+            model.jump_to_end()
+            model.append(messages)
+            self.scroll_to_bottom()
+        else:
+            self.anchored(model, lambda: model.append(messages))
+
+    def prepend_messages(self, chat_id, messages):
+        model = self.model_for(chat_id)
+        if model is not self.model():
+            model.prepend(messages)
+        else:
+            self.anchored(model, lambda: model.prepend(messages))
+
+    def update_message(self, chat_id, message):
+        self.model_for(chat_id).update(message)
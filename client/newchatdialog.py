@@ -48,11 +48,12 @@ class NewChatDialog(QDialog):
         self.load_users()
         
     def load_users(self):
-        response = self.comm.send_message({
+        self.comm.call({
             'type': 'get_users',
             'force_update': True
-        })
-        
+        }, self.users_loaded)
+
+    def users_loaded(self, response):
         if response.get('status') == 'success':
             self.users_list.clear()
             
@@ -102,25 +103,22 @@ class NewChatDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", "Для группового чата необходимо указать название")
             return
             
-        # Показываем индикатор загрузки
+        # Показываем индикатор загрузки до ответа сервера
         QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
-        
-        try:
-            response = self.comm.send_message({
-                'type': 'create_chat',
-                'user_id': self.user_id,
-                'participant_ids': participant_ids,
-                'is_group': len(participant_ids) > 2,
-                'name': chat_name if chat_name else None
-            })
-            
-            if response.get('status') == 'success':
-                QMessageBox.information(self, "Успех", "Чат успешно создан")
-                self.accept()
-            else:
-                QMessageBox.warning(self, "Ошибка", response.get('message', 'Не удалось создать чат'))
-                
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка соединения: {str(e)}")
-        finally:
-            QApplication.restoreOverrideCursor()
+        self.create_button.setEnabled(False)
+        self.comm.call({
+            'type': 'create_chat',
+            'user_id': self.user_id,
+            'participant_ids': participant_ids,
+            'is_group': len(participant_ids) > 2,
+            'name': chat_name if chat_name else None
+        }, self.chat_created)
+
+    def chat_created(self, response):
+        QApplication.restoreOverrideCursor()
+        self.create_button.setEnabled(True)
+        if response.get('status') == 'success':
+            QMessageBox.information(self, "Успех", "Чат успешно создан")
+            self.accept()
+        else:
+            QMessageBox.warning(self, "Ошибка", response.get('message', 'Не удалось создать чат'))
@@ -1,6 +1,7 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QLineEdit, 
                             QPushButton, QDialog, QHBoxLayout, QMessageBox)
 from PyQt6.QtCore import pyqtSignal, Qt
+from functools import partial
 
 class ProfileWidget(QWidget):
     update_success = pyqtSignal()
@@ -97,12 +98,15 @@ class ProfileWidget(QWidget):
             QMessageBox.warning(self, "Ошибка", "Введите новое имя")
             return
             
-        response = self.comm.send_message({
+        dialog.setEnabled(False)  # до ответа сервера
+        self.comm.call({
             'type': 'update_profile',
             'user_id': self.user_id,
             'new_name': new_name
-        })
-        
+        }, partial(self.name_saved, dialog, new_name))
+
+    def name_saved(self, dialog, new_name, response):
+        dialog.setEnabled(True)
         if response.get('status') == 'success':
             self.name = response.get('new_name', new_name)
             self.name_label.setText(f"Имя: {self.name}")
@@ -156,13 +160,16 @@ class ProfileWidget(QWidget):
             QMessageBox.warning(self, "Ошибка", "Введите пароль")
             return
             
-        response = self.comm.send_message({
+        dialog.setEnabled(False)
+        self.comm.call({
             'type': 'update_profile',
             'user_id': self.user_id,
             'new_username': new_username,
             'password': password
-        })
-        
+        }, partial(self.username_saved, dialog, new_username))
+
+    def username_saved(self, dialog, new_username, response):
+        dialog.setEnabled(True)
         if response.get('status') == 'success':
             self.username = response.get('new_username', new_username)
             self.username_label.setText(f"Логин: {self.username}")
@@ -223,13 +230,16 @@ class ProfileWidget(QWidget):
             QMessageBox.warning(self, "Ошибка", "Пароли не совпадают")
             return
             
-        response = self.comm.send_message({
+        dialog.setEnabled(False)
+        self.comm.call({
             'type': 'update_profile',
             'user_id': self.user_id,
             'old_password': old_password,
             'new_password': new_password
-        })
-        
+        }, partial(self.password_saved, dialog))
+
+    def password_saved(self, dialog, response):
+        dialog.setEnabled(True)
         if response.get('status') == 'success':
             dialog.accept()
             QMessageBox.information(self, "Успех", "Пароль успешно изменен")
@@ -1,6 +1,9 @@
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QListWidget, QPushButton, QListWidgetItem,
                             QMessageBox, QApplication)
 from PyQt6.QtCore import Qt
+import logging
+
+logger = logging.getLogger(__name__)
 
 class UsersWindow(QDialog):
     def __init__(self, comm, user_id):
@@ -30,16 +33,16 @@ class UsersWindow(QDialog):
         self.load_users()
         
     def load_users(self):
+        self.refresh_button.setEnabled(False)
+        # Явно запрашиваем обновление статусов
+        self.comm.call({
+            'type': 'get_users',
+            'force_update': True  # Флаг для принудительного обновления
+        }, self.users_loaded)
+
+    def users_loaded(self, response):
+        self.refresh_button.setEnabled(True)
         try:
-            # Явно запрашиваем обновление статусов
-            response = self.comm.send_message({
-                'type': 'get_users',
-                'force_update': True  # Флаг для принудительного обновления
-            })
-            
-            if not response:
-                raise ValueError("Пустой ответ от сервера")
-                
             if response.get('status') != 'success':
                 raise ValueError(response.get('message', 'Неизвестная ошибка сервера'))
                 
@@ -76,7 +79,7 @@ class UsersWindow(QDialog):
                 
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить пользователей: {str(e)}")
-            print(f"Error loading users: {e}")
+            logger.error("Error loading users: %s", e)
                 
     def create_chat_with_selected(self):
         selected = self.users_list.currentItem()
@@ -84,42 +87,33 @@ class UsersWindow(QDialog):
             QMessageBox.warning(self, "Ошибка", "Выберите пользователя")
             return
         
-        try:
-            # Показываем индикатор загрузки
-            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
-            
-            # Получаем ID выбранного пользователя
-            user_id = selected.data(Qt.ItemDataRole.UserRole)
-            
-            # Отправляем запрос с таймаутом
-            response = self.comm.send_message({
-                'type': 'create_chat',
-                'user_id': self.user_id,
-                'participant_ids': [self.user_id, user_id],
-                'is_group': False
-            })
-            
-            if not response:
-                raise ValueError("Не получен ответ от сервера")
-            
-            if response.get('status') == 'success':
-                if response.get('existing'):
-                    QMessageBox.information(self, "Успех", "Чат уже существует")
-                else:
-                    QMessageBox.information(self, "Успех", "Чат успешно создан")
-                self.accept()
-                # Обновляем список чатов
-                if hasattr(self.parent(), 'load_chats'):
-                    self.parent().load_chats()
+        # Показываем индикатор загрузки до ответа сервера
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        self.new_chat_button.setEnabled(False)
+        
+        # Получаем ID выбранного пользователя
+        user_id = selected.data(Qt.ItemDataRole.UserRole)
+        
+        # Срок ожидания ответа отслеживает ClientCommunication
+        self.comm.call({
+            'type': 'create_chat',
+            'user_id': self.user_id,
+            'participant_ids': [self.user_id, user_id],
+            'is_group': False
+        }, self.chat_created)
+
+    def chat_created(self, response):
+        QApplication.restoreOverrideCursor()
+        self.new_chat_button.setEnabled(True)
+        if response.get('status') == 'success':
+            if response.get('existing'):
+                QMessageBox.information(self, "Успех", "Чат уже существует")
             else:
-                error_msg = response.get('message', 'Неизвестная ошибка')
-                QMessageBox.critical(self, "Ошибка", f"Ошибка создания чата: {error_msg}")
-                
-        except Exception as e:
-            QMessageBox.critical(
-                self,
-                "Ошибка соединения",
-                f"Не удалось создать чат: {str(e)}\n\nПопробуйте еще раз."
-            )
-        finally:
-            QApplication.restoreOverrideCursor()
+                QMessageBox.information(self, "Успех", "Чат успешно создан")
+            self.accept()
+            # Обновляем список чатов
+            if hasattr(self.parent(), 'load_chats'):
+                self.parent().load_chats()
+        else:
+            error_msg = response.get('message', 'Неизвестная ошибка')
+            QMessageBox.critical(self, "Ошибка", f"Ошибка создания чата: {error_msg}")
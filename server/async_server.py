@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+from server import config
+from server.server import Server, logger
+from shared.protocols import JSON, FrameTooLarge, decode_payload, encode_frame, read_frame_async
+
+
+class AsyncClientConnection:
+    """Соединение asyncio-движка. Push-события приходят из потоков пула,
+    поэтому запись передаётся в цикл событий через call_soon_threadsafe."""
+
+    def __init__(self, writer, loop, addr, traffic=None):
+        self.writer = writer
+        self.loop = loop
+        self.addr = addr
+        self.traffic = traffic
+        self.user_id = None
+        self.codec = JSON
+        self.compression = None
+        self.events = False  # см. ClientConnection.events
+        self.closed = False  # см. ClientConnection.closed
+
+    def send(self, payload):
+        frame = encode_frame(payload, self.codec, self.compression)
+        if self.writer.is_closing():
+            raise ConnectionResetError("Connection closed")
+        self.loop.call_soon_threadsafe(self.writer.write, frame)
+        if self.traffic is not None:
+            self.traffic.frame_out(len(frame))
+
+
+class AsyncServer(Server):
+    """Движок на asyncio: вместо потока на соединение - корутина.
+
+    Протокол тот же (4 байта длины + JSON), обработчики те же;
+    блокирующая работа с БД выполняется в ограниченном пуле потоков.
+    """
+
+    def __init__(self, host=config.HOST, port=config.PORT, db_workers=config.DB_WORKERS):
+        super().__init__(host, port, db_workers)
+        self.server.listen(config.LISTEN_BACKLOG)
+        self.server.setblocking(False)
+        # Future записи сообщений, поставленных в очередь из цикла событий
+        self.submitted = {}
+
+    async def handle_client_async(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        loop = asyncio.get_running_loop()
+        connection = AsyncClientConnection(writer, loop, addr, self.traffic)
+        in_flight = asyncio.Semaphore(config.MAX_IN_FLIGHT)
+        tasks = set()
+        self.connection_opened()
+        logger.debug("[NEW CONNECTION] %s connected.", addr)
+
+        try:
+            while True:
+                try:
+                    received_data = await read_frame_async(
+                        reader, config.MAX_FRAME_SIZE, connection.compression, self.traffic)
+                except asyncio.IncompleteReadError:
+                    break
+                except FrameTooLarge as e:
+                    logger.warning("[FRAME TOO LARGE] %s: %s", addr, e)
+                    await self.send_response(connection, {'status': 'error', 'message': 'Frame too large'})
+                    break
+                if received_data is None:
+                    break
+
+                try:
+                    message = decode_payload(received_data, connection.codec)
+                except UnicodeDecodeError as e:
+                    logger.warning("[DECODE ERROR] %s: %s", addr, e)
+                    continue
+                except ValueError as e:
+                    # Ошибка разбора в согласованном формате - как в Server.handle_client
+                    logger.warning("[DECODE ERROR] %s: %s", addr, e)
+                    await self.send_response(connection, {'status': 'error', 'message': f'Invalid {connection.codec.label}'})
+                    continue
+
+                if not isinstance(message, dict):
+                    logger.warning("[PROCESSING ERROR] %s: Invalid message format", addr)
+                    break
+
+                if message.get('type') == 'hello':
+                    # Ответ уходит в прежнем формате, следующие кадры - в новом
+                    response, codec, compression = self.handshake(message)
+                    await self.send_response(connection, self.reply(message, response))
+                    connection.codec, connection.compression = codec, compression
+                    connection.events = response['events']
+                elif 'req_id' in message:
+                    # Конвейерный запрос: ответ уйдёт по готовности, читаем дальше
+                    await in_flight.acquire()
+                    task = asyncio.create_task(self.handle_request_async(connection, message, in_flight))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                else:
+                    # Старый клиент без req_id: никаких кадров, кроме ответов
+                    connection.events = False
+                    await self.handle_request_async(connection, message)
+
+        except (ConnectionResetError, BrokenPipeError):
+            logger.debug("[CONNECTION RESET] %s", addr)
+        except Exception as e:
+            logger.error("[CLIENT ERROR] %s: %s", addr, e)
+        finally:
+            # Ответы конвейерных запросов отправить уже некуда
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.connection_closed()
+            self.unregister_connection(connection, closed=True)
+            writer.close()
+            logger.debug("[DISCONNECTED] %s disconnected.", addr)
+
+    async def handle_request_async(self, connection, message, in_flight=None):
+        try:
+            requests = self.message_requests(message)
+            try:
+                await self.write_messages(requests)
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.process_message, message, connection.user_id, connection)
+            finally:
+                for request in requests:
+                    self.submitted.pop(id(request), None)
+            if message.get('type') == 'login' and response.get('status') == 'success':
+                self.register_connection(response.get('user_id'), connection)
+
+            try:
+                await self.send_response(connection, self.reply(message, response))
+            except (TypeError, ValueError) as e:
+                logger.error("Ошибка сериализации ответа для клиента %s: %s", connection.addr, e)
+                await self.send_response(connection, self.reply(
+                    message, {'status': 'error', 'message': f'Serialization error: {str(e)}'}))
+        except Exception as e:
+            if in_flight is None:
+                raise
+            # Ошибку конвейерного запроса некому поднять выше - только журнал
+            logger.debug("[PIPELINED REQUEST ERROR] %s: %s", connection.addr, e)
+        finally:
+            if in_flight is not None:
+                in_flight.release()
+
+    @staticmethod
+    def message_requests(message):
+        """Запросы send_message, которые можно записать до выполнения запроса:
+        сам send_message или send_message в начале пакета."""
+        if message.get('type') == 'send_message':
+            return [message]
+        requests = message.get('requests')
+        if message.get('type') != 'batch' or not isinstance(requests, list) \
+                or len(requests) > config.BATCH_MAX_REQUESTS:
+            return []
+        return list(itertools.takewhile(
+            lambda request: isinstance(request, dict) and request.get('type') == 'send_message', requests))
+
+    async def write_messages(self, requests):
+        """Ставит сообщения в очередь записи и ждёт commit в цикле событий.
+
+        Если ждать в обработчике, каждое ожидание занимает поток пула, и в
+        пачку записи попадает не больше DB_WORKERS сообщений. Обработчик
+        потом получает уже завершённый Future (см. submit_message).
+        """
+        if not requests:
+            return
+        futures = []
+        for request in requests:
+            future = super().submit_message(request)
+            self.submitted[id(request)] = future
+            futures.append(asyncio.wrap_future(future))
+        await asyncio.wait(futures, timeout=config.WRITE_TIMEOUT)
+
+    def submit_message(self, message):
+        future = self.submitted.pop(id(message), None)
+        if future is None:
+            return super().submit_message(message)
+        return future
+
+    async def send_response(self, connection, response):
+        writer = connection.writer
+        if writer.is_closing():
+            raise ConnectionResetError("Connection closed")
+        frame = encode_frame(response, connection.codec, connection.compression)
+        writer.write(frame)
+        self.traffic.frame_out(len(frame))
+        await writer.drain()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client_async, sock=self.server)
+        async with server:
+            await server.serve_forever()
+
+    def start(self):
+        raise_open_files_limit()
+        self.start_metrics()
+        print(f"[SERVER] Server (asyncio) is listening on {self.host}:{self.port}")
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("[SERVER] Shutting down...")
+        finally:
+            self.executor.shutdown(wait=False)
+            self.server.close()
+
+
+def raise_open_files_limit():
+    # Каждое соединение - дескриптор файла; поднимаем мягкий лимит до жёсткого
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
@@ -0,0 +1,83 @@
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+# Сетевые настройки сервера
+HOST = os.environ.get('MESSENGER_HOST', 'localhost')
+PORT = _env_int('MESSENGER_PORT', 5555)
+
+# Движок обработки соединений: 'threads' (поток на клиента) или 'asyncio'
+ENGINE = os.environ.get('MESSENGER_ENGINE', 'threads')
+
+# Очередь входящих соединений для listen()
+LISTEN_BACKLOG = _env_int('MESSENGER_LISTEN_BACKLOG', 1024)
+
+# Размер пула потоков для блокирующей работы с БД в asyncio-движке
+DB_WORKERS = _env_int('MESSENGER_DB_WORKERS', 16)
+
+# Размер страницы истории в get_messages (по умолчанию и максимальный)
+MESSAGES_PAGE_SIZE = _env_int('MESSENGER_MESSAGES_PAGE_SIZE', 100)
+MESSAGES_PAGE_MAX = _env_int('MESSENGER_MESSAGES_PAGE_MAX', 500)
+
+# База данных
+DATABASE_URL = os.environ.get('MESSENGER_DATABASE_URL', 'sqlite:///messenger.db')
+
+# PRAGMA для SQLite, выполняются на каждом новом соединении
+SQLITE_JOURNAL_MODE = os.environ.get('MESSENGER_SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('MESSENGER_SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = _env_int('MESSENGER_SQLITE_BUSY_TIMEOUT_MS', 5000)
+SQLITE_CACHE_SIZE_KB = _env_int('MESSENGER_SQLITE_CACHE_SIZE_KB', 65536)
+SQLITE_MMAP_SIZE = _env_int('MESSENGER_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+SQLITE_TEMP_STORE = os.environ.get('MESSENGER_SQLITE_TEMP_STORE', 'MEMORY')
+
+# Пул соединений (потоки обработчиков берут соединения из общего пула)
+DB_POOL_SIZE = _env_int('MESSENGER_DB_POOL_SIZE', 20)
+DB_MAX_OVERFLOW = _env_int('MESSENGER_DB_MAX_OVERFLOW', 10)
+DB_POOL_TIMEOUT = _env_int('MESSENGER_DB_POOL_TIMEOUT', 30)
+
+# Периодическое обслуживание БД: PRAGMA optimize и incremental_vacuum (секунды, 0 - выключено)
+DB_MAINTENANCE_INTERVAL = _env_int('MESSENGER_DB_MAINTENANCE_INTERVAL', 3600)
+SQLITE_INCREMENTAL_VACUUM_PAGES = _env_int('MESSENGER_SQLITE_INCREMENTAL_VACUUM_PAGES', 1000)
+
+# Групповая запись сообщений: одна транзакция на пачку
+WRITE_BATCH_SIZE = _env_int('MESSENGER_WRITE_BATCH_SIZE', 256)
+WRITE_BATCH_DELAY_MS = _env_int('MESSENGER_WRITE_BATCH_DELAY_MS', 2)
+WRITE_TIMEOUT = _env_int('MESSENGER_WRITE_TIMEOUT', 30)
+
+# Статусы пользователей: пользователь считается вне сети, если heartbeat
+# не приходил PRESENCE_TTL секунд; last_seen пишется в БД раз в PRESENCE_FLUSH_INTERVAL
+PRESENCE_TTL = _env_int('MESSENGER_PRESENCE_TTL', 30)
+PRESENCE_FLUSH_INTERVAL = _env_int('MESSENGER_PRESENCE_FLUSH_INTERVAL', 30)
+
+# Кэш членства в чатах (LRU): сколько чатов и пользователей держать в памяти
+MEMBERSHIP_CACHE_CHATS = _env_int('MESSENGER_MEMBERSHIP_CACHE_CHATS', 10000)
+MEMBERSHIP_CACHE_USERS = _env_int('MESSENGER_MEMBERSHIP_CACHE_USERS', 10000)
+
+# Максимальный размер кадра протокола (байт); больший кадр закрывает соединение
+MAX_FRAME_SIZE = _env_int('MESSENGER_MAX_FRAME_SIZE', 16 * 1024 * 1024)
+
+# Сколько запросов с req_id одно соединение может держать в обработке одновременно
+MAX_IN_FLIGHT = _env_int('MESSENGER_MAX_IN_FLIGHT', 64)
+
+# Форматы тела кадра, которые сервер готов согласовать в запросе 'hello'
+CODECS = [name.strip() for name in os.environ.get('MESSENGER_CODECS', 'msgpack,json').split(',') if name.strip()]
+
+# Сжатие кадров: алгоритмы, которые сервер готов согласовать (пусто - выключено),
+# минимальный размер сжимаемого кадра и уровень сжатия (не задан - 3)
+COMPRESSION = [name.strip() for name in os.environ.get('MESSENGER_COMPRESSION', 'zstd,zlib').split(',') if name.strip()]
+COMPRESSION_THRESHOLD = _env_int('MESSENGER_COMPRESSION_THRESHOLD', 1024)
+COMPRESSION_LEVEL = _env_int('MESSENGER_COMPRESSION_LEVEL', None)
+
+# Максимум запросов в одном пакете (запрос 'batch')
+BATCH_MAX_REQUESTS = _env_int('MESSENGER_BATCH_MAX_REQUESTS', 50)
+
+# Токен для служебного запроса admin_stats; пустой - запрос отключён
+ADMIN_TOKEN = os.environ.get('MESSENGER_ADMIN_TOKEN', '')
+
+# Метрики в формате Prometheus: GET http://METRICS_HOST:METRICS_PORT/metrics (порт 0 - выключено)
+METRICS_HOST = os.environ.get('MESSENGER_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = _env_int('MESSENGER_METRICS_PORT', 9555)
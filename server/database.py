@@ -1,18 +1,99 @@
-from sqlalchemy import create_engine
+import logging
+import threading
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from server import config
 from server.models import Base 
 
-DATABASE_URL = "sqlite:///messenger.db"
+logger = logging.getLogger(__name__)
 
-engine = create_engine(DATABASE_URL)
+DATABASE_URL = config.DATABASE_URL
+
+def _is_sqlite_file(url):
+    return url.startswith('sqlite') and ':memory:' not in url and url not in ('sqlite://', 'sqlite:///')
+
+def create_db_engine(url=None, **settings):
+    """Создаёт движок SQLAlchemy с настройками из server/config.py.
+
+    Любую настройку можно переопределить аргументом, например
+    create_db_engine('sqlite:///bench.db', synchronous='OFF').
+    """
+    url = url or DATABASE_URL
+    options = {
+        'journal_mode': config.SQLITE_JOURNAL_MODE,
+        'synchronous': config.SQLITE_SYNCHRONOUS,
+        'busy_timeout': config.SQLITE_BUSY_TIMEOUT_MS,
+        'cache_size_kb': config.SQLITE_CACHE_SIZE_KB,
+        'mmap_size': config.SQLITE_MMAP_SIZE,
+        'temp_store': config.SQLITE_TEMP_STORE,
+        'pool_size': config.DB_POOL_SIZE,
+        'max_overflow': config.DB_MAX_OVERFLOW,
+        'pool_timeout': config.DB_POOL_TIMEOUT,
+    }
+    options.update(settings)
+
+    if not _is_sqlite_file(url):
+        return create_engine(url)
+
+    engine = create_engine(
+        url,
+        # Соединения из пула используются разными потоками обработчиков
+        connect_args={'check_same_thread': False, 'timeout': options['busy_timeout'] / 1000},
+        poolclass=QueuePool,
+        pool_size=options['pool_size'],
+        max_overflow=options['max_overflow'],
+        pool_timeout=options['pool_timeout'],
+    )
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # auto_vacuum действует только для новой БД (или после VACUUM)
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute(f"PRAGMA journal_mode = {options['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous = {options['synchronous']}")
+        cursor.execute(f"PRAGMA busy_timeout = {int(options['busy_timeout'])}")
+        # Отрицательное значение cache_size - размер в килобайтах
+        cursor.execute(f"PRAGMA cache_size = -{int(options['cache_size_kb'])}")
+        cursor.execute(f"PRAGMA mmap_size = {int(options['mmap_size'])}")
+        cursor.execute(f"PRAGMA temp_store = {options['temp_store']}")
+        cursor.close()
+
+    return engine
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+def run_maintenance(db_engine=None, vacuum_pages=None):
+    """PRAGMA optimize обновляет статистику планировщика, incremental_vacuum
+    возвращает свободные страницы (если БД создана с auto_vacuum=INCREMENTAL)."""
+    db_engine = db_engine or engine
+    if vacuum_pages is None:
+        vacuum_pages = config.SQLITE_INCREMENTAL_VACUUM_PAGES
+    if db_engine.dialect.name != 'sqlite':
+        return
+    with db_engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            conn.exec_driver_sql(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+
+def start_maintenance(interval=None, db_engine=None):
+    """Запускает фоновый поток обслуживания БД. Возвращает Event для остановки."""
+    interval = config.DB_MAINTENANCE_INTERVAL if interval is None else interval
+    stop = threading.Event()
+    if interval <= 0:
+        return stop
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                run_maintenance(db_engine)
+            except Exception as e:
+                logger.error("[DB MAINTENANCE ERROR] %s", e)
+
+    threading.Thread(target=loop, name='db-maintenance', daemon=True).start()
+    return stop
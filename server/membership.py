@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from server import config
+from server.models import ChatParticipant
+
+
+class MembershipCache:
+    """Кэш состава чатов: chat_id -> frozenset(user_id) и user_id -> frozenset(chat_id).
+
+    Заполняется по требованию из сессии обработчика, вытесняет давно не
+    использованные записи (LRU). Изменения состава регистрируются через
+    invalidate_on_commit() и применяются только после успешного commit
+    сессии; при откате они отбрасываются.
+
+    Загруженное значение кэшируется, только если с начала транзакции
+    сессии сброса не было: иначе её снимок БД мог не увидеть изменение.
+    """
+
+    def __init__(self, session_factory, max_chats=config.MEMBERSHIP_CACHE_CHATS,
+                 max_users=config.MEMBERSHIP_CACHE_USERS):
+        self.max_chats = max_chats
+        self.max_users = max_users
+        self.chats = OrderedDict()
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+        # Растёт при каждом сбросе: загрузка, начатая до сброса, не попадёт в кэш
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.info_key = ('membership_cache', id(self))
+        self.generation_key = ('membership_generation', id(self))
+
+        event.listen(session_factory, 'after_begin', self._after_begin)
+        event.listen(session_factory, 'after_transaction_end', self._after_transaction_end)
+        event.listen(session_factory, 'after_commit', self._after_commit)
+        event.listen(session_factory, 'after_soft_rollback', self._after_rollback)
+
+    def chat_members(self, db, chat_id):
+        return self._get(db, self.chats, self.max_chats, chat_id, lambda: frozenset(
+            row.user_id for row in
+            db.query(ChatParticipant.user_id).filter(ChatParticipant.chat_id == chat_id)
+        ))
+
+    def user_chats(self, db, user_id):
+        return self._get(db, self.users, self.max_users, user_id, lambda: frozenset(
+            row.chat_id for row in
+            db.query(ChatParticipant.chat_id).filter(ChatParticipant.user_id == user_id)
+        ))
+
+    def is_member(self, db, chat_id, user_id):
+        return user_id in self.chat_members(db, chat_id)
+
+    def _get(self, db, cache, max_size, key, load):
+        with self.lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+            # Поколение на начало транзакции сессии (если она уже идёт):
+            # сброс после него мог пройти мимо её снимка
+            generation = db.info.get(self.generation_key, self.generation)
+
+        value = load()
+
+        with self.lock:
+            if generation == self.generation:
+                cache[key] = value
+                cache.move_to_end(key)
+                while len(cache) > max_size:
+                    cache.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate_on_commit(self, db, chat_ids=(), user_ids=()):
+        """Запоминает, какие записи сбросить после commit этой сессии."""
+        pending_chats, pending_users = db.info.setdefault(self.info_key, (set(), set()))
+        pending_chats.update(chat_ids)
+        pending_users.update(user_ids)
+
+    def invalidate(self, chat_ids=(), user_ids=()):
+        with self.lock:
+            self.generation += 1
+            for chat_id in chat_ids:
+                self.chats.pop(chat_id, None)
+            for user_id in user_ids:
+                self.users.pop(user_id, None)
+            self.invalidations += 1
+
+    def _after_begin(self, session, transaction, connection):
+        with self.lock:
+            session.info.setdefault(self.generation_key, self.generation)
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            session.info.pop(self.generation_key, None)
+
+    def _after_commit(self, session):
+        pending = session.info.pop(self.info_key, None)
+        if pending:
+            self.invalidate(*pending)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop(self.info_key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'chats_cached': len(self.chats),
+                'users_cached': len(self.users),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,262 @@
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlalchemy import event
+
+# Границы корзин гистограммы задержек, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (без блокировки - её держит владелец)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина - больше всех границ
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        return histogram
+
+    def cumulative(self):
+        """Пары (верхняя граница, число наблюдений не больше неё), как в Prometheus."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Оценка квантиля сверху: верхняя граница корзины, где он находится."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': _bound(self.quantile(0.5)),
+            'p95': _bound(self.quantile(0.95)),
+            'p99': _bound(self.quantile(0.99)),
+            'buckets': [[_bound(bound), total] for bound, total in self.cumulative()],
+        }
+
+
+def _bound(value):
+    # Бесконечность не сериализуется в строгий JSON
+    return '+Inf' if value == float('inf') else value
+
+
+class RequestMetrics:
+    """Счётчики вызовов и ошибок и гистограммы задержек по типам сообщений."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = {}
+        self.latency = {}
+
+    def record(self, msg_type, seconds, error=False):
+        with self.lock:
+            self.calls[msg_type] = self.calls.get(msg_type, 0) + 1
+            if error:
+                self.errors[msg_type] = self.errors.get(msg_type, 0) + 1
+            histogram = self.latency.get(msg_type)
+            if histogram is None:
+                histogram = self.latency[msg_type] = Histogram()
+            histogram.observe(seconds)
+
+    def histograms(self):
+        """[(тип, вызовы, ошибки, копия гистограммы)] - для экспорта метрик."""
+        with self.lock:
+            return [
+                (msg_type, calls, self.errors.get(msg_type, 0), self.latency[msg_type].copy())
+                for msg_type, calls in self.calls.items()
+            ]
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                msg_type: {
+                    'calls': calls,
+                    'errors': self.errors.get(msg_type, 0),
+                    'latency': self.latency[msg_type].snapshot(),
+                }
+                for msg_type, calls in self.calls.items()
+            }
+
+
+class TrafficMetrics:
+    """Кадры и байты (как на проводе, с заголовком) в обе стороны."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+
+    def frame_in(self, size):
+        with self.lock:
+            self.frames_in += 1
+            self.bytes_in += size
+
+    def frame_out(self, size):
+        with self.lock:
+            self.frames_out += 1
+            self.bytes_out += size
+
+
+class DatabaseMetrics:
+    """Число и длительность SQL-запросов по видам (события движка) и
+    длительность commit сессий (flush + фиксация)."""
+
+    KINDS = ('select', 'insert', 'update', 'delete')
+
+    def __init__(self, engine, session_factory):
+        self.lock = threading.Lock()
+        self.queries = {}
+        self.query_latency = {}
+        self.query_errors = 0
+        self.commit_latency = Histogram()
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._on_error)
+        event.listen(session_factory, 'before_commit', self._before_commit)
+        event.listen(session_factory, 'after_commit', self._after_commit)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.metrics_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        kind = statement.lstrip()[:6].lower()
+        if kind not in self.KINDS:
+            kind = 'other'
+        with self.lock:
+            self.queries[kind] = self.queries.get(kind, 0) + 1
+            histogram = self.query_latency.get(kind)
+            if histogram is None:
+                histogram = self.query_latency[kind] = Histogram()
+            histogram.observe(elapsed)
+
+    def _on_error(self, context):
+        with self.lock:
+            self.query_errors += 1
+
+    def _before_commit(self, session):
+        session.info['metrics_commit_started'] = time.perf_counter()
+
+    def _after_commit(self, session):
+        started = session.info.pop('metrics_commit_started', None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.commit_latency.observe(elapsed)
+
+    def snapshot(self):
+        with self.lock:
+            return (
+                [(kind, count, self.query_latency[kind].copy()) for kind, count in self.queries.items()],
+                self.query_errors,
+                self.commit_latency.copy(),
+            )
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusText:
+    """Собирает ответ в текстовом формате Prometheus (0.0.4).
+
+    Строки группируются по имени метрики: формат требует, чтобы все
+    значения одного семейства шли подряд после его HELP и TYPE.
+    """
+
+    def __init__(self):
+        self.families = {}
+
+    def _family(self, name, kind, help_text):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        return family
+
+    def counter(self, name, help_text, value, **labels):
+        self._family(name, 'counter', help_text).append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    def gauge(self, name, help_text, value, **labels):
+        self._family(name, 'gauge', help_text).append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    def histogram(self, name, help_text, histogram, **labels):
+        family = self._family(name, 'histogram', help_text)
+        for bound, total in histogram.cumulative():
+            bucket_labels = dict(labels, le=_format_value(bound))
+            family.append(f'{name}_bucket{_format_labels(bucket_labels)} {total}')
+        family.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}')
+        family.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+    def render(self):
+        return '\n'.join(line for family in self.families.values() for line in family) + '\n'
+
+
+def start_metrics_server(host, port, collect):
+    """Отдаёт GET /metrics на отдельном порту в фоновом потоке.
+
+    collect() возвращает текст метрик; он собирается только по запросу,
+    поэтому между опросами эндпоинт ничего не стоит.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = collect().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # опросы раз в несколько секунд не должны засорять журнал
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name='metrics-http', daemon=True).start()
+    return httpd
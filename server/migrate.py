@@ -1,6 +1,17 @@
+import importlib.util
+from pathlib import Path
 from sqlalchemy import text
 from .database import engine  # Изменено с server.database
 
+MIGRATIONS_DIR = Path(__file__).resolve().parent / 'migrations'
+
+def load_migration(filename):
+    # Имена файлов миграций начинаются с цифр, обычный import не подходит
+    spec = importlib.util.spec_from_file_location(filename[:-3], MIGRATIONS_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
 def run_migrations():
     print("Начало применения миграций...")
     with engine.connect() as conn:
@@ -23,5 +34,12 @@ def run_migrations():
             conn.commit()
             print("Поле is_system добавлено в messages")
 
+    # Индексы создаются с IF NOT EXISTS, поэтому шаг можно повторять
+    load_migration('002_add_indexes.py').upgrade()
+    print("Индексы сообщений и участников чатов созданы")
+
+    load_migration('003_direct_chats.py').upgrade()
+    print("Таблица личных чатов direct_chats заполнена")
+
 if __name__ == "__main__":
     run_migrations()
\ No newline at end of file
@@ -0,0 +1,36 @@
+from sqlalchemy import text
+from server.database import engine
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_messages_chat_id_id ON messages (chat_id, id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_chat_participants_chat_id_user_id ON chat_participants (chat_id, user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_chat_participants_user_id_chat_id ON chat_participants (user_id, chat_id)",
+]
+
+def upgrade():
+    # engine.begin() фиксирует транзакцию сам, работает и в SQLAlchemy 1.4, и в 2.0
+    with engine.begin() as conn:
+        # Уникальный индекс не построится при дублях участников - оставляем
+        # первую запись, а удаляемые перечисляем, чтобы изменение данных было видно
+        duplicates = conn.execute(text(
+            "SELECT id, chat_id, user_id FROM chat_participants WHERE id NOT IN "
+            "(SELECT MIN(id) FROM chat_participants GROUP BY chat_id, user_id) ORDER BY id"
+        )).fetchall()
+        if duplicates:
+            print(f"Удаление повторяющихся записей chat_participants: {len(duplicates)}")
+            for row_id, chat_id, user_id in duplicates:
+                print(f"  id={row_id} chat_id={chat_id} user_id={user_id}")
+            conn.execute(
+                text("DELETE FROM chat_participants WHERE id = :id"),
+                [{'id': row_id} for row_id, _, _ in duplicates]
+            )
+        for statement in INDEXES:
+            conn.execute(text(statement))
+        # Обновляем статистику планировщика
+        conn.execute(text("ANALYZE"))
+
+def downgrade():
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_messages_chat_id_id"))
+        conn.execute(text("DROP INDEX IF EXISTS ux_chat_participants_chat_id_user_id"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_chat_participants_user_id_chat_id"))
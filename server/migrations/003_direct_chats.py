@@ -0,0 +1,26 @@
+from sqlalchemy import text
+from server.database import engine
+
+def upgrade():
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS direct_chats ("
+            "user_low_id INTEGER NOT NULL REFERENCES users (id), "
+            "user_high_id INTEGER NOT NULL REFERENCES users (id), "
+            "chat_id INTEGER NOT NULL UNIQUE REFERENCES chats (id), "
+            "PRIMARY KEY (user_low_id, user_high_id))"
+        ))
+        # Заполняем из существующих личных чатов; при дублях пары остаётся самый старый чат
+        conn.execute(text(
+            "INSERT OR IGNORE INTO direct_chats (user_low_id, user_high_id, chat_id) "
+            "SELECT MIN(cp.user_id), MAX(cp.user_id), cp.chat_id "
+            "FROM chat_participants cp JOIN chats c ON c.id = cp.chat_id "
+            "WHERE c.is_group = 0 "
+            "GROUP BY cp.chat_id "
+            "HAVING COUNT(DISTINCT cp.user_id) = 2 "
+            "ORDER BY cp.chat_id"
+        ))
+
+def downgrade():
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS direct_chats"))
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -30,6 +30,12 @@ class Chat(Base):
 
 class ChatParticipant(Base):
     __tablename__ = 'chat_participants'
+    __table_args__ = (
+        # Проверка членства и список участников чата
+        Index('ux_chat_participants_chat_id_user_id', 'chat_id', 'user_id', unique=True),
+        # Список чатов пользователя
+        Index('ix_chat_participants_user_id_chat_id', 'user_id', 'chat_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -40,6 +46,10 @@ class ChatParticipant(Base):
 
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # История чата с курсором по id
+        Index('ix_messages_chat_id_id', 'chat_id', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -49,4 +59,16 @@ class Message(Base):
     is_system = Column(Boolean, default=False)
     
     user = relationship("User", back_populates="messages")
-    chat = relationship("Chat", back_populates="messages")
\ No newline at end of file
+    chat = relationship("Chat", back_populates="messages")
+
+class DirectChat(Base):
+    """Личный чат двух пользователей: пара (меньший id, больший id) -> чат.
+
+    Первичный ключ по упорядоченной паре делает поиск личного чата
+    одним обращением к индексу и не даёт создать второй такой же чат.
+    """
+    __tablename__ = 'direct_chats'
+
+    user_low_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    user_high_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    chat_id = Column(Integer, ForeignKey('chats.id'), unique=True, nullable=False)
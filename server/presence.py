@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import bindparam, update
+from server import config
+from server.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """Статусы пользователей в памяти сервера.
+
+    Пользователь в сети с момента входа (или heartbeat) и до закрытия
+    последнего соединения либо истечения ttl без heartbeat. Истечение
+    отслеживает колесо таймеров: heartbeat кладёт пользователя в слот
+    своего срока за O(1), каждый тик обходит только один слот.
+    Изменения online/last_seen копятся и пишутся в БД пачкой в flush().
+    """
+
+    def __init__(self, ttl=config.PRESENCE_TTL, tick=1.0):
+        self.tick = tick
+        self.ttl_ticks = max(1, int(ttl / tick))
+        # Слотов больше, чем тиков в ttl, чтобы колесо не перекрывало сроки
+        self.slots = [set() for _ in range(self.ttl_ticks + 1)]
+        self.current_tick = 0
+        self.deadlines = {}     # user_id -> тик истечения (есть только у тех, кто в сети)
+        self.connections = {}   # user_id -> число открытых соединений
+        self.last_seen = {}     # user_id -> datetime последней активности
+        self.dirty = set()      # пользователи с несохранёнными изменениями
+        self.lock = threading.Lock()
+
+    def _touch(self, user_id):
+        expires = self.current_tick + self.ttl_ticks
+        self.deadlines[user_id] = expires
+        self.slots[expires % len(self.slots)].add(user_id)
+        self.last_seen[user_id] = datetime.utcnow()
+        self.dirty.add(user_id)
+
+    def _set_offline(self, user_id):
+        if self.deadlines.pop(user_id, None) is not None:
+            self.last_seen[user_id] = datetime.utcnow()
+            self.dirty.add(user_id)
+
+    def connect(self, user_id):
+        with self.lock:
+            self.connections[user_id] = self.connections.get(user_id, 0) + 1
+            self._touch(user_id)
+
+    def disconnect(self, user_id):
+        with self.lock:
+            count = self.connections.get(user_id, 0) - 1
+            if count > 0:
+                self.connections[user_id] = count
+                return
+            self.connections.pop(user_id, None)
+            self._set_offline(user_id)
+
+    def heartbeat(self, user_id):
+        with self.lock:
+            self._touch(user_id)
+
+    def advance(self):
+        """Один тик колеса: переводит в оффлайн тех, чей срок истёк."""
+        with self.lock:
+            self.current_tick += 1
+            slot = self.slots[self.current_tick % len(self.slots)]
+            for user_id in slot:
+                # В слоте могут остаться устаревшие записи - срок уже продлён
+                if self.deadlines.get(user_id) == self.current_tick:
+                    self._set_offline(user_id)
+            slot.clear()
+
+    def is_online(self, user_id):
+        return user_id in self.deadlines
+
+    def online_count(self):
+        return len(self.deadlines)
+
+    def flush(self, session_factory):
+        """Записывает накопленные online/last_seen одним executemany."""
+        with self.lock:
+            if not self.dirty:
+                return 0
+            updates = [
+                {'user_id': user_id, 'online': user_id in self.deadlines, 'last_seen': self.last_seen[user_id]}
+                for user_id in self.dirty
+            ]
+            self.dirty = set()
+
+        db = session_factory()
+        try:
+            # Core executemany: несуществующие id просто не обновляются
+            db.execute(
+                update(User.__table__)
+                .where(User.__table__.c.id == bindparam('user_id'))
+                .values(online=bindparam('online'), last_seen=bindparam('last_seen')),
+                updates
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self.lock:
+                self.dirty.update(row['user_id'] for row in updates)
+            raise
+        finally:
+            db.close()
+        return len(updates)
+
+    def start(self, session_factory, flush_interval=config.PRESENCE_FLUSH_INTERVAL):
+        """Фоновый поток: тики колеса и периодическая запись в БД."""
+        stop = threading.Event()
+
+        def loop():
+            next_flush = time.monotonic() + flush_interval
+            while not stop.wait(self.tick):
+                self.advance()
+                if time.monotonic() >= next_flush:
+                    next_flush = time.monotonic() + flush_interval
+                    try:
+                        self.flush(session_factory)
+                    except Exception as e:
+                        logger.error("[PRESENCE FLUSH ERROR] %s", e)
+            self.flush(session_factory)
+
+        threading.Thread(target=loop, name='presence', daemon=True).start()
+        return stop
@@ -1,144 +1,367 @@
 import socket
-from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 import threading
-import json
-from server.database import get_db, init_db
-from .models import User, Chat, Message, ChatParticipant
+import time
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from server import config
+from server.database import SessionLocal, engine, init_db, start_maintenance
+from server.membership import MembershipCache
+from server.metrics import DatabaseMetrics, PrometheusText, RequestMetrics, TrafficMetrics, start_metrics_server
+from server.presence import PresenceTracker
+from server.writer import MessageWriter
+from .models import User, Chat, Message, ChatParticipant, DirectChat
 from sqlalchemy.orm import Session
 from datetime import datetime
 from Crypto.Hash import SHA256
+from shared.protocols import (CODECS, COMPRESSIONS, JSON, Compression, FrameReader, FrameTooLarge,
+                              choose_codec, choose_compression, encode_frame)
 import logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='messenger.log'
-)
-logger = logging.getLogger(__name__)
+# Имя задано явно: при запуске через -m __name__ равен '__main__', а уровни
+# подсистем (MESSENGER_LOG_LEVELS) настраиваются по имени модуля
+logger = logging.getLogger('server.server')
+
+class HandlerInfo:
+    def __init__(self, method, write, user=False):
+        self.method = method
+        self.write = write
+        self.user = user
+
+
+# Реестр обработчиков: тип сообщения -> метод Server и признак записи в БД
+HANDLERS = {}
+
+
+def handler(msg_type, write=False, user=False):
+    """Регистрирует метод Server как обработчик сообщений типа msg_type.
+
+    write=True - обработчик изменяет БД и получает отдельную сессию;
+    обработчики только для чтения используют сессию потока.
+    user=True - обработчик третьим аргументом получает id пользователя,
+    вошедшего в этом соединении (None, если вход не выполнен).
+    """
+    def register(method):
+        HANDLERS[msg_type] = HandlerInfo(method.__name__, write, user)
+        return method
+    return register
+
+
+class ClientConnection:
+    """Сокет клиента. Ответы и push-события пишутся из разных потоков,
+    поэтому отправка кадра выполняется под блокировкой."""
+
+    def __init__(self, conn, addr, traffic=None):
+        self.conn = conn
+        self.addr = addr
+        self.traffic = traffic
+        self.user_id = None
+        self.codec = JSON
+        self.compression = None
+        # Push-события - только клиентам, которые запросили их в 'hello'
+        # и сопоставляют ответы по req_id: старый клиент принял бы событие
+        # за ответ на свой запрос
+        self.events = False
+        # Выставляется при закрытии под clients_lock: конвейерный вход,
+        # завершившийся позже, не зарегистрирует закрытое соединение
+        self.closed = False
+        self.send_lock = threading.Lock()
+        # Ограничение числа одновременно обрабатываемых запросов с req_id
+        self.in_flight = threading.Semaphore(config.MAX_IN_FLIGHT)
+
+    def send(self, payload):
+        frame = encode_frame(payload, self.codec, self.compression)
+        with self.send_lock:
+            self.conn.sendall(frame)
+        if self.traffic is not None:
+            self.traffic.frame_out(len(frame))
 
 class Server:
-    def __init__(self, host='localhost', port=5555):
+    def __init__(self, host='localhost', port=5555, db_workers=config.DB_WORKERS):
         self.host = host
         self.port = port
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.bind((self.host, self.port))
         self.server.listen()
-        self.clients = {}
+        self.clients = {}  # user_id -> множество открытых соединений
+        self.clients_lock = threading.Lock()
+        self.sessions = threading.local()
+        self.request_metrics = RequestMetrics()
+        self.traffic = TrafficMetrics()
+        self.active_connections = 0
+        self.connections_lock = threading.Lock()
+        # Пул для запросов с req_id: они обрабатываются параллельно,
+        # ответы уходят по готовности, не дожидаясь предыдущих
+        self.executor = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix='db')
+        # Один объект на алгоритм: счётчики сжатия общие для всех соединений
+        self.compressions = {
+            name: Compression(name, config.COMPRESSION_THRESHOLD, config.COMPRESSION_LEVEL)
+            for name in COMPRESSIONS
+        }
         self.init_database()
         
     def init_database(self):
         init_db()
+        self.maintenance_stop = start_maintenance()
+        self.message_writer = MessageWriter()
+        self.presence = PresenceTracker()
+        self.presence_stop = self.presence.start(SessionLocal)
+        self.membership = MembershipCache(SessionLocal)
+        self.db_metrics = DatabaseMetrics(engine, SessionLocal)
         
     def hash_password(self, password):
         return SHA256.new(password.encode()).hexdigest()
         
     def handle_client(self, conn, addr):
-        print(f"[NEW CONNECTION] {addr} connected.")
-        user_id = None
-        db = next(get_db())
+        logger.debug("[NEW CONNECTION] %s connected.", addr)
+        connection = ClientConnection(conn, addr, self.traffic)
+        reader = FrameReader(conn, max_frame_size=config.MAX_FRAME_SIZE, stats=self.traffic)
+        self.connection_opened()
         
         try:
             while True:
                 try:
-                    # Читаем заголовок с размером данных (4 байта)
-                    header = conn.recv(4)
-                    if not header:
+                    # Кадр читается в буфер соединения и разбирается прямо из него
+                    frame = reader.read_frame()
+                    if frame is None:
                         break
-                        
-                    data_size = int.from_bytes(header, byteorder='big')
-                    
-                    # Получаем данные частями
-                    received_data = b''
-                    while len(received_data) < data_size:
-                        chunk = conn.recv(min(data_size - len(received_data), 4096))
-                        if not chunk:
-                            raise ConnectionError("Connection broken")
-                        received_data += chunk
-                    
-                    # Декодируем и парсим JSON
-                    message = json.loads(received_data.decode('utf-8'))
+                    try:
+                        message = reader.codec.decode(frame)
+                    except UnicodeDecodeError as e:
+                        logger.warning("[DECODE ERROR] %s: %s", addr, e)
+                        continue
+                    except ValueError as e:
+                        # Ошибка разбора в согласованном формате (JSON или MessagePack).
+                        # Границы кадров не нарушены - отвечаем ошибкой и читаем дальше
+                        logger.warning("[DECODE ERROR] %s: %s", addr, e)
+                        connection.send({'status': 'error', 'message': f'Invalid {connection.codec.label}'})
+                        continue
                     
                     if not isinstance(message, dict):
-                        raise ValueError("Invalid message format")
-                        
-                    if message.get('type') == 'login':
-                        user_id = message.get('user_id')
-                    
-                    try:
-                        response = self.process_message(message)
-                        response_data = json.dumps(response, default=str).encode('utf-8')
-                        conn.send(len(response_data).to_bytes(4, byteorder='big'))
-                        conn.sendall(response_data)
-                    except Exception as e:
-                        logger.error(f"Ошибка сериализации ответа для клиента {addr}: {e}")
-                        error_response = {'status': 'error', 'message': f'Serialization error: {str(e)}'}
-                        error_data = json.dumps(error_response).encode('utf-8')
-                        conn.send(len(error_data).to_bytes(4, byteorder='big'))
-                        conn.sendall(error_data)
+                        logger.warning("[PROCESSING ERROR] %s: Invalid message format", addr)
+                        break
+
+                    if message.get('type') == 'hello':
+                        # Ответ уходит в прежнем формате, следующие кадры - в новом
+                        response, codec, compression = self.handshake(message)
+                        connection.send(self.reply(message, response))
+                        connection.codec = reader.codec = codec
+                        connection.compression = reader.compression = compression
+                        connection.events = response['events']
+                    elif 'req_id' in message:
+                        # Конвейерный запрос: читаем следующий кадр, не дожидаясь ответа
+                        connection.in_flight.acquire()
+                        self.executor.submit(self.handle_pipelined, connection, message)
+                    else:
+                        # Старые клиенты без req_id получают ответы строго по порядку
+                        # и никаких кадров, кроме ответов
+                        connection.events = False
+                        self.handle_request(connection, message)
                     
-                except json.JSONDecodeError as e:
-                    print(f"[JSON ERROR] {addr}: {e}")
-                    error_response = {'status': 'error', 'message': 'Invalid JSON'}
-                    error_data = json.dumps(error_response).encode('utf-8')
-                    conn.send(len(error_data).to_bytes(4, byteorder='big'))
-                    conn.sendall(error_data)
-                except UnicodeDecodeError as e:
-                    print(f"[DECODE ERROR] {addr}: {e}")
-                    continue
+                except FrameTooLarge as e:
+                    # Остаток кадра не читаем - синхронизация потока потеряна
+                    logger.warning("[FRAME TOO LARGE] %s: %s", addr, e)
+                    connection.send({'status': 'error', 'message': 'Frame too large'})
+                    break
                 except Exception as e:
-                    print(f"[PROCESSING ERROR] {addr}: {e}")
+                    logger.warning("[PROCESSING ERROR] %s: %s", addr, e)
                     break
                     
         except ConnectionResetError:
-            print(f"[CONNECTION RESET] {addr}")
+            logger.debug("[CONNECTION RESET] %s", addr)
         except Exception as e:
-            print(f"[CLIENT ERROR] {addr}: {e}")
+            logger.error("[CLIENT ERROR] %s: %s", addr, e)
         finally:
-            if user_id:
-                try:
-                    user = db.query(User).filter(User.id == user_id).first()
-                    if user:
-                        user.online = False
-                        user.last_seen = datetime.utcnow()
-                        db.commit()
-                except Exception as e:
-                    print(f"Error updating user status: {e}")
+            self.connection_closed()
+            self.unregister_connection(connection, closed=True)
             conn.close()
-            print(f"[DISCONNECTED] {addr} disconnected.")
-            
-    def process_message(self, message):
-        db = next(get_db())
+            logger.debug("[DISCONNECTED] %s disconnected.", addr)
+
+    def handshake(self, message):
+        """Согласование формата кадров и сжатия: клиент перечисляет варианты
+        в порядке предпочтения, сервер выбирает первый поддерживаемый
+        (иначе JSON без сжатия). 'events': true подписывает соединение на
+        push-события."""
+        codec = choose_codec(message.get('codecs'), config.CODECS)
+        compression = choose_compression(message.get('compression'), config.COMPRESSION)
+        response = {
+            'status': 'success',
+            'codec': codec.name,
+            'codecs': [name for name in config.CODECS if name in CODECS],
+            'compression': compression,
+            'events': bool(message.get('events')),
+        }
+        return response, codec, self.compressions.get(compression)
+
+    def handle_request(self, connection, message):
         try:
-            msg_type = message.get('type')
+            response = self.process_message(message, connection.user_id, connection)
+            if message.get('type') == 'login' and response.get('status') == 'success':
+                self.register_connection(response.get('user_id'), connection)
+            connection.send(self.reply(message, response))
+        except OSError:
+            # Соединение закрыто - ответ отправить некуда
+            raise
+        except Exception as e:
+            logger.error("Ошибка сериализации ответа для клиента %s: %s", connection.addr, e)
+            connection.send(self.reply(message, {'status': 'error', 'message': f'Serialization error: {str(e)}'}))
+
+    def handle_pipelined(self, connection, message):
+        try:
+            self.handle_request(connection, message)
+        except OSError as e:
+            logger.debug("Не удалось отправить ответ %s: %s", connection.addr, e)
+        finally:
+            connection.in_flight.release()
+
+    @staticmethod
+    def reply(message, response):
+        """Возвращает ответ с req_id запроса, чтобы клиент сопоставил его с запросом."""
+        if 'req_id' not in message:
+            return response
+        return dict(response, req_id=message['req_id'])
+
+    def connection_opened(self):
+        with self.connections_lock:
+            self.active_connections += 1
+
+    def connection_closed(self):
+        with self.connections_lock:
+            self.active_connections -= 1
+
+    def register_connection(self, user_id, connection):
+        with self.clients_lock:
+            if connection.closed:
+                # Соединение закрылось, пока выполнялся вход
+                return
+            self._detach_connection(connection)
+            connection.user_id = user_id
+            self.clients.setdefault(user_id, set()).add(connection)
+            self.presence.connect(user_id)
+
+    def unregister_connection(self, connection, closed=False):
+        """Убирает соединение из вошедших; closed=True - соединение закрыто
+        и больше не регистрируется."""
+        with self.clients_lock:
+            if closed:
+                connection.closed = True
+            self._detach_connection(connection)
+
+    def _detach_connection(self, connection):
+        # Вызывается под clients_lock, чтобы учёт присутствия не разошёлся
+        # со списком соединений при одновременных входе и закрытии
+        if connection.user_id is None:
+            return
+        connections = self.clients.get(connection.user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self.clients[connection.user_id]
+        self.presence.disconnect(connection.user_id)
+        connection.user_id = None
+
+    def push_to_users(self, user_ids, event, exclude=None):
+        """Рассылает событие открытым соединениям указанных пользователей,
+        подписанным на события; exclude - соединение, которому не отправлять."""
+        with self.clients_lock:
+            connections = [c for uid in set(user_ids) for c in self.clients.get(uid, ())
+                           if c.events and c is not exclude]
+        for connection in connections:
+            try:
+                connection.send(event)
+            except OSError as e:
+                logger.debug("Не удалось отправить событие %s: %s", connection.addr, e)
+
+    def notify_chat(self, db: Session, chat_id, event, extra_user_ids=(), exclude=None):
+        """Отправляет событие всем участникам чата, находящимся в сети.
+
+        Вызывается после commit, поэтому список участников уже актуален.
+        """
+        user_ids = list(self.membership.chat_members(db, chat_id))
+        user_ids.extend(extra_user_ids)
+        event = dict(event, type='event', chat_id=chat_id)
+        self.push_to_users(user_ids, event, exclude)
             
-            if msg_type == 'register':
-                return self.register_user(db, message)
-            elif msg_type == 'login':
-                return self.login_user(db, message)
-            elif msg_type == 'get_chats':
-                return self.get_user_chats(db, message)
-            elif msg_type == 'get_messages':
-                return self.get_chat_messages(db, message)
-            elif msg_type == 'send_message':
-                return self.save_message(db, message)
-            elif msg_type == 'create_chat':
-                return self.create_chat(db, message)
-            elif msg_type == 'update_profile':
-                return self.update_profile(db, message)
-            elif msg_type == 'get_users':
-                return self.get_all_users(db, message)
-            elif msg_type == 'update_chat_name':
-                return self.update_chat_name(db, message)
-            elif msg_type == 'get_chat_participants':
-                return self.get_chat_participants(db, message)
-            elif msg_type == 'remove_participant':
-                return self.remove_chat_participant(db, message)
-            elif msg_type == 'add_participant':
-                return self.add_chat_participant(db, message)
-            else:
-                return {'status': 'error', 'message': 'Unknown message type'}
+    def process_message(self, message, user_id=None, connection=None):
+        """Выполняет запрос; user_id - пользователь, вошедший в соединении,
+        connection - соединение, от которого пришёл запрос."""
+        entry = HANDLERS.get(message.get('type'))
+        if entry is not None and entry.write:
+            # Изменяющим запросам - своя сессия: чистая карта объектов и
+            # отложенные инвалидации кэша не смешиваются с другими запросами
+            db = SessionLocal()
+        else:
+            db = self.reader_session()
+        self.sessions.connection = connection
+        try:
+            return self.dispatch(db, message, user_id)
         finally:
+            self.sessions.connection = None
+            # close() возвращает соединение в пул; сессию чтения можно использовать снова
             db.close()
 
+    def reader_session(self):
+        """Сессия для запросов только на чтение, одна на поток.
+
+        В движке threads поток обслуживает одно соединение, так что это
+        сессия соединения; конвейерные запросы и asyncio-движок используют
+        сессию потока пула.
+        """
+        db = getattr(self.sessions, 'db', None)
+        if db is None:
+            db = self.sessions.db = SessionLocal()
+        return db
+
+    @handler('batch', write=True, user=True)
+    def process_batch(self, db: Session, message, user_id):
+        """Выполняет список запросов в одной сессии БД и возвращает ответы
+        в том же порядке. Ошибка одного запроса не прерывает остальные."""
+        requests = message.get('requests')
+        if not isinstance(requests, list):
+            return {'status': 'error', 'message': 'Batch requires a list of requests'}
+        if len(requests) > config.BATCH_MAX_REQUESTS:
+            return {'status': 'error', 'message': 'Too many requests in batch'}
+
+        results = []
+        for request in requests:
+            if not isinstance(request, dict) or request.get('type') in ('batch', 'hello', 'login'):
+                results.append({'status': 'error', 'message': 'Invalid batch request'})
+                continue
+            try:
+                results.append(self.dispatch(db, request, user_id))
+            except Exception as e:
+                # Откатываем незавершённую транзакцию, чтобы сессия годилась для следующих
+                db.rollback()
+                logger.error("Ошибка запроса %s в пакете: %s", request.get('type'), e)
+                results.append({'status': 'error', 'message': f'Request failed: {str(e)}'})
+        return {'status': 'success', 'results': results}
+
+    def dispatch(self, db: Session, message, user_id=None):
+        msg_type = message.get('type')
+        entry = HANDLERS.get(msg_type)
+        if entry is None:
+            # Неизвестные типы учитываем под одним именем, чтобы не плодить метрики
+            self.request_metrics.record('unknown', 0.0, error=True)
+            return {'status': 'error', 'message': 'Unknown message type'}
+
+        started = time.perf_counter()
+        error = True
+        try:
+            if entry.user:
+                response = getattr(self, entry.method)(db, message, user_id)
+            else:
+                response = getattr(self, entry.method)(db, message)
+            error = not isinstance(response, dict) or response.get('status') == 'error'
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            self.request_metrics.record(msg_type, elapsed, error)
+            # Событие на каждый запрос: в журнал попадает выборка (MESSENGER_LOG_DEBUG_SAMPLE)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("request %s %.2f ms", msg_type, elapsed * 1000,
+                             extra={'request_type': msg_type, 'duration_ms': round(elapsed * 1000, 3),
+                                    'error': error})
+
+    @handler('update_profile', write=True)
     def update_profile(self, db: Session, message):
         user_id = message.get('user_id')
         user = db.query(User).filter(User.id == user_id).first()
@@ -176,6 +399,7 @@ class Server:
         db.commit()
         return response
 
+    @handler('register', write=True)
     def register_user(self, db: Session, message):
         username = message.get('username')
         password = message.get('password')
@@ -194,6 +418,7 @@ class Server:
         
         return {'status': 'success', 'message': 'User registered successfully'}
         
+    @handler('login')
     def login_user(self, db: Session, message):
         username = message.get('username')
         password = message.get('password')
@@ -202,10 +427,6 @@ class Server:
         if not user or user.password_hash != self.hash_password(password):
             return {'status': 'error', 'message': 'Invalid credentials'}
         
-        user.online = True
-        user.last_seen = datetime.utcnow()
-        db.commit()
-        
         return {
             'status': 'success', 
             'message': 'Login successful', 
@@ -213,50 +434,124 @@ class Server:
             'name': user.name if user.name else username
         }
         
+    @handler('get_chats')
     def get_user_chats(self, db: Session, message):
         user_id = message.get('user_id')
-        chats = db.query(Chat).join(ChatParticipant).filter(ChatParticipant.user_id == user_id).all()
+        # Чаты пользователя - из кэша состава, затем один запрос: названия
+        # чатов вместе с логинами всех участников
+        chat_ids = self.membership.user_chats(db, user_id)
+        if not chat_ids:
+            return {'status': 'success', 'chats': []}
+        rows = db.query(Chat.id, Chat.name, Chat.is_group, User.username).join(
+            ChatParticipant, ChatParticipant.chat_id == Chat.id
+        ).join(
+            User, User.id == ChatParticipant.user_id
+        ).filter(
+            Chat.id.in_(chat_ids)
+        ).order_by(Chat.id, ChatParticipant.id).all()
+
+        chats = {}
+        for chat_id, name, is_group, username in rows:
+            chat = chats.setdefault(chat_id, {'name': name, 'is_group': is_group, 'participants': []})
+            chat['participants'].append(username)
         
         chats_data = []
-        for chat in chats:
-            participants = [p.user.username for p in chat.participants]
+        for chat_id, chat in chats.items():
+            participants = chat['participants']
             chats_data.append({
-                'id': chat.id,
-                'name': chat.name if chat.is_group else participants[0] if participants[0] != message.get('username') else participants[1],
-                'is_group': chat.is_group,
+                'id': chat_id,
+                'name': chat['name'] if chat['is_group'] else participants[0] if participants[0] != message.get('username') else participants[1],
+                'is_group': chat['is_group'],
                 'participants': participants
             })
             
         return {'status': 'success', 'chats': chats_data}
         
+    @handler('get_messages')
     def get_chat_messages(self, db: Session, message):
+        """Страница истории чата с курсором по id сообщения.
+
+        after_id - сообщения новее указанного (догрузка дельты), по возрастанию;
+        before_id - страница более старых сообщений; без курсоров - последняя
+        страница. has_more: есть ли ещё сообщения за пределами страницы в
+        направлении запроса (новее для after_id, старше в остальных случаях).
+        """
         chat_id = message.get('chat_id')
-        messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.timestamp).all()
+        try:
+            limit = int(message.get('limit') or config.MESSAGES_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid limit'}
+        # Курсоры - id сообщений; строку SQLite сравнил бы с числом как текст
+        try:
+            after_id = message.get('after_id')
+            after_id = None if after_id is None else int(after_id)
+            before_id = message.get('before_id')
+            before_id = None if before_id is None else int(before_id)
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid cursor'}
+        limit = max(1, min(limit, config.MESSAGES_PAGE_MAX))
+
+        # Только нужные столбцы и логин автора одним запросом
+        query = db.query(
+            Message.id, Message.user_id, User.username, Message.text, Message.timestamp, Message.is_system
+        ).outerjoin(User, User.id == Message.user_id).filter(Message.chat_id == chat_id)
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+
+        # Берём на одну строку больше, чтобы узнать, есть ли продолжение
+        if after_id is not None:
+            rows = query.filter(Message.id > after_id).order_by(Message.id).limit(limit + 1).all()
+            messages = rows[:limit]
+        else:
+            rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+            messages = list(reversed(rows[:limit]))
         
         messages_data = []
         for msg in messages:
             messages_data.append({
                 'id': msg.id,
                 'user_id': msg.user_id,
-                'username': msg.user.username,
+                'username': msg.username,
                 'text': msg.text,
-                'timestamp': msg.timestamp.isoformat(),
+                'timestamp': msg.timestamp,
                 'is_system': msg.is_system  # ← добавлено
             })
             
-        return {'status': 'success', 'messages': messages_data}
+        return {'status': 'success', 'messages': messages_data, 'has_more': len(rows) > limit}
         
+    @handler('send_message', write=True)
     def save_message(self, db: Session, message):
         user_id = message.get('user_id')
         chat_id = message.get('chat_id')
         text = message.get('text')
         
-        new_message = Message(user_id=user_id, chat_id=chat_id, text=text)
-        db.add(new_message)
-        db.commit()
+        # Вставка уходит в общую пачку; ждём, пока пачка будет зафиксирована
+        saved = self.submit_message(message).result(timeout=config.WRITE_TIMEOUT)
+        timestamp = saved['timestamp']
+
+        username = db.query(User.username).filter(User.id == user_id).scalar()
+        # Отправитель получит сообщение в ответе (клиент догружает историю
+        # в том же пакете), поэтому его соединению событие не нужно
+        self.notify_chat(db, chat_id, {
+            'event': 'new_message',
+            'message': {
+                'id': saved['id'],
+                'user_id': user_id,
+                'username': username,
+                'text': text,
+                'timestamp': timestamp,
+                'is_system': False
+            }
+        }, exclude=getattr(self.sessions, 'connection', None))
         
-        return {'status': 'success', 'message': 'Message sent'}
+        return {'status': 'success', 'message': 'Message sent', 'message_id': saved['id'], 'timestamp': timestamp}
         
+    def submit_message(self, message):
+        """Ставит сообщение запроса send_message в очередь записи; Future
+        завершается после commit пачки."""
+        return self.message_writer.submit(message.get('user_id'), message.get('chat_id'), message.get('text'))
+
+    @handler('create_chat', write=True)
     def create_chat(self, db: Session, message):
         try:
             # Проверка обязательных полей
@@ -280,20 +575,14 @@ class Server:
             if len(users) != len(participant_ids):
                 return {'status': 'error', 'message': 'One or more users not found'}
             
-            # Для приватных чатов проверяем существование
+            # Для приватных чатов проверяем существование по упорядоченной паре
+            direct_pair = None
             if not is_group and len(participant_ids) == 2:
-                existing_chat = db.query(Chat).join(ChatParticipant).filter(
-                    Chat.is_group == False,
-                    ChatParticipant.user_id.in_(participant_ids)
-                ).group_by(Chat.id).having(func.count(ChatParticipant.user_id) == 2).first()
+                direct_pair = tuple(sorted(participant_ids))
+                existing_chat_id = self.find_direct_chat(db, direct_pair)
                 
-                if existing_chat:
-                    return {
-                        'status': 'success', 
-                        'chat_id': existing_chat.id,
-                        'message': 'Chat already exists',
-                        'existing': True
-                    }
+                if existing_chat_id:
+                    return self.existing_chat_response(existing_chat_id)
             
             # Создаем чат
             name = self.generate_chat_name(db, participant_ids, is_group, message.get('name'))
@@ -307,8 +596,21 @@ class Server:
                     user_id=participant_id,
                     chat_id=chat.id
                 ))
+
+            if direct_pair:
+                db.add(DirectChat(user_low_id=direct_pair[0], user_high_id=direct_pair[1], chat_id=chat.id))
+            self.membership.invalidate_on_commit(db, chat_ids=[chat.id], user_ids=participant_ids)
             
-            db.commit()
+            try:
+                db.commit()
+            except IntegrityError:
+                # Параллельный запрос успел создать этот личный чат - возвращаем его
+                db.rollback()
+                existing_chat_id = self.find_direct_chat(db, direct_pair) if direct_pair else None
+                if not existing_chat_id:
+                    raise
+                return self.existing_chat_response(existing_chat_id)
+            self.notify_chat(db, chat.id, {'event': 'chat_created'})
             
             return {
                 'status': 'success',
@@ -324,6 +626,20 @@ class Server:
                 'message': f'Failed to create chat: {str(e)}'
             }
 
+    def find_direct_chat(self, db: Session, direct_pair):
+        return db.query(DirectChat.chat_id).filter(
+            DirectChat.user_low_id == direct_pair[0],
+            DirectChat.user_high_id == direct_pair[1]
+        ).scalar()
+
+    def existing_chat_response(self, chat_id):
+        return {
+            'status': 'success', 
+            'chat_id': chat_id,
+            'message': 'Chat already exists',
+            'existing': True
+        }
+
     def generate_chat_name(self, db: Session, participant_ids, is_group, custom_name=None):
         if custom_name:
             return custom_name
@@ -332,31 +648,91 @@ class Server:
             return " & ".join(sorted([u.username for u in users]))
         return "Group Chat"
         
+    def start_metrics(self):
+        if not config.METRICS_PORT:
+            return None
+        try:
+            httpd = start_metrics_server(config.METRICS_HOST, config.METRICS_PORT, self.metrics_text)
+        except OSError as e:
+            # Сервер сообщений работает и без метрик
+            logger.warning("Не удалось открыть порт метрик %s: %s", config.METRICS_PORT, e)
+            return None
+        print(f"[SERVER] Metrics on http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+        return httpd
+
+    def metrics_text(self):
+        """Текущее состояние сервера в текстовом формате Prometheus."""
+        out = PrometheusText()
+        out.gauge('messenger_connections_active', 'Open client connections', self.active_connections)
+        with self.clients_lock:
+            logged_in = sum(len(c) for c in self.clients.values())
+        out.gauge('messenger_connections_logged_in', 'Connections with a logged-in user', logged_in)
+        out.gauge('messenger_users_online', 'Users considered online by presence tracking',
+                  self.presence.online_count())
+
+        traffic = self.traffic
+        out.counter('messenger_frames_received_total', 'Frames received from clients', traffic.frames_in)
+        out.counter('messenger_bytes_received_total', 'Bytes received from clients, headers included',
+                    traffic.bytes_in)
+        out.counter('messenger_frames_sent_total', 'Frames sent to clients', traffic.frames_out)
+        out.counter('messenger_bytes_sent_total', 'Bytes sent to clients, headers included', traffic.bytes_out)
+
+        for msg_type, calls, errors, histogram in self.request_metrics.histograms():
+            out.counter('messenger_requests_total', 'Requests by message type', calls, type=msg_type)
+            out.counter('messenger_request_errors_total', 'Requests that failed or returned status=error',
+                        errors, type=msg_type)
+            out.histogram('messenger_request_duration_seconds', 'Request handling time', histogram, type=msg_type)
+
+        queries, query_errors, commit_latency = self.db_metrics.snapshot()
+        for kind, count, histogram in queries:
+            out.counter('messenger_db_queries_total', 'SQL statements executed', count, kind=kind)
+            out.histogram('messenger_db_query_duration_seconds', 'SQL statement execution time', histogram, kind=kind)
+        out.counter('messenger_db_query_errors_total', 'SQL statements that raised an error', query_errors)
+        out.histogram('messenger_db_commit_duration_seconds', 'Session commit time (flush + commit)', commit_latency)
+
+        # _work_queue - внутренняя очередь ThreadPoolExecutor, отдельного API для глубины нет
+        out.gauge('messenger_executor_queue_depth', 'Requests waiting for a DB worker thread',
+                  self.executor._work_queue.qsize())
+        out.gauge('messenger_message_writer_queue_depth', 'Messages waiting for the group-commit writer',
+                  self.message_writer.queue.qsize())
+        out.counter('messenger_message_writer_batches_total', 'Group-commit batches written',
+                    self.message_writer.batches)
+        out.counter('messenger_message_writer_rows_total', 'Messages written by the group-commit writer',
+                    self.message_writer.rows)
+        out.gauge('messenger_threads', 'Live threads in the server process', threading.active_count())
+
+        membership = self.membership.stats()
+        out.counter('messenger_membership_cache_hits_total', 'Membership cache hits', membership['hits'])
+        out.counter('messenger_membership_cache_misses_total', 'Membership cache misses', membership['misses'])
+
+        for name, compression in self.compressions.items():
+            stats = compression.stats()
+            out.counter('messenger_compression_bytes_saved_total', 'Bytes saved by frame compression',
+                        stats['bytes_saved'], algorithm=name)
+            out.counter('messenger_compression_cpu_seconds_total', 'CPU time spent on frame compression',
+                        stats['compress_seconds'], algorithm=name, operation='compress')
+            out.counter('messenger_compression_cpu_seconds_total', 'CPU time spent on frame compression',
+                        stats['decompress_seconds'], algorithm=name, operation='decompress')
+        return out.render()
+
     def start(self):
+        self.start_metrics()
         print(f"[SERVER] Server is listening on {self.host}:{self.port}")
         try:
             while True:
                 conn, addr = self.server.accept()
                 thread = threading.Thread(target=self.handle_client, args=(conn, addr))
                 thread.start()
-                print(f"[ACTIVE CONNECTIONS] {threading.active_count() - 1}")
+                logger.debug("[ACTIVE CONNECTIONS] %d", self.active_connections)
         except KeyboardInterrupt:
             print("[SERVER] Shutting down...")
             self.server.close()
 
+    @handler('get_users')
     def get_all_users(self, db: Session, message):
         try:
-            # Принудительное обновление статусов, если требуется
-            force_update = message.get('force_update', False)
-            users = db.query(User).all()
-            
-            if force_update:
-                for user in users:
-                    is_online = (datetime.utcnow() - user.last_seen).total_seconds() < 30 \
-                        if user.last_seen else False
-                    if user.online != is_online:
-                        user.online = is_online
-                db.commit()
+            # Статусы берутся из PresenceTracker; force_update больше не нужен
+            users = db.query(User.id, User.username, User.name).all()
             
             users_data = []
             for user in users:
@@ -364,13 +740,13 @@ class Server:
                     'id': user.id,
                     'username': user.username,
                     'name': user.name if user.name else user.username,
-                    'online': user.online
+                    'online': self.presence.is_online(user.id)
                 })
             
             return {
                 'status': 'success',
                 'users': users_data,
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': datetime.utcnow()
             }
             
         except Exception as e:
@@ -379,22 +755,18 @@ class Server:
                 'message': f'Ошибка получения пользователей: {str(e)}'
             }
 
+    @handler('get_chat_participants')
     def get_chat_participants(self, db: Session, message):
         chat_id = message.get('chat_id')
         if not chat_id:
             return {'status': 'error', 'message': 'Chat ID required'}
         
         try:
-            participants = db.query(User).join(ChatParticipant).filter(
+            participants = db.query(User.id, User.username, User.name).join(
+                ChatParticipant, ChatParticipant.user_id == User.id
+            ).filter(
                 ChatParticipant.chat_id == chat_id
             ).all()
-            
-            # Обновляем статусы перед отправкой
-            for user in participants:
-                is_online = (datetime.utcnow() - user.last_seen).total_seconds() < 30 \
-                    if user.last_seen else False
-                user.online = is_online
-            db.commit()
 
             participants_data = []
             for user in participants:
@@ -402,7 +774,7 @@ class Server:
                     'id': user.id,
                     'username': user.username,
                     'name': user.name if user.name else user.username,
-                    'online': user.online
+                    'online': self.presence.is_online(user.id)
                 })
             
             return {
@@ -417,6 +789,41 @@ class Server:
                 'message': f'Ошибка получения участников: {str(e)}'
             }
 
+    @handler('heartbeat', user=True)
+    def heartbeat(self, db: Session, message, user_id):
+        # Статус "в сети" продлевается только пользователю, вошедшему в этом
+        # соединении: user_id из запроса не учитывается
+        if user_id is None:
+            return {'status': 'error', 'message': 'Not logged in'}
+        self.presence.heartbeat(user_id)
+        return {'status': 'success'}
+
+    @handler('admin_stats')
+    def admin_stats(self, db: Session, message):
+        """Счётчики и гистограммы задержек по типам запросов и состояние
+        подсистем сервера. Требует токен MESSENGER_ADMIN_TOKEN."""
+        token = message.get('token')
+        if not config.ADMIN_TOKEN or not isinstance(token, str) or not hmac.compare_digest(
+                token.encode(), config.ADMIN_TOKEN.encode()):
+            return {'status': 'error', 'message': 'Access denied'}
+
+        handlers = self.request_metrics.snapshot()
+        for msg_type, stats in handlers.items():
+            entry = HANDLERS.get(msg_type)
+            stats['write'] = entry.write if entry is not None else None
+        with self.clients_lock:
+            connections = sum(len(c) for c in self.clients.values())
+        return {
+            'status': 'success',
+            'handlers': handlers,
+            'logged_in_connections': connections,
+            'online_users': self.presence.online_count(),
+            'membership_cache': self.membership.stats(),
+            'message_writer': {'batches': self.message_writer.batches, 'rows': self.message_writer.rows},
+            'compression': {name: c.stats() for name, c in self.compressions.items()},
+        }
+
+    @handler('update_chat_name', write=True)
     def update_chat_name(self, db: Session, message):
         chat_id = message.get('chat_id')
         new_name = message.get('new_name')
@@ -430,12 +837,7 @@ class Server:
             return {'status': 'error', 'message': 'Chat not found'}
         
         # Проверяем права пользователя
-        participant = db.query(ChatParticipant).filter(
-            ChatParticipant.chat_id == chat_id,
-            ChatParticipant.user_id == user_id
-        ).first()
-        
-        if not participant:
+        if not self.membership.is_member(db, chat_id, user_id):
             return {'status': 'error', 'message': 'Not a participant'}
         
         old_name = chat.name
@@ -451,21 +853,18 @@ class Server:
         )
         db.add(system_message)
         db.commit()
+        self.notify_chat(db, chat_id, {'event': 'chat_renamed', 'name': new_name})
         
         return {'status': 'success'}
 
+    @handler('remove_participant', write=True)
     def remove_chat_participant(self, db: Session, message):
         chat_id = message.get('chat_id')
         user_id = message.get('user_id')  # Кто удаляет
         participant_id = message.get('participant_id')  # Кого удаляют
         
         # Проверяем, что user_id является участником чата
-        participant = db.query(ChatParticipant).filter(
-            ChatParticipant.chat_id == chat_id,
-            ChatParticipant.user_id == user_id
-        ).first()
-        
-        if not participant:
+        if not self.membership.is_member(db, chat_id, user_id):
             return {'status': 'error', 'message': 'Not a participant'}
         
         # Удаляем участника
@@ -473,6 +872,9 @@ class Server:
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == participant_id
         ).delete()
+        # Личный чат без одного из собеседников больше не считается личным для этой пары
+        db.query(DirectChat).filter(DirectChat.chat_id == chat_id).delete()
+        self.membership.invalidate_on_commit(db, chat_ids=[chat_id], user_ids=[participant_id])
         
         # Добавляем системное сообщение
         user = db.query(User).filter(User.id == user_id).first()
@@ -486,30 +888,24 @@ class Server:
         )
         db.add(system_message)
         db.commit()
+        # Удалённый участник тоже должен узнать, что чат у него пропал
+        self.notify_chat(db, chat_id, {'event': 'participants_changed'},
+                         extra_user_ids=[participant_id])
         
         return {'status': 'success'}
 
+    @handler('add_participant', write=True)
     def add_chat_participant(self, db: Session, message):
         chat_id = message.get('chat_id')
         user_id = message.get('user_id')  # Кто добавляет
         participant_id = message.get('participant_id')  # Кого добавляют
         
         # Проверяем, что user_id является участником чата
-        participant = db.query(ChatParticipant).filter(
-            ChatParticipant.chat_id == chat_id,
-            ChatParticipant.user_id == user_id
-        ).first()
-        
-        if not participant:
+        if not self.membership.is_member(db, chat_id, user_id):
             return {'status': 'error', 'message': 'Not a participant'}
         
         # Проверяем, что участник ещё не в чате
-        existing = db.query(ChatParticipant).filter(
-            ChatParticipant.chat_id == chat_id,
-            ChatParticipant.user_id == participant_id
-        ).first()
-        
-        if existing:
+        if self.membership.is_member(db, chat_id, participant_id):
             return {'status': 'error', 'message': 'User already in chat'}
         
         # Добавляем участника
@@ -517,6 +913,7 @@ class Server:
             user_id=participant_id,
             chat_id=chat_id
         ))
+        self.membership.invalidate_on_commit(db, chat_ids=[chat_id], user_ids=[participant_id])
         
         # Добавляем системное сообщение
         user = db.query(User).filter(User.id == user_id).first()
@@ -529,10 +926,32 @@ class Server:
             is_system=True
         )
         db.add(system_message)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Параллельный запрос уже добавил участника (уникальный индекс chat_id, user_id)
+            db.rollback()
+            return {'status': 'error', 'message': 'User already in chat'}
+        self.notify_chat(db, chat_id, {'event': 'participants_changed'})
         
         return {'status': 'success'}
 
 if __name__ == "__main__":
-    server = Server()
+    import argparse
+    from shared.logconfig import setup_logging
+
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description='Сервер корпоративного мессенджера')
+    parser.add_argument('--host', default=config.HOST)
+    parser.add_argument('--port', type=int, default=config.PORT)
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default=config.ENGINE,
+                        help='threads - поток на соединение, asyncio - цикл событий')
+    args = parser.parse_args()
+
+    if args.engine == 'asyncio':
+        from server.async_server import AsyncServer
+        server = AsyncServer(args.host, args.port)
+    else:
+        server = Server(args.host, args.port)
     server.start()
\ No newline at end of file
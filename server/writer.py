@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from server import config
+from server.database import SessionLocal
+from server.models import Message
+
+
+class MessageWriter:
+    """Групповая фиксация сообщений.
+
+    Вставки от всех соединений попадают в очередь; отдельный поток собирает
+    их в пачку (до batch_size строк или max_delay_ms миллисекунд) и
+    фиксирует одной транзакцией. submit() возвращает Future, который
+    завершается только после commit пачки, поэтому запрос подтверждается
+    так же надёжно, как при отдельном commit.
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size=config.WRITE_BATCH_SIZE,
+                 max_delay_ms=config.WRITE_BATCH_DELAY_MS):
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        self.thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, user_id, chat_id, text, is_system=False):
+        future = Future()
+        values = {
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'text': text,
+            'is_system': is_system,
+            'timestamp': datetime.utcnow(),
+        }
+        self.queue.put((values, future))
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        db = self.session_factory()
+        try:
+            rows = [Message(**values) for values, _ in batch]
+            db.add_all(rows)
+            db.flush()
+            results = [{'id': row.id, 'timestamp': row.timestamp} for row in rows]
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Пачка не записалась - пишем по одной, чтобы ошибка досталась только виновнику
+            for item in batch:
+                self._write_single(item)
+            return
+        finally:
+            db.close()
+
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _write_single(self, item):
+        values, future = item
+        db = self.session_factory()
+        try:
+            row = Message(**values)
+            db.add(row)
+            db.flush()
+            result = {'id': row.id, 'timestamp': row.timestamp}
+            db.commit()
+            self.batches += 1
+            self.rows += 1
+            future.set_result(result)
+        except Exception as e:
+            db.rollback()
+            future.set_exception(e)
+        finally:
+            db.close()
@@ -0,0 +1,116 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+# Настройки журнала общие для сервера и клиента и задаются переменными окружения:
+#   MESSENGER_LOG_FILE          - файл журнала (messenger.log у сервера, client.log у клиента)
+#   MESSENGER_LOG_LEVEL         - общий уровень (INFO)
+#   MESSENGER_LOG_LEVELS        - уровни подсистем: "server.database=WARNING,client=DEBUG"
+#   MESSENGER_LOG_FORMAT        - json (JSON lines) или text
+#   MESSENGER_LOG_MAX_BYTES     - размер файла до ротации (10 МБ)
+#   MESSENGER_LOG_BACKUP_COUNT  - сколько старых файлов хранить (5)
+#   MESSENGER_LOG_DEBUG_SAMPLE  - доля сохраняемых DEBUG-записей (0.1)
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+# Атрибуты, которые есть у любой записи; остальное - поля из extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON; поля из extra= попадают в неё как есть."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate DEBUG-записей; записи уровнем выше проходят всегда."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        if random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+def parse_levels(spec):
+    """Разбирает строку вида 'server=INFO,server.database=WARNING' в словарь уровней."""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(filename=None, level=None, levels=None, fmt=None, max_bytes=None,
+                  backup_count=None, debug_sample=None, default_file='messenger.log'):
+    """Настраивает неблокирующий журнал: потоки приложения только кладут
+    запись в очередь (QueueHandler), в файл с ротацией её пишет фоновый
+    QueueListener. Возвращает запущенный listener; при выходе из процесса
+    он останавливается сам и дописывает очередь.
+
+    default_file - имя файла, если MESSENGER_LOG_FILE не задан: сервер и
+    клиент, запущенные из одного каталога, не должны ротировать один файл.
+    """
+    env = os.environ.get
+    filename = filename or env('MESSENGER_LOG_FILE', default_file)
+    level = (level or env('MESSENGER_LOG_LEVEL', 'INFO')).upper()
+    levels = levels if levels is not None else parse_levels(env('MESSENGER_LOG_LEVELS'))
+    fmt = fmt or env('MESSENGER_LOG_FORMAT', 'json')
+    max_bytes = max_bytes if max_bytes is not None else int(env('MESSENGER_LOG_MAX_BYTES', 10 * 1024 * 1024))
+    backup_count = backup_count if backup_count is not None else int(env('MESSENGER_LOG_BACKUP_COUNT', 5))
+    debug_sample = debug_sample if debug_sample is not None else float(env('MESSENGER_LOG_DEBUG_SAMPLE', 0.1))
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+    file_handler.setFormatter(JsonLinesFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(debug_sample))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, subsystem_level in levels.items():
+        logging.getLogger(name).setLevel(subsystem_level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener):
+    """Дописывает очередь и останавливает listener (повторный вызов безопасен)."""
+    if listener._thread is not None:
+        listener.stop()
@@ -0,0 +1,323 @@
+import asyncio
+import json
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import msgpack
+except ImportError:  # без msgpack доступен только JSON
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # без zstandard остаётся zlib
+    zstandard = None
+
+# Кадр протокола: 4 байта длины (big-endian) + тело в согласованном формате.
+# До рукопожатия (запрос 'hello') тело всегда JSON в UTF-8.
+# Старший бит длины - признак сжатого тела (только после рукопожатия).
+HEADER_SIZE = 4
+COMPRESSED_FLAG = 0x80000000
+DEFAULT_MAX_FRAME_SIZE = 16 * 1024 * 1024
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+# Уровень 3 у обоих алгоритмов: почти вся экономия при малых затратах CPU
+DEFAULT_COMPRESSION_LEVEL = 3
+
+
+class FrameTooLarge(ValueError):
+    """Заголовок объявляет кадр больше допустимого размера."""
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+class JsonCodec:
+    """Формат по умолчанию: понимают все клиенты и серверы."""
+    name = 'json'
+    label = 'JSON'
+
+    def encode(self, payload):
+        # Кириллица как есть в UTF-8: вдвое меньше байт, чем \uXXXX
+        try:
+            return json.dumps(payload, default=_json_default, ensure_ascii=False).encode('utf-8')
+        except UnicodeEncodeError:
+            # Одиночные суррогаты из текста клиента в UTF-8 не кодируются
+            return json.dumps(payload, default=_json_default).encode('utf-8')
+
+    def decode(self, data):
+        # str(memoryview, 'utf-8') декодирует прямо из буфера, без промежуточных bytes
+        if isinstance(data, memoryview):
+            return json.loads(str(data, 'utf-8'))
+        return json.loads(data.decode('utf-8'))
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            # Время в БД хранится в UTC без часового пояса
+            delta = obj - _EPOCH
+            return msgpack.Timestamp(delta.days * 86400 + delta.seconds, delta.microseconds * 1000)
+        return msgpack.Timestamp.from_datetime(obj)
+    return str(obj)
+
+
+class MsgpackCodec:
+    """MessagePack: компактнее JSON и быстрее разбирается; время передаётся
+    как Timestamp и приходит объектом datetime (UTC)."""
+    name = 'msgpack'
+    label = 'MessagePack'
+
+    def encode(self, payload):
+        return msgpack.packb(payload, default=_msgpack_default, use_bin_type=True,
+                             unicode_errors='surrogatepass')
+
+    def decode(self, data):
+        # unpackb читает прямо из memoryview
+        try:
+            return msgpack.unpackb(data, raw=False, timestamp=3, strict_map_key=False,
+                                   unicode_errors='surrogatepass')
+        except TypeError as e:
+            # Нехэшируемый ключ словаря; остальные ошибки разбора - ValueError, как у JSON
+            raise ValueError(str(e)) from e
+
+
+JSON = JsonCodec()
+CODECS = {'json': JSON}
+if msgpack is not None:
+    CODECS['msgpack'] = MsgpackCodec()
+
+
+def choose_codec(requested, allowed=None):
+    """Первый формат из списка клиента, который поддерживаем мы; иначе JSON."""
+    for name in requested or ():
+        if name in CODECS and (allowed is None or name in allowed):
+            return CODECS[name]
+    return JSON
+
+
+class Compression:
+    """Сжатие тел кадров одним алгоритмом со счётчиками.
+
+    Кадры короче threshold и кадры, которые не стали меньше, уходят как
+    есть. Счётчики общие для всех соединений, где используется объект;
+    время - процессорное время потока (thread_time).
+    """
+
+    def __init__(self, name, threshold=DEFAULT_COMPRESSION_THRESHOLD, level=None):
+        self.name = name
+        self.threshold = threshold
+        self.level = DEFAULT_COMPRESSION_LEVEL if level is None else level
+        self.lock = threading.Lock()
+        self.local = threading.local()  # объекты zstandard не потокобезопасны
+        self.frames_compressed = 0
+        self.frames_skipped = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.compress_seconds = 0.0
+        self.frames_decompressed = 0
+        self.bytes_decompressed = 0
+        self.decompress_seconds = 0.0
+
+    def _compress(self, data):
+        if self.name == 'zstd':
+            compressor = getattr(self.local, 'compressor', None)
+            if compressor is None:
+                compressor = self.local.compressor = zstandard.ZstdCompressor(level=self.level)
+            return compressor.compress(data)
+        return zlib.compress(data, self.level)
+
+    def _decompress(self, data, max_size):
+        if self.name == 'zstd':
+            size = zstandard.frame_content_size(data)
+            if size < 0 or size > max_size:
+                raise FrameTooLarge(f"Compressed frame expands beyond {max_size} bytes")
+            decompressor = getattr(self.local, 'decompressor', None)
+            if decompressor is None:
+                decompressor = self.local.decompressor = zstandard.ZstdDecompressor()
+            return decompressor.decompress(data)
+        decompressor = zlib.decompressobj()
+        result = decompressor.decompress(data, max_size)
+        if decompressor.unconsumed_tail:
+            raise FrameTooLarge(f"Compressed frame expands beyond {max_size} bytes")
+        return result
+
+    def compress(self, data):
+        """Сжатое тело или None, если кадр лучше отправить как есть."""
+        if len(data) < self.threshold:
+            return None
+        started = time.thread_time()
+        compressed = self._compress(data)
+        elapsed = time.thread_time() - started
+        with self.lock:
+            self.compress_seconds += elapsed
+            if len(compressed) >= len(data):
+                self.frames_skipped += 1
+                return None
+            self.frames_compressed += 1
+            self.bytes_before += len(data)
+            self.bytes_after += len(compressed)
+        return compressed
+
+    def decompress(self, data, max_size=DEFAULT_MAX_FRAME_SIZE):
+        started = time.thread_time()
+        result = self._decompress(data, max_size)
+        elapsed = time.thread_time() - started
+        with self.lock:
+            self.frames_decompressed += 1
+            self.bytes_decompressed += len(result)
+            self.decompress_seconds += elapsed
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                'algorithm': self.name,
+                'frames_compressed': self.frames_compressed,
+                'frames_skipped': self.frames_skipped,
+                'bytes_before': self.bytes_before,
+                'bytes_after': self.bytes_after,
+                'bytes_saved': self.bytes_before - self.bytes_after,
+                'compress_seconds': self.compress_seconds,
+                'frames_decompressed': self.frames_decompressed,
+                'bytes_decompressed': self.bytes_decompressed,
+                'decompress_seconds': self.decompress_seconds,
+            }
+
+
+COMPRESSIONS = ['zstd', 'zlib'] if zstandard is not None else ['zlib']
+
+
+def choose_compression(requested, allowed=None):
+    """Первый алгоритм сжатия из списка клиента, который поддерживаем мы."""
+    for name in requested or ():
+        if name in COMPRESSIONS and (allowed is None or name in allowed):
+            return name
+    return None
+
+
+def to_datetime(value):
+    """Время из ответа сервера: строка ISO (JSON) или datetime (MessagePack)."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    return datetime.fromisoformat(value)
+
+
+def encode_payload(payload, codec=JSON):
+    return codec.encode(payload)
+
+
+def decode_payload(data, codec=JSON):
+    return codec.decode(data)
+
+
+def encode_frame(payload, codec=JSON, compression=None):
+    data = codec.encode(payload)
+    size = len(data)
+    if compression is not None:
+        compressed = compression.compress(data)
+        if compressed is not None:
+            data = compressed
+            size = len(data) | COMPRESSED_FLAG
+    return size.to_bytes(HEADER_SIZE, byteorder='big') + data
+
+
+def parse_header(header, max_frame_size):
+    """Размер тела и признак сжатия из заголовка кадра."""
+    size = int.from_bytes(header, byteorder='big')
+    compressed = bool(size & COMPRESSED_FLAG)
+    size &= ~COMPRESSED_FLAG
+    check_frame_size(size, max_frame_size)
+    return size, compressed
+
+
+def decompress_frame(data, compression, max_frame_size):
+    if compression is None:
+        raise ValueError("Compressed frame without negotiated compression")
+    return compression.decompress(data, max_frame_size)
+
+
+def check_frame_size(size, max_frame_size):
+    if size > max_frame_size:
+        raise FrameTooLarge(f"Frame of {size} bytes exceeds limit of {max_frame_size} bytes")
+
+
+class FrameReader:
+    """Читает кадры из блокирующего сокета в заранее выделенный буфер.
+
+    Данные принимаются через recv_into прямо в bytearray, без склейки
+    кусков; read_frame() возвращает memoryview на буфер, который
+    действителен до следующего чтения. Буфер растёт под большие кадры и
+    возвращается к исходному размеру после них, чтобы тысячи соединений
+    не держали в памяти мегабайтные буферы.
+    """
+
+    def __init__(self, sock, max_frame_size=DEFAULT_MAX_FRAME_SIZE, buffer_size=64 * 1024, stats=None):
+        self.sock = sock
+        self.stats = stats  # объект с методом frame_in(size) для учёта трафика
+        self.codec = JSON
+        self.compression = None
+        self.max_frame_size = max_frame_size
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(buffer_size)
+        self.header = bytearray(HEADER_SIZE)
+
+    def _fill(self, view, size, eof_ok=False):
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:size])
+            if not count:
+                if eof_ok and received == 0:
+                    return False
+                raise ConnectionError("Connection broken")
+            received += count
+        return True
+
+    def read_frame(self):
+        """Возвращает memoryview с телом кадра или None, если соединение закрыто."""
+        if not self._fill(memoryview(self.header), HEADER_SIZE, eof_ok=True):
+            return None
+        size, compressed = parse_header(self.header, self.max_frame_size)
+
+        if size > len(self.buffer):
+            self.buffer = bytearray(size)
+        elif len(self.buffer) > self.buffer_size and size <= self.buffer_size:
+            self.buffer = bytearray(self.buffer_size)
+
+        view = memoryview(self.buffer)
+        self._fill(view, size)
+        if self.stats is not None:
+            self.stats.frame_in(HEADER_SIZE + size)
+        if compressed:
+            return memoryview(decompress_frame(view[:size], self.compression, self.max_frame_size))
+        return view[:size]
+
+    def read_message(self):
+        frame = self.read_frame()
+        if frame is None:
+            return None
+        return self.codec.decode(frame)
+
+
+async def read_frame_async(reader, max_frame_size=DEFAULT_MAX_FRAME_SIZE, compression=None, stats=None):
+    """Вариант для asyncio.StreamReader; None, если соединение закрыто."""
+    try:
+        header = await reader.readexactly(HEADER_SIZE)
+    except asyncio.IncompleteReadError:
+        return None
+    size, compressed = parse_header(header, max_frame_size)
+    data = await reader.readexactly(size)
+    if stats is not None:
+        stats.frame_in(HEADER_SIZE + size)
+    if compressed:
+        return decompress_frame(data, compression, max_frame_size)
+    return data
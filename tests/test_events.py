@@ -0,0 +1,111 @@
+"""Push-события сервера: кому отправляется новое сообщение и что нельзя
+выполнить внутри пакета.
+
+Запуск из корня проекта:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import socket
+import threading
+import unittest
+
+import testenv  # noqa: F401  временная БД - до импорта модулей server
+from server.server import Server
+from shared.protocols import FrameReader, encode_frame
+
+TIMEOUT = 5
+
+
+class Client:
+    """Соединение с сервером: рукопожатие с событиями, запросы с req_id."""
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=TIMEOUT)
+        self.reader = FrameReader(self.sock)
+        self.events = []
+        self.req_id = 0
+        self.request({'type': 'hello', 'codecs': ['json'], 'compression': [], 'events': True})
+
+    def request(self, message):
+        self.req_id += 1
+        self.sock.sendall(encode_frame(dict(message, req_id=self.req_id)))
+        while True:
+            frame = self.reader.read_message()
+            if frame.get('type') == 'event':
+                self.events.append(frame)
+            elif frame.get('req_id') == self.req_id:
+                return frame
+
+    def login(self, username):
+        self.request({'type': 'register', 'username': username, 'password': 'secret'})
+        response = self.request({'type': 'login', 'username': username, 'password': 'secret'})
+        return response['user_id']
+
+    def wait_event(self):
+        """Следующее событие; socket.timeout, если его нет."""
+        if self.events:
+            return self.events.pop(0)
+        frame = self.reader.read_message()
+        assert frame.get('type') == 'event', frame
+        return frame
+
+    def close(self):
+        self.sock.close()
+
+
+class EventsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server('127.0.0.1', 0)
+        threading.Thread(target=cls.server.start, daemon=True).start()
+        cls.port = cls.server.server.getsockname()[1]
+
+    def setUp(self):
+        self.sender = Client(self.port)
+        self.receiver = Client(self.port)
+        self.sender_id = self.sender.login(f'sender{id(self)}')
+        self.receiver_id = self.receiver.login(f'receiver{id(self)}')
+        response = self.sender.request({'type': 'create_chat', 'user_id': self.sender_id,
+                                        'participant_ids': [self.sender_id, self.receiver_id]})
+        self.chat_id = response['chat_id']
+        # Событие о новом чате получают оба
+        self.sender.wait_event()
+        self.receiver.wait_event()
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def test_new_message_is_not_pushed_back_to_sender_connection(self):
+        response = self.sender.request({'type': 'batch', 'requests': [
+            {'type': 'send_message', 'user_id': self.sender_id, 'chat_id': self.chat_id, 'text': 'hi'},
+            {'type': 'get_messages', 'chat_id': self.chat_id},
+        ]})
+        sent, history = response['results']
+        self.assertEqual(sent['status'], 'success')
+        self.assertEqual(history['messages'][-1]['id'], sent['message_id'])
+
+        event = self.receiver.wait_event()
+        self.assertEqual(event['event'], 'new_message')
+        self.assertEqual(event['message']['id'], sent['message_id'])
+
+        # Второе соединение того же пользователя событие получает
+        other = Client(self.port)
+        try:
+            other.request({'type': 'login', 'username': f'sender{id(self)}', 'password': 'secret'})
+            self.sender.request({'type': 'send_message', 'user_id': self.sender_id,
+                                 'chat_id': self.chat_id, 'text': 'again'})
+            self.assertEqual(other.wait_event()['message']['text'], 'again')
+        finally:
+            other.close()
+        self.assertEqual(self.sender.events, [])
+
+    def test_login_inside_batch_is_rejected(self):
+        response = self.receiver.request({'type': 'batch', 'requests': [
+            {'type': 'login', 'username': f'sender{id(self)}', 'password': 'secret'},
+        ]})
+        self.assertEqual(response['results'][0]['status'], 'error')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""Кэш состава чатов не запоминает значение, прочитанное в транзакции,
+которая началась до сброса этой записи.
+
+Запуск из корня проекта:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import testenv  # noqa: F401  временная БД - до импорта модулей server
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from server.membership import MembershipCache
+from server.models import Base, Chat, ChatParticipant, User
+
+
+class MembershipCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix='messenger-test-')
+        self.engine = create_engine('sqlite:///' + os.path.join(self.data_dir, 'test.db'))
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.cache = MembershipCache(self.Session)
+
+        db = self.Session()
+        db.add_all([User(id=1, username='first', password_hash='x'),
+                    User(id=2, username='second', password_hash='x'),
+                    Chat(id=1, name='chat'),
+                    ChatParticipant(chat_id=1, user_id=1)])
+        db.commit()
+        db.close()
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def add_participant(self, user_id):
+        writer = self.Session()
+        writer.add(ChatParticipant(chat_id=1, user_id=user_id))
+        self.cache.invalidate_on_commit(writer, chat_ids=[1], user_ids=[user_id])
+        writer.commit()
+        writer.close()
+
+    def test_load_in_transaction_older_than_invalidation_is_not_cached(self):
+        reader = self.Session()
+        reader.query(Chat).all()  # транзакция читателя уже идёт
+        self.add_participant(2)
+
+        self.cache.chat_members(reader, 1)
+        self.assertNotIn(1, self.cache.chats)
+        reader.close()
+
+        fresh = self.Session()
+        self.assertEqual(self.cache.chat_members(fresh, 1), {1, 2})
+        self.assertIn(1, self.cache.chats)
+        fresh.close()
+
+    def test_load_in_current_transaction_is_cached(self):
+        self.add_participant(2)
+        reader = self.Session()
+        reader.query(Chat).all()
+
+        self.assertEqual(self.cache.chat_members(reader, 1), {1, 2})
+        self.assertEqual(self.cache.user_chats(reader, 2), {1})
+        self.assertIn(1, self.cache.chats)
+        self.assertIn(2, self.cache.users)
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
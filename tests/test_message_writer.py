@@ -0,0 +1,55 @@
+"""Групповая запись сообщений в asyncio-движке не ограничена числом
+потоков пула: сообщение ждёт commit в цикле событий, а не в потоке.
+
+Запуск из корня проекта:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import socket
+import threading
+import unittest
+
+import testenv  # noqa: F401  временная БД - до импорта модулей server
+from server.async_server import AsyncServer
+from shared.protocols import FrameReader, encode_frame
+
+WORKERS = 2
+MESSAGES = 10
+
+
+class AsyncGroupCommitTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = AsyncServer('127.0.0.1', 0, db_workers=WORKERS)
+        threading.Thread(target=cls.server.start, daemon=True).start()
+        cls.port = cls.server.server.getsockname()[1]
+
+    def test_pipelined_messages_share_transactions_beyond_pool_size(self):
+        sock = socket.create_connection(('127.0.0.1', self.port), timeout=5)
+        try:
+            reader = FrameReader(sock)
+            sock.sendall(encode_frame({'type': 'register', 'username': 'writer', 'password': 'secret'}))
+            reader.read_message()
+            sock.sendall(encode_frame({'type': 'login', 'username': 'writer', 'password': 'secret'}))
+            user_id = reader.read_message()['user_id']
+            sock.sendall(encode_frame({'type': 'create_chat', 'user_id': user_id, 'participant_ids': [user_id]}))
+            chat_id = reader.read_message()['chat_id']
+
+            batches = self.server.message_writer.batches
+            # Все запросы одним пакетом TCP: сервер читает их подряд
+            sock.sendall(b''.join(
+                encode_frame({'type': 'send_message', 'user_id': user_id, 'chat_id': chat_id,
+                              'text': f'message {i}', 'req_id': i})
+                for i in range(MESSAGES)))
+            responses = [reader.read_message() for _ in range(MESSAGES)]
+        finally:
+            sock.close()
+
+        self.assertTrue(all(response['status'] == 'success' for response in responses), responses)
+        # Если бы каждое сообщение ждало commit в потоке пула, в пачку
+        # попадало бы не больше WORKERS сообщений
+        self.assertLess(self.server.message_writer.batches - batches, MESSAGES // WORKERS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Число SQL-запросов обработчиков списка чатов и истории не зависит от
+числа чатов и сообщений (нет N+1).
+
+Запуск из корня проекта:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import unittest
+
+import testenv  # noqa: F401  временная БД - до импорта модулей server
+from sqlalchemy import event
+from server.database import SessionLocal, engine
+from server.models import Chat, ChatParticipant, Message, User
+from server.server import Server
+
+MANY = 25
+
+
+class QueryCountTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server('127.0.0.1', 0)
+        cls.queries = 0
+
+        def count_query(conn, cursor, statement, parameters, context, executemany):
+            cls.queries += 1
+
+        cls.count_query = count_query
+        event.listen(engine, 'before_cursor_execute', count_query)
+
+        db = SessionLocal()
+        try:
+            users = [User(username=f'user{i}', password_hash='x', name=f'User {i}') for i in range(4)]
+            db.add_all(users)
+            db.flush()
+            chats = []
+            # У первого пользователя один чат, у второго - MANY чатов по три участника
+            for index, owner in enumerate([users[0]] + [users[1]] * MANY):
+                chat = Chat(name=f'chat{index}', is_group=True)
+                db.add(chat)
+                db.flush()
+                for member in (owner, users[2], users[3]):
+                    db.add(ChatParticipant(chat_id=chat.id, user_id=member.id))
+                chats.append(chat)
+            # В первом чате одно сообщение, во втором - MANY
+            cls.few_chat, cls.many_chat = chats[0].id, chats[1].id
+            db.add(Message(chat_id=cls.few_chat, user_id=users[0].id, text='text'))
+            for i in range(MANY):
+                db.add(Message(chat_id=cls.many_chat, user_id=users[1 + i % 3].id, text=f'text {i}'))
+            db.commit()
+            cls.few_user = (users[0].id, users[0].username)
+            cls.many_user = (users[1].id, users[1].username)
+        finally:
+            db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        event.remove(engine, 'before_cursor_execute', cls.count_query)
+        cls.server.server.close()
+        cls.server.executor.shutdown(wait=False)
+
+    def count(self, message):
+        """Число запросов к БД за один вызов обработчика."""
+        self.server.process_message(message)  # прогрев: соединение пула, сессия потока
+        before = type(self).queries
+        response = self.server.process_message(message)
+        self.assertEqual(response.get('status'), 'success', response)
+        return type(self).queries - before, response
+
+    def test_get_chats_queries_do_not_grow_with_chats(self):
+        counts = []
+        for (user_id, username), chats in ((self.few_user, 1), (self.many_user, MANY)):
+            queries, response = self.count({'type': 'get_chats', 'user_id': user_id, 'username': username})
+            self.assertEqual(len(response['chats']), chats)
+            self.assertTrue(all(len(chat['participants']) == 3 for chat in response['chats']))
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+        self.assertTrue(1 <= counts[1] <= 2, counts)
+
+    def test_get_messages_queries_do_not_grow_with_messages(self):
+        for cursor in ({}, {'after_id': 0}, {'before_id': 10 ** 9}):
+            counts = []
+            for chat_id, messages in ((self.few_chat, 1), (self.many_chat, MANY)):
+                queries, response = self.count(dict({'type': 'get_messages', 'chat_id': chat_id, 'limit': 100},
+                                                     **cursor))
+                self.assertEqual(len(response['messages']), messages)
+                self.assertTrue(all(message['username'] for message in response['messages']))
+                counts.append(queries)
+            self.assertEqual(counts[0], counts[1], cursor)
+            self.assertTrue(1 <= counts[1] <= 2, (cursor, counts))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Клиент после обрыва соединения входит заново: события и heartbeat
+продолжают работать.
+
+Запуск из корня проекта:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import queue
+import socket
+import threading
+import time
+import unittest
+
+import testenv  # noqa: F401  временная БД - до импорта модулей server
+from PyQt6.QtCore import Qt
+from client.communication import ClientCommunication
+from server.server import Server
+
+TIMEOUT = 5
+
+
+class ReconnectTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server('127.0.0.1', 0)
+        threading.Thread(target=cls.server.start, daemon=True).start()
+        cls.port = cls.server.server.getsockname()[1]
+
+    def connect(self, username):
+        comm = ClientCommunication('127.0.0.1', self.port)
+        self.addCleanup(comm.close_connection)
+        self.assertTrue(comm.connect_to_server())
+        comm.send_message({'type': 'register', 'username': username, 'password': 'secret'})
+        response = comm.send_message({'type': 'login', 'username': username, 'password': 'secret'})
+        self.assertEqual(response['status'], 'success', response)
+        return comm, response['user_id']
+
+    def test_pushes_and_heartbeat_work_after_reconnect(self):
+        comm, user_id = self.connect('reconnecting')
+        other, other_id = self.connect('other')
+        # Сигналы из потоков клиента - сразу в очередь, без цикла событий Qt
+        events = queue.Queue()
+        reconnected = threading.Event()
+        comm.message_received.connect(events.put, Qt.ConnectionType.DirectConnection)
+        comm.reconnected.connect(reconnected.set, Qt.ConnectionType.DirectConnection)
+        chat_id = other.send_message({'type': 'create_chat', 'user_id': other_id,
+                                      'participant_ids': [user_id, other_id]})['chat_id']
+        self.assertEqual(events.get(timeout=TIMEOUT)['event'], 'chat_created')
+
+        # Обрыв: сервер закрывает своё соединение, клиент узнаёт об этом при чтении
+        comm.socket.shutdown(socket.SHUT_RDWR)
+        deadline = time.monotonic() + TIMEOUT
+        while (comm.connected or self.server.clients.get(user_id)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(self.server.clients.get(user_id))
+
+        self.assertEqual(comm.send_message({'type': 'heartbeat', 'user_id': user_id})['status'], 'success')
+        self.assertTrue(reconnected.is_set())
+
+        other.send_message({'type': 'send_message', 'user_id': other_id, 'chat_id': chat_id, 'text': 'hi'})
+        event = events.get(timeout=TIMEOUT)
+        self.assertEqual(event['event'], 'new_message')
+        self.assertEqual(event['message']['text'], 'hi')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,16 @@
+"""Окружение тестов: временная БД вместо messenger.db.
+
+Тестовые модули импортируют этот модуль раньше модулей server:
+server.config читает MESSENGER_DATABASE_URL при импорте, а
+server.database сразу создаёт по нему движок.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+DATA_DIR = tempfile.mkdtemp(prefix='messenger-test-')
+os.environ['MESSENGER_DATABASE_URL'] = 'sqlite:///' + os.path.join(DATA_DIR, 'test.db')
+os.environ['MESSENGER_METRICS_PORT'] = '0'
+os.environ['MESSENGER_DB_MAINTENANCE_INTERVAL'] = '0'
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)